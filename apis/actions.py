@@ -1,127 +1,361 @@
-from apis import domain
-from apis import dns
-from apis import droplets
+from apis import catalog
+from apis import client
+from apis import registry
 from apis import state
-import sys
-import json
-
-def domain_handler(properties):
-    """
-    Passes the properties of domain to be created to a handler function in the domain module
-    """
-    return domain.create_handler(properties)
-    
-def dns_handler(properties):
-    """
-    Passes the properties of droplet to be created to a handler function in the droplet module
-    """
-    return dns.create_handler(properties)
-
-def droplet_handler(properties):
-    """
-    Passes the properties of dns record to be created to a handler function in the dns module
-    """
-    return droplets.create_handler(properties)
-
+from apis import scheduler
+from apis import planner
+from apis import inventory
+from apis import tracing
+from apis import validation
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+import os
 
 def resource_switcher(resource, properties):
     """
-    Calls the approriate handler function based on the resource type
+    Calls the create hook registered for the resource type
 
     Parameters:
         resource(str): Type of resource to be created
         properties(dict): Properties of the resource
     """
 
-    switcher = {
-        'DO_DOMAIN': domain_handler,
-        'DO_DNS_RECORD': dns_handler,
-        'DO_DROPLET': droplet_handler
-    }
+    return registry.create(resource, properties)
 
-    func = switcher.get(resource, 0)
-    if func == 0:
-        return {
-            'status': "FAILURE",
-            'error': f'No such resource: {resource}'
-        }
 
-    return func(properties)
+def use_async_engine(engine):
+    """
+    Returns True if the async engine was requested and can be used. Falls back to the synchronous engine otherwise
+    """
+
+    if engine != 'async':
+        return False
+
+    from apis import async_client
+    if not async_client.is_available():
+        print('The async engine requires aiohttp. Falling back to the sync engine')
+        return False
+
+    return True
 
 
-def create_resources(parsed_yaml_data):
+def create_resources(parsed_yaml_data, parallelism=1, engine='sync', incremental=False, targets=None, curr_state=None, remote_inventory=None):
     """
     Performs function calls to check, refresh and write the state before calling the appropriate handler functions 
-    to create the resource.
+    to create the resource. Actions are run in dependency order, with independent actions running in parallel.
 
     Parameters:
         parsed_yaml_data(dict): Data parsed from YAML file
+        parallelism(int): Maximum number of actions running at once
+        engine(str): 'sync' to run actions on a thread pool, 'async' to run them on an asyncio event loop
+        incremental(bool): Skip the actions that were applied with the same properties without calling the API,
+                           unless an action they depend on has changed. Drift is not detected for skipped actions
+        targets(array): Identifiers or glob patterns of the actions to apply, None to apply every action.
+                        The actions a target depends on are applied too
+        curr_state(State): State kept from an earlier run, None to load it
+        remote_inventory(Inventory): Inventory kept from an earlier run, None to list the remote resources again.
+                                     Its listings are fetched again for the actions that are compared
     """
 
-    curr_state = state.load_state()
+    # INFO Reads are only shared within a run, resources may have changed since the previous one
+    client.get_read_cache().clear()
 
-    if parsed_yaml_data.get('actions', 0) == 0:
+    if curr_state == None:
+        curr_state = state.State.load()
+
+    with tracing.span('validate', 'phase'):
+        errors = validation.validate(parsed_yaml_data, curr_state.remote_ids('DO_DOMAIN'))
+
+    if errors != []:
         print('Error with YAML specification')
-        print("actions attribute is required")
+        for error in errors:
+            print(error)
         return
 
-    for action in parsed_yaml_data['actions']:
+    graph = scheduler.build_graph(parsed_yaml_data['actions'])
 
-        # INFO Get attributes for each action
-        identifier = action.get('identifier', '')
-        properties = action.get('properties', {})
-
-        if identifier == '' or properties == {}:
-            print('Error with YAML specification')
-            print("identifier attribute is required")
+    if targets != None:
+        selected = [index for index, action in enumerate(parsed_yaml_data['actions']) if scheduler.matches_target(action['identifier'], targets)]
+        if selected == []:
+            print(f"No action matches {', '.join(targets)}")
             return
 
-        print(f'Starting Task: {identifier}\n\n')
+        closure = scheduler.dependency_closure(graph, selected)
+        print(f"Applying {len(closure)} of {len(parsed_yaml_data['actions'])} actions")
 
-        if state.check_state(curr_state, action['resource'], properties):
+        parsed_yaml_data = {'actions': [action for index, action in enumerate(parsed_yaml_data['actions']) if index in closure]}
+        graph = scheduler.build_graph(parsed_yaml_data['actions'])
 
-            # INFO Function to call the appropriate handler function based on the resource
-            created_resource = resource_switcher(action['resource'], properties)
+    # INFO Actions applied before with the same properties were accepted by Digital Ocean and are not checked again
+    with tracing.span('preflight', 'phase'):
+        errors = catalog.validate([action for action in parsed_yaml_data['actions'] if not curr_state.applied(action)], os.environ['DO_PAO'])
 
-            if created_resource['status']  == 'SUCCESS':
-                state_data = {}
-                state_data['identifier'] = identifier
-                state_data['resource'] = action['resource']
-                state_data['data'] = created_resource['data']
+    if errors != []:
+        print('Error with YAML specification')
+        for error in errors:
+            print(error)
+        return
 
-                curr_state = state.refresh_state(state_data, curr_state)
-                curr_state.append(state_data)
-            else:
-                print(created_resource)
+    if use_async_engine(engine):
+        import asyncio
+        from apis import async_engine
+        asyncio.run(async_engine.create_resources(parsed_yaml_data['actions'], parallelism, incremental, curr_state, remote_inventory))
+        return
+
+    tasks, task_graph = planner.plan(parsed_yaml_data['actions'], graph)
+
+    # INFO Actions applied or verified recently with the same properties are skipped without calling the API
+    trusted = set(action['identifier'] for action in parsed_yaml_data['actions'] if curr_state.trusted(action))
+    if incremental:
+        trusted |= curr_state.unchanged(parsed_yaml_data['actions'], graph)
+
+    compared = [action for action in parsed_yaml_data['actions'] if action['identifier'] not in trusted]
+
+    # INFO Load the remote resources once so that every action is compared against the same snapshot
+    if remote_inventory == None:
+        remote_inventory = inventory.Inventory(os.environ['DO_PAO'])
+    else:
+        remote_inventory.refresh(compared)
+
+    try:
+        with tracing.span('load inventory', 'phase'):
+            remote_inventory.load(compared)
+    except client.APIError as e:
+        # INFO Nothing has been changed yet, so the run ends before any action is compared against a partial listing
+        print(f'Could not list the existing resources: {e}')
+        return
+
+    state_lock = threading.Lock()
+
+    def needs_create(action):
+        print(f"Starting Task: {action['identifier']}\n\n")
+
+        if action['identifier'] in trusted:
+            print(f"\n Skipping Task: {action['identifier']}\n")
+            return False
+
+        # INFO Comparing can update an existing resource in place, which may fail
+        try:
+            with tracing.span('compare', 'phase', identifier=action['identifier']):
+                needed = curr_state.check(action['resource'], action['properties'], remote_inventory)
+        except Exception as e:
+            print(e)
+            print(f"\nFailed Task: {action['identifier']}\n")
+            return None
+
+        if not needed:
+            with state_lock:
+                curr_state.verified(action)
+            print(f"\n Skipping Task: {action['identifier']}\n")
+            return False
+
+        return True
+
+    def record_result(action, created_resource):
+        identifier = action['identifier']
+
+        if created_resource == None or created_resource['status'] != 'SUCCESS':
+            print(created_resource)
+            print(f'\nFailed Task: {identifier}\n')
+            return False
 
+        entry = state.StateEntry(identifier, action['resource'], created_resource['data'], scheduler.get_depends_on(action), state.fingerprint(action['properties']), time.time())
 
-            print(f'\nFinished Task: {identifier}\n')
+        with state_lock:
+            replaced = curr_state.replaced_by(entry)
+
+        # INFO Same as State.replace, with the deletes of replaced resources sent outside the lock so that other actions are not held up
+        for old_entry in replaced:
+            registry.refresh(old_entry.resource, old_entry.data)
+
+        with state_lock, tracing.span('state write', 'phase', identifier=identifier):
+            curr_state.swap(entry)
+
+        remote_inventory.add(action['resource'], created_resource.get('remote', created_resource['data']))
+
+        print(f'\nFinished Task: {identifier}\n')
+        return True
+
+    def run_zone(task):
+        dns = registry.get_provider('DO_DNS_RECORD')
+        domain_name = task[0]['properties'].get('domain')
+
+        valid = []
+        succeeded = True
+        for action in task:
+            print(f"Starting Task: {action['identifier']}\n\n")
+
+            if action['identifier'] in trusted:
+                print(f"\n Skipping Task: {action['identifier']}\n")
+                continue
+
+            with tracing.span('validate', 'phase', identifier=action['identifier']):
+                error = dns.validate_properties(action['properties'])
+            if error != None:
+                print(error)
+                print(f"\nFailed Task: {action['identifier']}\n")
+                succeeded = False
+            else:
+                valid.append(action)
+
+        with state_lock:
+            state_entries = {s.identifier: s for s in curr_state.records_for_domain(domain_name)}
+
+        with tracing.span('compare', 'phase', domain=domain_name, records=len(valid)):
+            changes = dns.plan_zone(domain_name, valid, state_entries, remote_inventory)
+        with tracing.span('create', 'phase', domain=domain_name, changes=len(changes)):
+            results = dns.apply_zone_changes(os.environ['DO_PAO'], domain_name, changes, parallelism)
+
+        changed = set()
+
+        # INFO Replaced records that were deleted are dropped from state before the new ones are recorded
+        for change, result in zip(changes, results):
+            if change['op'] == 'delete' and result != None and result['status'] == 'SUCCESS':
+                with state_lock:
+                    curr_state.remove(change['entry'])
+
+        for change, result in zip(changes, results):
+            identifier = change['action']['identifier']
+
+            if change['op'] == 'create':
+                changed.add(identifier)
+                succeeded = record_result(change['action'], result) and succeeded
+
+            if change['op'] == 'update':
+                changed.add(identifier)
+                if result['status'] == 'SUCCESS':
+                    with state_lock:
+                        curr_state.verified(change['action'])
+                    print('Updated the DNS Records')
+                    print(f'\nFinished Task: {identifier}\n')
+                else:
+                    print(result)
+                    print(f'\nFailed Task: {identifier}\n')
+                    succeeded = False
+
+        for action in valid:
+            if action['identifier'] not in changed:
+                with state_lock:
+                    curr_state.verified(action)
+                print(f"\n Skipping Task: {action['identifier']}\n")
+
+        return succeeded
+
+    def run_task(task):
+        if task[0]['resource'] == 'DO_DNS_RECORD':
+            return run_zone(task)
+
+        # INFO The actions of a batch are compared at the same time, so that the updates of existing droplets progress in parallel
+        if len(task) > 1 and parallelism > 1:
+            with ThreadPoolExecutor(max_workers=min(len(task), parallelism)) as executor:
+                checks = list(executor.map(needs_create, task))
         else:
-            print(f'\n Skipping Task: {identifier}\n')
+            checks = [needs_create(action) for action in task]
 
-    with open('tellurian.tlstate', 'w') as f:
-        json.dump(curr_state, f)
+        to_create = [action for action, needed in zip(task, checks) if needed]
+        failed = None in checks
 
+        if to_create == []:
+            return not failed
 
-def delete_resources():
+        if task[0]['resource'] != 'DO_DROPLET':
+            action = to_create[0]
+            # INFO Function to call the appropriate handler function based on the resource
+            with tracing.span('create', 'phase', identifier=action['identifier']):
+                created_resource = resource_switcher(action['resource'], action['properties'])
+            return record_result(action, created_resource) and not failed
+
+        # INFO Droplets are recorded as soon as the API accepts them, so an interrupted run cannot lose them
+        def record_pending(index, data):
+            with state_lock:
+                curr_state.add(state.StateEntry(to_create[index]['identifier'], 'DO_DROPLET', data))
+
+        with tracing.span('create', 'phase', identifiers=[action['identifier'] for action in to_create]):
+            created_resources = registry.get_provider('DO_DROPLET').create_batch_handler([action['properties'] for action in to_create], on_created=record_pending)
+
+        results = [record_result(action, created) for action, created in zip(to_create, created_resources)]
+        return all(results) and not failed
+
+    def traced_task(task):
+        with tracing.span(planner.task_name(task), 'action', resource=task[0]['resource']):
+            return run_task(task)
+
+    try:
+        scheduler.run(tasks, task_graph, traced_task, parallelism)
+    finally:
+        with state_lock:
+            curr_state.save()
+
+
+def delete_switcher(rsrc):
     """
-    Deletes the resources and clears the state file when the -d flag is set.
+    Calls the delete hook registered for the resource type of a state entry
     """
 
-    curr_state = state.load_state()
+    return registry.delete(rsrc.resource, rsrc.data)
+
+
+def delete_resources(parallelism=1, engine='sync', targets=None):
+    """
+    Deletes the resources in the current state when the -d flag is set. Entries are deleted in the reverse
+    order of their dependencies, with independent entries deleted in parallel. Each entry is removed from
+    the state file as soon as its delete is confirmed, so the state file only keeps what still exists.
+
+    Parameters:
+        parallelism(int): Maximum number of deletes running at once
+        engine(str): 'sync' to run deletes on a thread pool, 'async' to run them on an asyncio event loop
+        targets(array): Identifiers or glob patterns of the entries to delete, None to delete every entry.
+                        Entries depending on a target are deleted too
+    """
+
+    client.get_read_cache().clear()
+
+    if use_async_engine(engine):
+        import asyncio
+        from apis import async_engine
+        asyncio.run(async_engine.delete_resources(parallelism, targets))
+        return
+
+    curr_state = state.State.load()
+
+    entries, records_of_domain = scheduler.plan_deletes(curr_state, targets)
+
+    if targets != None and entries == []:
+        print(f"No state entry matches {', '.join(targets)}")
+        return
+
+    for records in records_of_domain.values():
+        for record in records:
+            print(f"Skipping Delete of record: {record.remote_id}")
+
+    try:
+        graph = scheduler.build_delete_graph(entries)
+    except ValueError as e:
+        print(e)
+        return
+
+    state_lock = threading.Lock()
+
+    def delete_entry(rsrc):
+        with tracing.span(rsrc.identifier, 'action', resource=rsrc.resource), tracing.span('delete', 'phase', identifier=rsrc.identifier):
+            result = delete_switcher(rsrc)
 
-    domains_in_state = [r['data']['domain']['name'] for r in curr_state if r['resource'] == 'DO_DOMAIN']
+        if result['status'] != 'SUCCESS':
+            return False
 
-    for rsrc in curr_state:
+        removed = [rsrc]
+        if rsrc.resource == 'DO_DOMAIN':
+            removed.extend(records_of_domain.get(rsrc.remote_id, []))
 
-        if rsrc['resource'] == 'DO_DOMAIN':
-            domain.delete_handler(rsrc['data'])
-            
-        if rsrc['resource'] == 'DO_DNS_RECORD':
-            dns.delete_handler(rsrc['data'], domains_in_state)
+        with state_lock:
+            for entry in removed:
+                curr_state.remove(entry)
 
-        if rsrc['resource'] == 'DO_DROPLET':
-            droplets.delete_handler(rsrc['data'])
+        return True
 
-    with open('tellurian.tlstate', 'w') as f:
-        f.write('')
\ No newline at end of file
+    try:
+        scheduler.run(entries, graph, delete_entry, parallelism)
+    finally:
+        with state_lock:
+            curr_state.save()
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import time
+from apis import client
+from apis import governor
+from apis import tracing
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# INFO Non-blocking counterpart of apis/client.py used by the async engine. It shares its settings
+
+_session = None
+
+
+def is_available():
+    """
+    Returns True if aiohttp is installed
+    """
+
+    return aiohttp != None
+
+
+async def open_session():
+    """
+    Opens the shared aiohttp session. Must be called from inside the running event loop
+    """
+    global _session
+
+    if _session == None:
+        connector = aiohttp.TCPConnector(limit=client.config['pool_size'])
+        timeout = aiohttp.ClientTimeout(total=client.config['timeout'])
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    return _session
+
+
+async def close_session():
+    global _session
+
+    if _session != None:
+        await _session.close()
+        _session = None
+
+
+async def request(method, path, auth_token, body=None, params=None, priority=None):
+    """
+    Sends a request to the Digital Ocean API without blocking the event loop. Requests are paced by the
+    same rate limit governor as the synchronous client
+
+    Parameters:
+        method(str): HTTP method
+        path(str): Path relative to the API root or an absolute url
+        auth_token(str): Personal Access Token
+        body(dict): JSON body of the request
+        params(dict): Query parameters
+        priority(int): One of the governor.PRIORITY_* values, defaults to one based on the method
+
+    Returns:
+        result(dict): Status code and decoded body of the response
+    """
+
+    session = await open_session()
+
+    if priority == None:
+        priority = client.default_priority(method)
+
+    attempt = 0
+    while True:
+        await governor.get_governor().acquire_async(priority)
+
+        start = time.perf_counter()
+        async with session.request(method, client.build_url(path), headers=client.build_headers(auth_token), json=body, params=params) as response:
+            content = await response.read()
+            if response.status == 204 or not content:
+                data = None
+            else:
+                # INFO Error pages of proxies in front of the API are not JSON, they are returned as text like droplets.response_data does
+                try:
+                    data = json.loads(content)
+                except ValueError:
+                    data = content.decode(errors='replace')
+
+            retry = governor.get_governor().update(response.status, response.headers)
+
+        if tracing.is_enabled():
+            tracing.record(f'{method} {tracing.endpoint(path)}', 'request', start, time.perf_counter(), {
+                'status': response.status,
+                'bytes_sent': len(json.dumps(body)) if body != None else 0,
+                'bytes_received': len(content),
+                'ratelimit_remaining': governor.get_governor().remaining,
+                'attempt': attempt
+            })
+
+        if not retry or attempt >= governor.config['max_retries']:
+            return {
+                'status': response.status,
+                'data': data
+            }
+
+        attempt += 1
+
+
+async def get(path, auth_token, params=None, priority=None, cache=True):
+    """
+    Sends a GET through the read cache of the run. See client.get
+    """
+
+    if not cache or not client.config['read_cache']:
+        return await request('GET', path, auth_token, params=params, priority=priority)
+
+    reads = client.get_read_cache()
+    key = client.read_key(path, params, auth_token, 'async')
+    result, future, owner = reads.claim(key, asyncio.get_running_loop().create_future)
+
+    if result != None:
+        return result
+
+    if owner:
+        try:
+            result = await request('GET', path, auth_token, params=params, priority=priority)
+        except Exception as e:
+            reads.complete(key, future, error=e)
+        else:
+            reads.complete(key, future, result, reusable=result['status'] == 200)
+
+    return await future
+
+
+async def mutate(method, path, auth_token, body=None):
+    """
+    Async version of client.mutate
+    """
+
+    try:
+        return await request(method, path, auth_token, body=body)
+    finally:
+        client.get_read_cache().invalidate(path)
+
+
+async def post(path, auth_token, body=None):
+    return await mutate('POST', path, auth_token, body=body)
+
+
+async def put(path, auth_token, body=None):
+    return await mutate('PUT', path, auth_token, body=body)
+
+
+async def delete(path, auth_token):
+    return await mutate('DELETE', path, auth_token)
+
+
+async def paginate(path, auth_token, key, params=None, per_page=client.MAX_PER_PAGE):
+    """
+    Iterates over every item of a paginated listing by following links.pages.next
+
+    Yields:
+        item(dict): Each item of the listing
+    """
+
+    query = dict(params or {})
+    query['per_page'] = per_page
+
+    url = path
+    while url != None:
+        result = await get(url, auth_token, params=query)
+        if result['status'] != 200:
+            raise client.APIError(result['status'], result['data'], url)
+
+        # INFO The next link already carries the query parameters
+        query = None
+        url = result['data'].get('links', {}).get('pages', {}).get('next')
+
+        for item in result['data'].get(key, []):
+            yield item
@@ -0,0 +1,552 @@
+import asyncio
+import os
+import time
+from apis import async_client
+from apis import client
+from apis import domain
+from apis import droplets
+from apis import dns
+from apis import governor
+from apis import inventory
+from apis import planner
+from apis import poller
+from apis import registry
+from apis import scheduler
+from apis import state
+from apis import tracing
+
+# INFO asyncio version of the create and delete pipelines. Every request goes through aiohttp, so a
+# single event loop can drive thousands of creates and polls. The plan, the inventory indexes and
+# the state format are shared with the synchronous path in apis/actions.py
+
+
+async def run_graph(nodes, graph, worker, parallelism):
+    """
+    Runs the worker coroutine on every node once all of its dependencies have succeeded.
+    At most `parallelism` workers run at once. Nodes depending on a failed node are skipped.
+
+    Returns:
+        results(dict): Maps the index of each node to 'SUCCESS', 'FAILURE' or 'SKIPPED'
+    """
+
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(max(1, parallelism))
+    finished = [loop.create_future() for node in nodes]
+    results = {}
+
+    async def run_node(index):
+        for dep in graph[index]:
+            if not await finished[dep]:
+                results[index] = 'SKIPPED'
+                finished[index].set_result(False)
+                return
+
+        async with limit:
+            try:
+                succeeded = await worker(nodes[index]) != False
+            except Exception as e:
+                print(e)
+                succeeded = False
+
+        results[index] = 'SUCCESS' if succeeded else 'FAILURE'
+        finished[index].set_result(succeeded)
+
+    await asyncio.gather(*(run_node(index) for index in range(len(nodes))))
+
+    return results
+
+
+async def wait_for_action(auth_token, action):
+    """
+    Polls an action with the same adaptive backoff and deadline as the threaded poller
+
+    Returns:
+        status(str): 'completed', 'errored' or 'in-progress' if the deadline was reached
+    """
+
+    href = action.get('href', f"/actions/{action['id']}")
+    interval = poller.config['initial_interval']
+    deadline = time.monotonic() + poller.config['deadline']
+
+    with tracing.span('poll', 'poll', action_id=action['id'], polls=0) as details:
+        while True:
+            await asyncio.sleep(min(interval, max(0, deadline - time.monotonic())))
+
+            result = await async_client.get(href, auth_token, priority=governor.PRIORITY_POLL, cache=False)
+            details['polls'] += 1
+            if result['status'] == 200 and result['data']['action']['status'] in ('completed', 'errored'):
+                client.invalidate_action(result['data']['action'])
+                details['status'] = result['data']['action']['status']
+                return details['status']
+
+            if time.monotonic() >= deadline:
+                details['status'] = 'timeout'
+                return 'in-progress'
+
+            interval = min(interval * poller.config['backoff'], poller.config['max_interval'])
+
+
+async def load_inventory(remote_inventory, actions):
+    """
+    Async version of Inventory.load
+    """
+
+    auth_token = remote_inventory.auth_token
+
+    droplets_missing, domains_missing, zones = remote_inventory.missing(actions)
+
+    if droplets_missing:
+        async for droplet in async_client.paginate('/droplets', auth_token, 'droplets'):
+            remote_inventory.add_droplet(droplet)
+        remote_inventory.loaded.add('DO_DROPLET')
+
+    if domains_missing:
+        async for existing_domain in async_client.paginate('/domains', auth_token, 'domains'):
+            remote_inventory.add_domain(existing_domain)
+        remote_inventory.loaded.add('DO_DOMAIN')
+
+    await asyncio.gather(*(load_zone(remote_inventory, zone) for zone in zones if zone in remote_inventory.domains))
+
+
+async def load_zone(remote_inventory, domain_name):
+    records = []
+    try:
+        async for record in async_client.paginate(f'/domains/{domain_name}/records', remote_inventory.auth_token, 'domain_records'):
+            records.append(record)
+    except client.APIError as e:
+        if e.status != 404:
+            raise
+
+    remote_inventory.add_zone(domain_name, records)
+
+
+async def create_domain(auth_token, properties):
+    """
+    Async version of domain.create_handler
+    """
+
+    error = domain.validate_properties(properties)
+    if error != None:
+        print(error)
+        return
+
+    body = {
+        'name': properties['name']
+    }
+    if properties.get('ip_address', None) != None:
+        body['ip_address'] = properties['ip_address']
+
+    result = await async_client.post('/domains', auth_token, body=body)
+
+    if result['status'] == 201:
+        return {
+            'status': 'SUCCESS',
+            'data': result['data']
+        }
+
+    return {
+        'status': 'FAILURE',
+        'error': result['data']
+    }
+
+
+async def create_droplets(auth_token, properties_list, on_created=None):
+    """
+    Async version of droplets.create_batch_handler
+
+    Returns:
+        states(array): Details of each droplet to store in state, in the same order as properties_list
+    """
+
+    for properties in properties_list:
+        error = droplets.validate_properties(properties)
+        if error != None:
+            print(error)
+            return [None for p in properties_list]
+
+    droplet_names = [p['name'] for p in properties_list]
+    batches = [droplet_names[start:start + droplets.MAX_BATCH_SIZE] for start in range(0, len(droplet_names), droplets.MAX_BATCH_SIZE)]
+
+    results = []
+    starts = range(0, len(droplet_names), droplets.MAX_BATCH_SIZE)
+    for batch_results in await asyncio.gather(*(create_droplet_batch(auth_token, batch, properties_list[0], on_created, start) for batch, start in zip(batches, starts))):
+        results.extend(batch_results)
+
+    return results
+
+
+async def create_droplet_batch(auth_token, droplet_names, properties, on_created=None, start=0):
+    result = await async_client.post('/droplets', auth_token, body=droplets.droplet_request_body(droplet_names, properties))
+
+    if result['status'] != 202:
+        return [{
+            'status': 'FAILURE',
+            'error': {
+                "error": "Bad properties for droplet. Please check the values of the properties in the docs",
+                "response": result['data']
+            }
+        } for name in droplet_names]
+
+    print('Creating Droplet' if len(droplet_names) == 1 else f'Creating {len(droplet_names)} Droplets')
+
+    if on_created != None:
+        for index, droplet in enumerate(result['data']['droplets']):
+            on_created(start + index, droplets.droplet_state_data(droplet))
+
+    async def finish(droplet, action):
+        try:
+            action_status = await wait_for_action(auth_token, action)
+        except Exception as e:
+            print(f"Could not follow the create of the droplet {droplet['name']}: {e}")
+            action_status = 'in-progress'
+        else:
+            if action_status == 'in-progress':
+                print(f"Timed out waiting for the droplet {droplet['name']} to become active")
+
+        if action_status == 'errored':
+            return {
+                'status': 'FAILURE',
+                'error': {
+                    "error": "Failed to create droplet"
+                }
+            }
+
+        droplet_properties = await async_client.get(f"/droplets/{droplet['id']}", auth_token)
+
+        # INFO The droplet stays in state with the details recorded by on_created, and is compared again on the next run
+        if droplet_properties['status'] != 200:
+            return {
+                'status': 'FAILURE',
+                'error': {
+                    "error": f"Could not read the droplet {droplet['name']} after creating it",
+                    "response": droplet_properties['data']
+                }
+            }
+
+        return {
+            'status': 'SUCCESS',
+            'data': droplets.droplet_state_data(droplet_properties['data']['droplet']),
+            'remote': droplet_properties['data']['droplet']
+        }
+
+    # INFO The API returns the droplets and their create actions in the order of the names
+    return await asyncio.gather(*(finish(droplet, action) for droplet, action in zip(result['data']['droplets'], result['data']['links']['actions'])))
+
+
+async def apply_zone_changes(auth_token, domain_name, changes, parallelism):
+    """
+    Async version of dns.apply_zone_changes
+    """
+
+    limit = asyncio.Semaphore(max(1, parallelism))
+
+    async def apply(change):
+        properties = change['action']['properties']
+
+        async with limit:
+            if change['op'] == 'create':
+                body = {'type': properties['type'], 'name': properties['name'], 'data': properties['data']}
+                result = await async_client.post(f'/domains/{domain_name}/records', auth_token, body=body)
+                if result['status'] == 201:
+                    result['data']['domain_name'] = domain_name
+                    return {'status': 'SUCCESS', 'data': result['data']}
+                return {'status': 'FAILURE', 'error': result['data']}
+
+            if change['op'] == 'update':
+                result = await async_client.put(f"/domains/{domain_name}/records/{change['record']['id']}", auth_token, body={'data': properties['data']})
+                if result['status'] == 200:
+                    return {'status': 'SUCCESS', 'data': result['data']}
+                return {'status': 'FAILURE', 'error': result['data']}
+
+            entry = change['entry']
+            result = await async_client.delete(f"/domains/{entry.data['domain_name']}/records/{entry.remote_id}", auth_token)
+            if result['status'] in (204, 404):
+                return {'status': 'SUCCESS'}
+            return {'status': 'FAILURE', 'error': result['data']}
+
+    results = [None] * len(changes)
+    writes = [i for i, change in enumerate(changes) if change['op'] != 'delete']
+
+    for i, result in zip(writes, await asyncio.gather(*(apply(changes[i]) for i in writes))):
+        results[i] = result
+
+    created = set(changes[i]['action']['identifier'] for i in writes if changes[i]['op'] == 'create' and results[i]['status'] == 'SUCCESS')
+    deletes = [i for i, change in enumerate(changes) if change['op'] == 'delete' and change['action']['identifier'] in created]
+
+    for i, result in zip(deletes, await asyncio.gather(*(apply(changes[i]) for i in deletes))):
+        results[i] = result
+
+    return results
+
+
+async def create_resources(actions, parallelism, incremental=False, curr_state=None, remote_inventory=None):
+    """
+    Async version of actions.create_resources. The actions are expected to have been checked already
+    """
+
+    auth_token = os.environ['DO_PAO']
+    loop = asyncio.get_running_loop()
+
+    if curr_state == None:
+        curr_state = state.State.load()
+
+    graph = scheduler.build_graph(actions)
+    tasks, task_graph = planner.plan(actions, graph)
+
+    trusted = set(action['identifier'] for action in actions if curr_state.trusted(action))
+    if incremental:
+        trusted |= curr_state.unchanged(actions, graph)
+
+    compared = [action for action in actions if action['identifier'] not in trusted]
+
+    if remote_inventory == None:
+        remote_inventory = inventory.Inventory(auth_token)
+    else:
+        remote_inventory.refresh(compared)
+
+    try:
+        with tracing.span('load inventory', 'phase'):
+            await load_inventory(remote_inventory, compared)
+    except client.APIError as e:
+        print(f'Could not list the existing resources: {e}')
+        return
+
+    async def needs_create(action):
+        print(f"Starting Task: {action['identifier']}\n\n")
+
+        if action['identifier'] in trusted:
+            print(f"\n Skipping Task: {action['identifier']}\n")
+            return False
+
+        # INFO Comparing a domain only reads the inventory. Updating an existing droplet and the compare hooks of
+        # other resource types use blocking requests, so they run in the default executor
+        try:
+            with tracing.span('compare', 'phase', identifier=action['identifier']):
+                if action['resource'] == 'DO_DOMAIN':
+                    needed = curr_state.check(action['resource'], action['properties'], remote_inventory)
+                else:
+                    needed = await loop.run_in_executor(None, curr_state.check, action['resource'], action['properties'], remote_inventory)
+        except Exception as e:
+            print(e)
+            print(f"\nFailed Task: {action['identifier']}\n")
+            return None
+
+        if not needed:
+            curr_state.verified(action)
+            print(f"\n Skipping Task: {action['identifier']}\n")
+
+        return needed
+
+    async def record_result(action, created_resource):
+        identifier = action['identifier']
+
+        if created_resource == None or created_resource['status'] != 'SUCCESS':
+            print(created_resource)
+            print(f'\nFailed Task: {identifier}\n')
+            return False
+
+        new_entry = state.StateEntry(identifier, action['resource'], created_resource['data'], scheduler.get_depends_on(action), state.fingerprint(action['properties']), time.time())
+
+        # INFO Same as State.replace, with the deletes of replaced resources sent through aiohttp
+        for entry in curr_state.replaced_by(new_entry):
+            await delete_entry(auth_token, entry)
+
+        with tracing.span('state write', 'phase', identifier=identifier):
+            curr_state.swap(new_entry)
+
+        remote_inventory.add(action['resource'], created_resource.get('remote', created_resource['data']))
+
+        print(f'\nFinished Task: {identifier}\n')
+        return True
+
+    async def run_zone(task):
+        domain_name = task[0]['properties'].get('domain')
+
+        valid = []
+        succeeded = True
+        for action in task:
+            print(f"Starting Task: {action['identifier']}\n\n")
+
+            if action['identifier'] in trusted:
+                print(f"\n Skipping Task: {action['identifier']}\n")
+                continue
+
+            with tracing.span('validate', 'phase', identifier=action['identifier']):
+                error = dns.validate_properties(action['properties'])
+            if error != None:
+                print(error)
+                print(f"\nFailed Task: {action['identifier']}\n")
+                succeeded = False
+            else:
+                valid.append(action)
+
+        if valid == []:
+            return succeeded
+
+        if domain_name not in remote_inventory.loaded_zones:
+            await load_zone(remote_inventory, domain_name)
+
+        state_entries = {s.identifier: s for s in curr_state.records_for_domain(domain_name)}
+
+        with tracing.span('compare', 'phase', domain=domain_name, records=len(valid)):
+            changes = dns.plan_zone(domain_name, valid, state_entries, remote_inventory)
+        with tracing.span('create', 'phase', domain=domain_name, changes=len(changes)):
+            results = await apply_zone_changes(auth_token, domain_name, changes, parallelism)
+
+        changed = set()
+
+        for change, result in zip(changes, results):
+            if change['op'] == 'delete' and result != None and result['status'] == 'SUCCESS':
+                curr_state.remove(change['entry'])
+
+        for change, result in zip(changes, results):
+            identifier = change['action']['identifier']
+
+            if change['op'] == 'create':
+                changed.add(identifier)
+                succeeded = await record_result(change['action'], result) and succeeded
+
+            if change['op'] == 'update':
+                changed.add(identifier)
+                if result['status'] == 'SUCCESS':
+                    curr_state.verified(change['action'])
+                    print('Updated the DNS Records')
+                    print(f'\nFinished Task: {identifier}\n')
+                else:
+                    print(result)
+                    print(f'\nFailed Task: {identifier}\n')
+                    succeeded = False
+
+        for action in valid:
+            if action['identifier'] not in changed:
+                curr_state.verified(action)
+                print(f"\n Skipping Task: {action['identifier']}\n")
+
+        return succeeded
+
+    async def run_task(task):
+        if task[0]['resource'] == 'DO_DNS_RECORD':
+            return await run_zone(task)
+
+        # INFO The actions of a batch are compared at the same time, so that the updates of existing droplets progress in parallel
+        checks = await asyncio.gather(*(needs_create(action) for action in task))
+
+        to_create = [action for action, needed in zip(task, checks) if needed]
+        failed = None in checks
+
+        if to_create == []:
+            return not failed
+
+        if task[0]['resource'] == 'DO_DROPLET':
+            # INFO Droplets are recorded as soon as the API accepts them, so an interrupted run cannot lose them
+            def record_pending(index, data):
+                curr_state.add(state.StateEntry(to_create[index]['identifier'], 'DO_DROPLET', data))
+
+            with tracing.span('create', 'phase', identifiers=[action['identifier'] for action in to_create]):
+                created_resources = await create_droplets(auth_token, [action['properties'] for action in to_create], on_created=record_pending)
+        elif task[0]['resource'] == 'DO_DOMAIN':
+            with tracing.span('create', 'phase', identifier=to_create[0]['identifier']):
+                created_resources = [await create_domain(auth_token, to_create[0]['properties'])]
+        else:
+            # INFO Resource types added with registry.register have no async version, so their create hook runs in the default executor
+            with tracing.span('create', 'phase', identifier=to_create[0]['identifier']):
+                created_resources = [await loop.run_in_executor(None, registry.create, to_create[0]['resource'], to_create[0]['properties'])]
+
+        results = [await record_result(action, created) for action, created in zip(to_create, created_resources)]
+        return all(results) and not failed
+
+    async def traced_task(task):
+        with tracing.span(planner.task_name(task), 'action', resource=task[0]['resource']):
+            return await run_task(task)
+
+    try:
+        await run_graph(tasks, task_graph, traced_task, parallelism)
+    finally:
+        curr_state.save()
+        await async_client.close_session()
+
+
+async def delete_entry(auth_token, rsrc):
+    """
+    Async version of actions.delete_switcher
+
+    Returns:
+        succeeded(bool): True if the resource was deleted or no longer exists
+    """
+
+    if rsrc.resource == 'DO_DOMAIN':
+        description = f"{rsrc.remote_id} deleted successfully"
+        path = f"/domains/{rsrc.remote_id}"
+    elif rsrc.resource == 'DO_DNS_RECORD':
+        description = f"The DNS record of id: {rsrc.remote_id} was deleted successfully"
+        path = f"/domains/{rsrc.data['domain_name']}/records/{rsrc.remote_id}"
+    elif rsrc.resource == 'DO_DROPLET':
+        description = f"Droplet with the id {rsrc.remote_id} was deleted successfully"
+        path = f"/droplets/{rsrc.remote_id}"
+    else:
+        # INFO Resource types added with registry.register use their delete hook in the default executor
+        result = await asyncio.get_running_loop().run_in_executor(None, registry.delete, rsrc.resource, rsrc.data)
+        if not registry.is_registered(rsrc.resource):
+            print(result)
+        return result['status'] == 'SUCCESS'
+
+    result = await async_client.delete(path, auth_token)
+
+    if result['status'] in (204, 404):
+        print({
+            'status': 'SUCCESS',
+            'data': description
+        })
+        return True
+
+    print({
+        'status': 'FAILURE',
+        'error': result['data']
+    })
+    return False
+
+
+async def delete_resources(parallelism, targets=None):
+    """
+    Async version of actions.delete_resources
+    """
+
+    auth_token = os.environ['DO_PAO']
+
+    curr_state = state.State.load()
+
+    entries, records_of_domain = scheduler.plan_deletes(curr_state, targets)
+
+    if targets != None and entries == []:
+        print(f"No state entry matches {', '.join(targets)}")
+        return
+
+    for records in records_of_domain.values():
+        for record in records:
+            print(f"Skipping Delete of record: {record.remote_id}")
+
+    try:
+        graph = scheduler.build_delete_graph(entries)
+    except ValueError as e:
+        print(e)
+        return
+
+    async def run_delete(rsrc):
+        with tracing.span(rsrc.identifier, 'action', resource=rsrc.resource), tracing.span('delete', 'phase', identifier=rsrc.identifier):
+            deleted = await delete_entry(auth_token, rsrc)
+
+        if not deleted:
+            return False
+
+        curr_state.remove(rsrc)
+        if rsrc.resource == 'DO_DOMAIN':
+            for record in records_of_domain.get(rsrc.remote_id, []):
+                curr_state.remove(record)
+
+        return True
+
+    try:
+        await run_graph(entries, graph, run_delete, parallelism)
+    finally:
+        curr_state.save()
+        await async_client.close_session()
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import time
+from apis import client
+from apis import registry
+
+# INFO Regions, sizes and images of the account, kept in cache_dir so that droplet specs can be checked before
+# anything is created. The catalog is fetched again once it is older than ttl seconds, when it was fetched with
+# another token, or when refresh is set. CATALOG_VERSION invalidates catalogs written by older versions
+
+CATALOG_VERSION = 1
+
+config = {
+    'cache_dir': '.tellurian-cache',
+    'ttl': 24 * 60 * 60,
+    'refresh': False
+}
+
+# INFO Catalog loaded by this process, so that runs repeated by --watch do not read cache_dir every time
+
+_loaded = None
+
+
+def configure(ttl=None, refresh=None, cache_dir=None):
+    """
+    Changes the settings of the catalog
+
+    Parameters:
+        ttl(float): Seconds during which a fetched catalog is used without calling the API
+        refresh(bool): Fetch the catalog on the next run even if it has not expired
+        cache_dir(str): Directory of the catalog file
+    """
+
+    if ttl != None:
+        config['ttl'] = ttl
+    if refresh != None:
+        config['refresh'] = refresh
+    if cache_dir != None:
+        config['cache_dir'] = cache_dir
+
+
+def catalog_path():
+    return os.path.join(config['cache_dir'], 'catalog.json')
+
+
+def account_key(auth_token):
+    # INFO Private images differ between accounts, so the catalog remembers which token it was fetched with
+    return hashlib.sha256(auth_token.encode()).hexdigest()[:16]
+
+
+def fetch(auth_token):
+    """
+    Fetches the regions, sizes and images of the account
+
+    Returns:
+        catalog(dict): {regions: {slug: {available, sizes}}, sizes: {slug: {available, regions}},
+                       images: {slug or id: {regions}}}
+    """
+
+    regions = {}
+    for region in client.paginate('/regions', auth_token, 'regions'):
+        regions[region['slug']] = {
+            'available': region.get('available', True),
+            'sizes': region.get('sizes', [])
+        }
+
+    sizes = {}
+    for size in client.paginate('/sizes', auth_token, 'sizes'):
+        sizes[size['slug']] = {
+            'available': size.get('available', True),
+            'regions': size.get('regions', [])
+        }
+
+    images = {}
+    for image in client.paginate('/images', auth_token, 'images'):
+        details = {'regions': image.get('regions', [])}
+        images[str(image['id'])] = details
+        if image.get('slug'):
+            images[image['slug']] = details
+
+    return {
+        'version': CATALOG_VERSION,
+        'account': account_key(auth_token),
+        'fetched_at': time.time(),
+        'regions': regions,
+        'sizes': sizes,
+        'images': images
+    }
+
+
+def read_catalog():
+    try:
+        with open(catalog_path()) as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(catalog, dict) or catalog.get('version') != CATALOG_VERSION:
+        return None
+
+    return catalog
+
+
+def write_catalog(catalog):
+    os.makedirs(config['cache_dir'], exist_ok=True)
+
+    path = catalog_path()
+    temp_file = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_file, 'w') as f:
+            json.dump(catalog, f)
+        os.replace(temp_file, path)
+    except OSError:
+        # INFO The catalog is fetched again on the next run if it cannot be written
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def load(auth_token):
+    """
+    Returns the catalog from cache_dir, fetching it if it is missing, expired or refresh is set. An expired
+    catalog is still used if it cannot be fetched
+
+    Returns:
+        catalog(dict): See fetch. None if there is no catalog and it cannot be fetched
+    """
+    global _loaded
+
+    cached = _loaded
+    if cached == None:
+        cached = read_catalog()
+
+    if cached != None and cached['account'] != account_key(auth_token):
+        cached = None
+
+    if cached != None and not config['refresh'] and time.time() - cached['fetched_at'] <= config['ttl']:
+        _loaded = cached
+        return cached
+
+    try:
+        catalog = fetch(auth_token)
+    except Exception as e:
+        if cached != None:
+            print(f'Could not refresh the region, size and image catalog, using the one from {time.ctime(cached["fetched_at"])}: {e}')
+            return cached
+
+        print(f'Could not fetch the region, size and image catalog, droplets are not checked before the run: {e}')
+        return None
+
+    write_catalog(catalog)
+    config['refresh'] = False
+    _loaded = catalog
+
+    return catalog
+
+
+def suggest(value, choices):
+    """
+    Returns ", did you mean x?" for the closest choice to a misspelled value, or an empty string
+    """
+
+    import difflib
+
+    matches = difflib.get_close_matches(str(value), list(choices), n=1)
+    if matches == []:
+        return ''
+
+    return f', did you mean {matches[0]}?'
+
+
+def validate(actions, auth_token):
+    """
+    Checks the actions against the catalog before anything is created. The catalog is only loaded
+    if a resource type of the actions checks its properties against it
+
+    Parameters:
+        actions(array): Actions of the spec
+        auth_token(str): Personal Access Token
+
+    Returns:
+        errors(array): One "identifier: problem" line for each action that would be rejected
+    """
+
+    checked = [action for action in actions if registry.has_preflight(action['resource'])]
+    if checked == []:
+        return []
+
+    catalog = load(auth_token)
+    if catalog == None:
+        return []
+
+    errors = []
+    for action in checked:
+        error = registry.preflight(action['resource'], action['properties'], catalog)
+        if error != None:
+            errors.append(f"{action['identifier']}: {error}")
+
+    return errors
@@ -0,0 +1,401 @@
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from apis import governor
+from apis import tracing
+
+BASE_URL = "https://api.digitalocean.com/v2"
+
+MAX_PER_PAGE = 200
+
+# INFO Defaults for the shared session. They can be changed with configure() before the first request
+
+config = {
+    'base_url': BASE_URL,
+    'pool_size': 20,
+    'timeout': 30,
+    'read_cache': True
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class APIError(Exception):
+    """
+    Raised when a page of a listing cannot be fetched
+    """
+
+    def __init__(self, status, data, url=''):
+        self.status = status
+        self.data = data
+        super().__init__(f'{url} returned {status}: {data}')
+
+    @classmethod
+    def from_response(cls, response):
+        try:
+            data = response.json()
+        except ValueError:
+            data = response.text
+        return cls(response.status_code, data, response.url)
+
+
+class ReadCache:
+    """
+    Shares GET responses within a run. A GET sent while an identical one is in flight waits for that
+    response instead of sending its own, and successful responses are reused until a POST, PUT or
+    DELETE is sent to the same resource path or one of its parents or children
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.inflight = {}
+        self.hits = 0
+
+    def claim(self, key, new_future):
+        """
+        Looks up a read
+
+        Parameters:
+            key(tuple): Key built by read_key
+            new_future(callable): Creates the future that other callers wait on
+
+        Returns:
+            response: Reusable response, None if there is none
+            future(Future): Future that resolves to the response of the in-flight request
+            owner(bool): True if the caller has to send the request and complete the future
+        """
+
+        with self.lock:
+            if key in self.responses:
+                self.hits += 1
+                return self.responses[key], None, False
+
+            future = self.inflight.get(key)
+            if future != None:
+                self.hits += 1
+                return None, future, False
+
+            future = self.inflight[key] = new_future()
+            return None, future, True
+
+    def complete(self, key, future, response=None, error=None, reusable=False):
+        """
+        Hands the outcome of a claimed read to every caller waiting on its future
+        """
+
+        with self.lock:
+            # INFO A read that was invalidated while in flight may have seen the old state, so it is not kept
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+                if reusable and error == None:
+                    self.responses[key] = response
+
+        if error != None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+    def invalidate(self, path):
+        """
+        Forgets the reads of a path, its parents and its children, e.g. a POST to /droplets/1/actions
+        invalidates /droplets and /droplets/1
+        """
+
+        path = urllib.parse.urlsplit(build_url(path)).path
+
+        with self.lock:
+            for entries in (self.responses, self.inflight):
+                for key in [key for key in entries if related_paths(key[0], path)]:
+                    del entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.responses.clear()
+            self.inflight.clear()
+            self.hits = 0
+
+
+_reads = ReadCache()
+
+
+def related_paths(first, second):
+    return first == second or first.startswith(second + '/') or second.startswith(first + '/')
+
+
+def read_key(path, params, auth_token, kind):
+    """
+    Builds the key of a GET. The query of absolute urls, such as the next links of listings, is
+    merged with params so that the same page is always the same key
+
+    Parameters:
+        kind(str): 'sync' or 'async', as the two clients return different response objects
+    """
+
+    url = urllib.parse.urlsplit(build_url(path))
+    query = urllib.parse.parse_qsl(url.query) + [(name, str(value)) for name, value in (params or {}).items()]
+
+    return url.path, tuple(sorted(query)), auth_token, kind
+
+
+def get_read_cache():
+    return _reads
+
+
+def invalidate_action(action):
+    """
+    Forgets the reads of the resource of a finished action, since the action changed it without
+    a request of this run
+    """
+
+    if action.get('resource_type') and action.get('resource_id') != None:
+        _reads.invalidate(f"/{action['resource_type']}s/{action['resource_id']}")
+
+
+def configure(pool_size=None, timeout=None, base_url=None, read_cache=None):
+    """
+    Changes the settings of the shared client. The pooled session is rebuilt on the next request
+
+    Parameters:
+        pool_size(int): Maximum number of keep-alive connections kept open to the API
+        timeout(int): Default timeout in seconds for every request
+        base_url(str): Root url of the Digital Ocean API
+        read_cache(bool): Share identical GETs within a run
+    """
+    global _session
+
+    if pool_size != None:
+        config['pool_size'] = pool_size
+    if timeout != None:
+        config['timeout'] = timeout
+    if base_url != None:
+        config['base_url'] = base_url.rstrip('/')
+    if read_cache != None:
+        config['read_cache'] = read_cache
+
+    _reads.clear()
+
+    with _session_lock:
+        if _session != None:
+            _session.close()
+        _session = None
+
+
+def get_session():
+    """
+    Returns the shared keep-alive session, creating it on first use
+
+    Returns:
+        session(requests.Session): Pooled session used for every API call
+    """
+    global _session
+
+    if _session == None:
+        with _session_lock:
+            if _session == None:
+                # INFO requests is the slowest import of the application and is only loaded once a request is made
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=config['pool_size'], pool_maxsize=config['pool_size'])
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+
+    return _session
+
+
+def build_url(path):
+    """
+    Builds the full url for an API path. Absolute urls such as action hrefs are returned unchanged
+
+    Parameters:
+        path(str): Path relative to the API root, e.g. /droplets
+    """
+
+    if path.startswith('http://') or path.startswith('https://'):
+        return path
+
+    return config['base_url'] + path
+
+
+def build_headers(auth_token):
+    """
+    Builds the headers required by every Digital Ocean API call
+
+    Parameters:
+        auth_token(str): Personal Access Token
+    """
+
+    return {
+        "Authorization": "Bearer {}".format(auth_token),
+        "Content-Type": "application/json"
+    }
+
+
+def default_priority(method):
+    """
+    Reads are held back before creates, updates and deletes when the rate limit budget runs low
+    """
+
+    if method == 'GET':
+        return governor.PRIORITY_READ
+
+    return governor.PRIORITY_MUTATE
+
+
+def request(method, path, auth_token, body=None, params=None, timeout=None, priority=None):
+    """
+    Sends a request to the Digital Ocean API over the shared session. Every request is paced by the
+    rate limit governor, and requests rejected with a 429 are sent again after their Retry-After
+
+    Parameters:
+        method(str): HTTP method
+        path(str): Path relative to the API root or an absolute url
+        auth_token(str): Personal Access Token
+        body(dict): JSON body of the request
+        params(dict): Query parameters
+        timeout(int): Overrides the default timeout
+        priority(int): One of the governor.PRIORITY_* values, defaults to one based on the method
+
+    Returns:
+        response(requests.Response): Response returned by the API
+    """
+
+    if timeout == None:
+        timeout = config['timeout']
+
+    if priority == None:
+        priority = default_priority(method)
+
+    attempt = 0
+    while True:
+        governor.get_governor().acquire(priority)
+
+        start = time.perf_counter()
+        response = get_session().request(
+            method,
+            build_url(path),
+            headers=build_headers(auth_token),
+            json=body,
+            params=params,
+            timeout=timeout
+        )
+
+        retry = governor.get_governor().update(response.status_code, response.headers)
+
+        if tracing.is_enabled():
+            tracing.record(f'{method} {tracing.endpoint(path)}', 'request', start, time.perf_counter(), {
+                'status': response.status_code,
+                'bytes_sent': len(response.request.body or b''),
+                'bytes_received': len(response.content),
+                'ratelimit_remaining': governor.get_governor().remaining,
+                'attempt': attempt
+            })
+        if not retry or attempt >= governor.config['max_retries']:
+            return response
+
+        attempt += 1
+
+
+def get(path, auth_token, params=None, priority=None, cache=True):
+    """
+    Sends a GET through the read cache of the run
+
+    Parameters:
+        cache(bool): False for reads that must see changes made outside this run, such as action polls
+    """
+
+    if not cache or not config['read_cache']:
+        return request('GET', path, auth_token, params=params, priority=priority)
+
+    key = read_key(path, params, auth_token, 'sync')
+    response, future, owner = _reads.claim(key, Future)
+
+    if response != None:
+        return response
+
+    if owner:
+        try:
+            response = request('GET', path, auth_token, params=params, priority=priority)
+        except Exception as e:
+            _reads.complete(key, future, error=e)
+        else:
+            _reads.complete(key, future, response, reusable=response.status_code == 200)
+
+    return future.result()
+
+
+def mutate(method, path, auth_token, body=None):
+    """
+    Sends a POST, PUT or DELETE and forgets the cached reads it may have changed. The reads are
+    forgotten even if the request failed, as it may still have reached the API
+    """
+
+    try:
+        return request(method, path, auth_token, body=body)
+    finally:
+        _reads.invalidate(path)
+
+
+def post(path, auth_token, body=None):
+    return mutate('POST', path, auth_token, body=body)
+
+
+def put(path, auth_token, body=None):
+    return mutate('PUT', path, auth_token, body=body)
+
+
+def delete(path, auth_token):
+    return mutate('DELETE', path, auth_token)
+
+
+def paginate(path, auth_token, key, params=None, per_page=MAX_PER_PAGE, prefetch=False):
+    """
+    Iterates over every item of a paginated listing by following links.pages.next
+
+    Parameters:
+        path(str): Path of the listing, e.g. /droplets
+        auth_token(str): Personal Access Token
+        key(str): Key of the items in the response body, e.g. droplets
+        params(dict): Extra query parameters
+        per_page(int): Number of items requested per page
+        prefetch(bool): Fetch the next page in the background while the current one is consumed
+
+    Yields:
+        item(dict): Each item of the listing
+    """
+
+    query = dict(params or {})
+    query['per_page'] = per_page
+
+    def fetch(url, query):
+        response = get(url, auth_token, params=query)
+        if response.status_code != 200:
+            raise APIError.from_response(response)
+
+        data = response.json()
+        next_url = data.get('links', {}).get('pages', {}).get('next')
+        return data.get(key, []), next_url
+
+    if not prefetch:
+        url = path
+        while url != None:
+            items, url = fetch(url, query)
+            # INFO The next link already carries the query parameters
+            query = None
+            yield from items
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        items, url = fetch(path, query)
+        while True:
+            upcoming = executor.submit(fetch, url, None) if url != None else None
+            yield from items
+            if upcoming == None:
+                return
+            items, url = upcoming.result()
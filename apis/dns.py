@@ -1,27 +1,20 @@
-import requests
-import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from apis import client
+
+PROPERTIES = ('domain', 'type', 'name', 'data')
 
 def create_new_dns_record(auth_token, domain_name, record_type, record_name, record_data):
     """
     Creates a new dns record for the given domain
     """
-    url = f"https://api.digitalocean.com/v2/domains/{domain_name}/records"
-
     params = {
         "type": record_type,
         "name": record_name,
         "data": record_data,
     }
 
-    request_body = json.dumps(params)
-
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
-
-    response = requests.post(url, data=request_body, headers=headers)
+    response = client.post(f"/domains/{domain_name}/records", auth_token, body=params)
 
     return {
         'status': response.status_code,
@@ -38,37 +31,52 @@ def list_existing_records(auth_token, domain_name, record_type, record_name):
     else:
         full_domain = f'{record_name}.{domain_name}'
 
-    url = f"https://api.digitalocean.com/v2/domains/{domain_name}/records?type={record_type}&name={full_domain}"
+    return list_records(auth_token, domain_name, {'type': record_type, 'name': full_domain})
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
+def iter_records(auth_token, domain_name, query=None, prefetch=True):
+    """
+    Iterates over the dns records of a domain, one page at a time
 
-    response = requests.get(url, headers=headers)
+    Parameters:
+        auth_token(str): Personal Access Token
+        domain_name(str): Name of the domain
+        query(dict): Optional filters such as type and name
+        prefetch(bool): Fetch the next page while the current one is consumed
+    """
 
-    return {
-        'status': response.status_code,
-        'data': response.json()
-    }
+    return client.paginate(f"/domains/{domain_name}/records", auth_token, 'domain_records', params=query, prefetch=prefetch)
 
-def update_existing_record(auth_token, domain_name, record_id, record_data):
+def list_records(auth_token, domain_name, query=None):
     """
-    Update an existing record with new record data
+    Lists all the dns records of a domain
     """
 
-    url = f"https://api.digitalocean.com/v2/domains/{domain_name}/records{record_id}"
+    try:
+        return {
+            'status': 200,
+            'data': {'domain_records': list(iter_records(auth_token, domain_name, query))}
+        }
+    except client.APIError as e:
+        return {
+            'status': e.status,
+            'data': e.data
+        }
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
+def update_existing_record(auth_token, domain_name, record_id, record_data):
+    """
+    Update an existing record with new record data
+    """
 
     body = {
         'data': record_data
     }
 
-    response = requests.put(url, data=json.dumps(body), headers=headers)
+    response = client.put(f"/domains/{domain_name}/records/{record_id}", auth_token, body=body)
+
+    return {
+        'status': response.status_code,
+        'data': response.json()
+    }
 
 
 def delete_existing_record(auth_token, domain_name, record_id):
@@ -76,14 +84,7 @@ def delete_existing_record(auth_token, domain_name, record_id):
     Delete a dns record using its ID
     """
 
-    url = f"https://api.digitalocean.com/v2/domains/{domain_name}/records/{record_id}"
-
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
-
-    response = requests.delete(url, headers=headers)
+    response = client.delete(f"/domains/{domain_name}/records/{record_id}", auth_token)
 
     if response.status_code == 204:
         return {
@@ -95,6 +96,28 @@ def delete_existing_record(auth_token, domain_name, record_id):
         'data': response.json()
     }
 
+def validate_properties(properties):
+    """
+    Checks that a DNS record has all the required properties and a supported type
+
+    Returns:
+        error(str): Description of the first problem found, None if the properties are valid
+    """
+
+    if properties.get('domain', -1) == -1:
+        return 'Domain Name is required'
+    if properties.get('type', -1) == -1:
+        return 'Please specify the type of record'
+    if properties.get('data', -1) == -1:
+        return 'Please specify the appropriate data for the record type'
+    if properties.get('name', -1) == -1:
+        return 'Please specify a name for the record'
+
+    if properties['type'] not in ['A', 'AAAA', 'CNAME']:
+        return 'Only A, AAAA and CNAME records can be created'
+
+    return None
+
 def create_handler(properties):
     """
     Handler function for creating a DNS record
@@ -108,28 +131,15 @@ def create_handler(properties):
 
     auth_token = os.environ['DO_PAO']
 
-    domain_name = properties.get('domain', -1)
-    record_type = properties.get('type', -1)
-    record_data = properties.get('data', -1)
-    record_name = properties.get('name', -1)
-
-
-    if domain_name == -1:
-        print('Domain Name is required')
-        return
-    if record_type == -1:
-        print('Please specify the type of record')
-        return
-    if record_data == -1:
-        print('Please specify the appropriate data for the record type')
-        return
-    if record_name == -1:
-        print('Please specify a name for the record')
+    error = validate_properties(properties)
+    if error != None:
+        print(error)
         return
 
-    if record_type not in ['A', 'AAAA', 'CNAME']:
-        print('Only A, AAAA and CNAME records can be created')
-        return
+    domain_name = properties['domain']
+    record_type = properties['type']
+    record_data = properties['data']
+    record_name = properties['name']
 
     result = create_new_dns_record(auth_token, domain_name, record_type, record_name, record_data)
 
@@ -145,7 +155,7 @@ def create_handler(properties):
             'error': result['data']
         }
 
-def delete_handler(properties, domains_in_state):
+def delete_handler(properties, domains_in_state=None):
     """
     Handler Function to delete the dns records in the current state
     If the domain is being deleted, then no need to delete individual records
@@ -153,44 +163,214 @@ def delete_handler(properties, domains_in_state):
     Parameters:
         properties(dict): Properties of the DNS record
         domains_in_state(array): An array of already existing domains in state
+
+    Returns:
+        result(dict): SUCCESS if the record was deleted or no longer exists
     """
 
     record_id = properties['domain_record']['id']
 
-    if properties['domain_name'] in domains_in_state:
+    if domains_in_state != None and properties['domain_name'] in domains_in_state:
         print(f"Skipping Delete of record: {record_id}" )
-    else:
-        auth_token = os.environ['DO_PAO']
+        return {
+            'status': 'SUCCESS',
+            'data': f'The DNS record of id: {record_id} is deleted with its domain'
+        }
+
+    auth_token = os.environ['DO_PAO']
+
+    result = delete_existing_record(auth_token, properties['domain_name'], record_id)
 
-        result = delete_existing_record(auth_token, properties['domain_name'], record_id)
+    if result['status'] in (204, 404):
+        result = {
+            'status': 'SUCCESS',
+            'data': f'The DNS record of id: {record_id} was deleted successfully'
+        }
+    else:
+        result = {
+            'status': 'FAILURE',
+            'error': result['data']
+        }
 
-        if result['status'] == 204:
-            print ({
-                'status': 'SUCCESS',
-                'data': f'The DNS record of id: {record_id} was deleted successfully'
-            })
-        else:
-            print ({
-                'status': 'FAILURE',
-                'error': result['data']
-            })
+    print(result)
+    return result
 
-def compare_domains(properties, existing_record_ids):
+def compare_domains(properties, existing_record_ids, inventory):
     """
     Checks whether a dns record already exists in the Digital Ocean System
     """
 
     auth_token = os.environ['DO_PAO']
 
-    existing_records = list_existing_records(auth_token, properties['domain'], properties['type'], properties['name'])
+    record = inventory.get_records(properties['domain'], properties['type'], properties['name'])
+
+    if len(record) > 0:
+        if record[0]['data'] != properties['data']:
+            update_existing_record(auth_token, properties['domain'], record[0]['id'], properties['data'])
+            print('Updated the DNS Records')
+        return True
+
+    return False
+
+
+def compare_handler(properties, existing_ids, inventory):
+    """
+    Compare hook of DO_DNS_RECORD
+    """
+
+    return compare_domains(properties, existing_ids, inventory)
+
+
+def state_id(data):
+    """
+    Returns the id of the record of a state entry
+    """
+
+    return data['domain_record']['id']
+
+
+def adopt_handler(properties, inventory):
+    """
+    Import hook of DO_DNS_RECORD. Matches an existing record by domain, type and name, preferring one
+    with the same data. Otherwise a single record is adopted and updated by the next apply
+
+    Returns:
+        data(dict): Details of the record to store in state, None if there is no such record
+        error(str): Why the record cannot be adopted, e.g. several records have its name. None otherwise
+    """
+
+    domain_name = properties['domain']
+    if inventory.get_domain(domain_name) == None:
+        return None, None
+
+    records = inventory.get_records(domain_name, properties['type'], properties['name'])
+
+    same_data = [record for record in records if record['data'] == properties['data']]
+    if same_data != []:
+        records = same_data
+    if len(records) > 1:
+        return None, f"{len(records)} {properties['type']} records are named {properties['name']} in {domain_name}"
+    if records == []:
+        return None, None
+
+    return {'domain_record': records[0], 'domain_name': domain_name}, None
+
+
+def plan_zone(domain_name, actions, state_entries, inventory):
+    """
+    Computes the changes needed to bring the records of a domain in line with the DO_DNS_RECORD actions.
+    The domain's records are read from the inventory, so no request is made per record.
+
+    A name can hold several A or AAAA records, so each action only changes the record recorded in its
+    state entry. An action without one takes a record that already has its data, or a record of its type
+    and name that no action owns or matches. Otherwise a new record is created, and records owned or
+    matched by other actions are never changed
+
+    Parameters:
+        domain_name(str): Name of the domain
+        actions(array): DO_DNS_RECORD actions of the domain
+        state_entries(dict): DO_DNS_RECORD StateEntry objects of the domain by identifier
+        inventory(Inventory): Snapshot of the remote resources
+
+    Returns:
+        changes(array): Changes of the form {'op': 'create' | 'update' | 'delete', ...}.
+                        Actions whose record already exists with the same data need no change
+    """
+
+    taken = set(entry.remote_id for entry in state_entries.values())
+
+    planned = []
+    for action in actions:
+        properties = action['properties']
+        records = inventory.get_records(domain_name, properties['type'], properties['name'])
+
+        old_entry = state_entries.get(action['identifier'])
+        owned = [record for record in records if old_entry != None and record['id'] == old_entry.remote_id]
+
+        planned.append((action, records, old_entry, owned[0] if owned != [] else None))
+
+    # INFO Records that already have the data of an action without a record are kept for it
+    matched = {}
+    for action, records, old_entry, owned in planned:
+        if owned != None:
+            continue
+        for record in records:
+            if record['data'] == action['properties']['data'] and record['id'] not in taken:
+                taken.add(record['id'])
+                matched[action['identifier']] = record
+                break
+
+    changes = []
+    replaced = []
+
+    for action, records, old_entry, owned in planned:
+        if owned == None and action['identifier'] in matched:
+            continue
+
+        if owned == None:
+            free = [record for record in records if record['id'] not in taken]
+            if free != []:
+                owned = free[0]
+                taken.add(owned['id'])
+
+        if owned != None:
+            if owned['data'] != action['properties']['data']:
+                changes.append({'op': 'update', 'action': action, 'record': owned})
+            continue
+
+        changes.append({'op': 'create', 'action': action})
+
+        # INFO A record created earlier under the same identifier is replaced by the new one
+        if old_entry != None:
+            replaced.append({'op': 'delete', 'action': action, 'entry': old_entry})
+
+    return changes + replaced
+
+
+def apply_zone_changes(auth_token, domain_name, changes, parallelism=8):
+    """
+    Applies the changes returned by plan_zone using at most `parallelism` requests at once.
+    Creates and updates are applied first. A replaced record is only deleted once its replacement has been created.
+
+    Returns:
+        results(array): The handler style result of each change, in the same order as changes.
+                        Deletes whose replacement failed are not applied and have no result
+    """
+
+    def apply(change):
+        properties = change['action']['properties']
+
+        if change['op'] == 'create':
+            result = create_new_dns_record(auth_token, domain_name, properties['type'], properties['name'], properties['data'])
+            if result['status'] == 201:
+                result['data']['domain_name'] = domain_name
+                return {'status': 'SUCCESS', 'data': result['data']}
+            return {'status': 'FAILURE', 'error': result['data']}
+
+        if change['op'] == 'update':
+            result = update_existing_record(auth_token, domain_name, change['record']['id'], properties['data'])
+            if result['status'] == 200:
+                return {'status': 'SUCCESS', 'data': result['data']}
+            return {'status': 'FAILURE', 'error': result['data']}
+
+        entry = change['entry']
+        result = delete_existing_record(auth_token, entry.data['domain_name'], entry.remote_id)
+        # INFO A record that is already gone does not need to be deleted
+        if result['status'] in (204, 404):
+            return {'status': 'SUCCESS'}
+        return {'status': 'FAILURE', 'error': result['data']}
+
+    results = [None] * len(changes)
+    writes = [i for i, change in enumerate(changes) if change['op'] != 'delete']
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        for i, result in zip(writes, executor.map(apply, [changes[i] for i in writes])):
+            results[i] = result
 
-    if existing_records['status'] == 200:
-        record = existing_records['data']['domain_records']
+        created = set(changes[i]['action']['identifier'] for i in writes if changes[i]['op'] == 'create' and results[i]['status'] == 'SUCCESS')
+        deletes = [i for i, change in enumerate(changes) if change['op'] == 'delete' and change['action']['identifier'] in created]
 
-        if len(record) > 0:
-            if record[0]['data'] != properties['data']:
-                update_existing_record(auth_token, properties['domain'], properties['type'], properties['data'])
-                print('Updated the DNS Records')
-            return True
+        for i, result in zip(deletes, executor.map(apply, [changes[i] for i in deletes])):
+            results[i] = result
 
-    return False
\ No newline at end of file
+    return results
@@ -1,6 +1,7 @@
-import requests
 import os
-import json
+from apis import client
+
+PROPERTIES = ('name', 'ip_address')
 
 
 def create_new_domain(auth_token, domain_name, ip_address):
@@ -8,23 +9,14 @@ def create_new_domain(auth_token, domain_name, ip_address):
     Creates a new domain using the Digital Ocean API
     """
 
-    url = "https://api.digitalocean.com/v2/domains"
-
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    } 
-
     params = {
         "name": domain_name,
     }
 
-    request_body = json.dumps(params)
-
     if ip_address != None:
         params["ip_address"] = ip_address
 
-    response = requests.post(url, headers=headers, data=request_body)
+    response = client.post("/domains", auth_token, body=params)
 
     return {
         'status': response.status_code,
@@ -36,15 +28,8 @@ def delete_existing_domain(auth_token, domain_name):
     """
     Deletes an existing domain based on the name
     """
-    
-    url = f"https://api.digitalocean.com/v2/domains/{domain_name}"
-
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
 
-    response = requests.delete(url, headers=headers)
+    response = client.delete(f"/domains/{domain_name}", auth_token)
 
     if response.status_code == 204:
         return {
@@ -58,28 +43,50 @@ def delete_existing_domain(auth_token, domain_name):
 
 # INFO List all existing domains or list a specific domain
 
+def iter_domains(auth_token, prefetch=True):
+    """
+    Iterates over every domain of the account, one page at a time
+    """
+
+    return client.paginate("/domains", auth_token, 'domains', prefetch=prefetch)
+
 def list_domains(auth_token, domain_name):
     """
     List all existing domains or list a specific domain
     """
-    
-    if domain_name != '':
-        url = f"https://api.digitalocean.com/v2/domains/{domain_name}"
-    else:
-        url = f"https://api.digitalocean.com/v2/domains"
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
+    if domain_name == '':
+        try:
+            return {
+                'status': 200,
+                'data': {'domains': list(iter_domains(auth_token))}
+            }
+        except client.APIError as e:
+            return {
+                'status': e.status,
+                'data': e.data
+            }
 
-    response = requests.get(url, headers=headers)
+    response = client.get(f"/domains/{domain_name}", auth_token)
 
     return {
         'status': response.status_code,
         'data': response.json()
     }
 
+def validate_properties(properties):
+    """
+    Checks that a domain has all the required properties
+
+    Returns:
+        error(str): Description of the first problem found, None if the properties are valid
+    """
+
+    if properties.get('name', -1) == -1:
+        return 'Domain name is required'
+
+    return None
+
 def create_handler(properties):
     """
     Handler function for creating a new Domain
@@ -92,14 +99,15 @@ def create_handler(properties):
     """
     
     auth_token = os.environ['DO_PAO']
-    
-    domain_name = properties.get('name', -1)
-    ip_address = properties.get('ip_address', None)
 
-    if domain_name == -1:
-        print('Domain name is required')
+    error = validate_properties(properties)
+    if error != None:
+        print(error)
         return
 
+    domain_name = properties['name']
+    ip_address = properties.get('ip_address', None)
+
     result = create_new_domain(auth_token, domain_name, ip_address)
 
     if result['status'] == 201:
@@ -119,6 +127,9 @@ def delete_handler(properties):
 
     Parameters:
         properties(dict): Properties of the DNS domain
+
+    Returns:
+        result(dict): SUCCESS if the domain was deleted or no longer exists
     """
 
     auth_token = os.environ['DO_PAO']
@@ -127,27 +138,58 @@ def delete_handler(properties):
 
     result = delete_existing_domain(auth_token, domain_name)
 
-    if result['status'] == 204:
-        print({
+    if result['status'] in (204, 404):
+        result = {
             'status': 'SUCCESS',
             'data': f'{domain_name} deleted successfully'
-        })
+        }
     else:
-        print({
+        result = {
             'status': 'FAILURE',
             'error': result['data']
-        })
+        }
+
+    print(result)
+    return result
 
-def compare_domains(properties):
+def compare_domains(properties, inventory):
     """
     Checks whether a domain already exists in the Digital Ocean System
     """
 
-    auth_token = os.environ['DO_PAO']
-
-    existing_domains = list_domains(auth_token, properties['name'])
-
-    if existing_domains['status'] == 200:
+    if inventory.get_domain(properties['name']) != None:
         return True
 
     return False
+
+
+def compare_handler(properties, existing_ids, inventory):
+    """
+    Compare hook of DO_DOMAIN. Domains are matched by name whether or not they are in state
+    """
+
+    return compare_domains(properties, inventory)
+
+
+def state_id(data):
+    """
+    Returns the name of the domain of a state entry
+    """
+
+    return data['domain']['name']
+
+
+def adopt_handler(properties, inventory):
+    """
+    Import hook of DO_DOMAIN. Matches an existing domain by name
+
+    Returns:
+        data(dict): Details of the domain to store in state, None if the domain does not exist
+        error(str): Always None, domain names are unique
+    """
+
+    existing_domain = inventory.get_domain(properties['name'])
+    if existing_domain == None:
+        return None, None
+
+    return {'domain': existing_domain}, None
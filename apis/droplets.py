@@ -1,103 +1,140 @@
-import requests
+import contextlib
 import os
-import json
-import time
+from apis import client
+from apis import poller
+from apis import rollout
+from apis import tracing
+from apis.catalog import suggest
 
 
-def create_new_droplet(auth_token, droplet_name, region, size, image, ssh_keys, backups, ipv6, vpc_uuid, user_data, monitoring, volumes, tags):
-    """
-    Creates a new droplet in Digital Ocean
-    """
-    
-    url = "https://api.digitalocean.com/v2/droplets"
+MAX_BATCH_SIZE = 10
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json"
-    }
+PROPERTIES = ('name', 'region', 'size', 'image', 'ssh_keys', 'backups', 'ipv6', 'vpc_uuid', 'user_data', 'monitoring', 'volumes', 'tags')
 
-    params = {
-        "name": droplet_name,
-        "region": region,
-        "size": size,
-        "image": image,
-        "ssh_keys": ssh_keys,
-        "backups": backups,
-        "ipv6": ipv6,
-        "user_data": user_data,
-        "monitoring": monitoring,
-        "volumes": volumes,
-        "tags": tags
-    }
+STEP_DESCRIPTIONS = {
+    'power_off': 'Power off of droplet',
+    'resize': 'Resize of droplet',
+    'rebuild': 'Rebuild of droplet',
+    'enable_ipv6': 'Enabling ipv6 of droplet',
+    'power_on': 'Power on of droplet'
+}
 
-    request_body = json.dumps(params)
 
-    if vpc_uuid != '':
-        params['vpc_uuid'] = vpc_uuid
+class UpdateError(Exception):
+    """
+    Raised when an existing droplet could not be brought to its properties
+    """
 
-    response = requests.post(url, data=request_body, headers=headers)
 
-    json_data = response.json()
+def create_new_droplets(auth_token, params, on_created=None):
+    """
+    Creates up to ten droplets sharing the same properties with a single request and waits for all of them.
+    If given, on_created is called with the position and state details of each droplet as soon as the API
+    has accepted it, before it becomes active
+
+    Parameters:
+        auth_token(str): Personal Access Token
+        params(dict): Body of the request, built by droplet_request_body
+        on_created(function): Called with the position in params['names'] and the state details of each droplet
 
-    if response.status_code == 202:
+    Returns:
+        results(array): One result for each name, in the same order as params['names']
+    """
 
-        action_links = json_data['links']
+    droplet_names = params['names']
 
-        create_action_url = action_links['actions'][0]['href']
+    response = client.post("/droplets", auth_token, body=params)
 
-        action_status = None
+    if response.status_code != 202:
+        return [{
+            'status': response.status_code,
+            'data': {
+                "error": "Bad properties for droplet. Please check the values of the properties in the docs",
+                "response": response_data(response)
+            }
+        } for name in droplet_names]
 
-        timer = 0
-        print('Creating Droplet')
-        while True:
+    json_data = response.json()
 
-            time.sleep(10)
-            timer += 10
+    print('Creating Droplet' if len(droplet_names) == 1 else f'Creating {len(droplet_names)} Droplets')
+
+    if on_created != None:
+        for index, droplet in enumerate(json_data['droplets']):
+            on_created(index, droplet_state_data(droplet))
+
+    # INFO The API returns the droplets and their create actions in the order of the names
+    futures = [poller.watch(auth_token, action) for action in json_data['links']['actions']]
+
+    results = []
+    for droplet, future in zip(json_data['droplets'], futures):
+        try:
+            action_status = future.result()['status']
+        except poller.PollTimeout:
+            # INFO The droplet exists even if it is not active yet, so it is still returned to be recorded in state
+            print(f"Timed out waiting for the droplet {droplet['name']} to become active")
+            action_status = 'in-progress'
+        except Exception as e:
+            print(f"Could not follow the create of the droplet {droplet['name']}: {e}")
+            action_status = 'in-progress'
+
+        if action_status == 'errored':
+            results.append({
+                'status': action_status,
+                'data': {
+                    "error": "Failed to create droplet"
+                }
+            })
+            continue
+
+        droplet_properties = list_droplets(auth_token, droplet_id=droplet['id'])
+
+        # INFO The droplet stays in state with the details recorded by on_created, and is compared again on the next run
+        if droplet_properties['status'] != 200:
+            results.append({
+                'status': droplet_properties['status'],
+                'data': {
+                    "error": f"Could not read the droplet {droplet['name']} after creating it",
+                    "response": droplet_properties['data']
+                }
+            })
+            continue
 
-            action_response = requests.get(create_action_url, headers=headers)
+        results.append({
+            'status': action_status,
+            'data': droplet_state_data(droplet_properties['data']['droplet']),
+            'remote': droplet_properties['data']['droplet']
+        })
 
-            json_action_response = action_response.json()
+    return results
 
-            action_status = json_action_response['action']['status']
 
+def droplet_state_data(droplet):
+    """
+    Extracts the details of a droplet that are stored in state
+    """
 
-            if action_status == 'completed':
-                droplet_properties = list_droplets(auth_token, droplet_id=json_action_response['action']['resource_id'])
+    public_ip_address = None
+    for network in droplet['networks']['v4']:
+        if network['type'] == 'public':
+            public_ip_address = network['ip_address']
 
-                return {
-                    'status': action_status,
-                    'data': {
-                        'id': droplet_properties['data']['droplet']['id'],
-                        'name': droplet_properties['data']['droplet']['name'],
-                        'image': droplet_properties['data']['droplet']['image']['slug'],
-                        'size': droplet_properties['data']['droplet']['size']['slug'],
-                        'public_ip_address': droplet_properties['data']['droplet']['networks']['v4'][1]['ip_address'],
-                        'region': droplet_properties['data']['droplet']['region']['slug'],
-                        'tags': droplet_properties['data']['droplet']['tags']
-                    }
-                }
+    return {
+        'id': droplet['id'],
+        'name': droplet['name'],
+        'image': droplet['image']['slug'],
+        'size': droplet['size']['slug'],
+        'public_ip_address': public_ip_address,
+        'region': droplet['region']['slug'],
+        'tags': droplet['tags']
+    }
 
-            if action_status == 'errored':
-                return {
-                    'status': action_status,
-                    'data': {
-                        "error": "Failed to create droplet"
-                    }
-                }
 
-            if timer > 120:
-                print('Timed Out')
-                break
+def iter_droplets(auth_token, prefetch=True):
+    """
+    Iterates over every droplet of the account, one page at a time
+    """
 
-            print('Still Creating... ' + str(timer) + 'secs')
-    else:
-        return {
-            'status': 400,
-            'data': {
-                "error": "Bad properties for droplet. Please check the values of the properties in the docs",
-                "response": response.json()
-            }
-        }
+    return client.paginate("/droplets", auth_token, 'droplets', prefetch=prefetch)
 
 
 def list_droplets(auth_token, droplet_id=None):
@@ -105,38 +142,42 @@ def list_droplets(auth_token, droplet_id=None):
     Lists all the droplets or droplets of a specific ID
     """
 
-    if droplet_id != None:
-        url = f"https://api.digitalocean.com/v2/droplets/{droplet_id}"
-    else:
-        url = "https://api.digitalocean.com/v2/droplets"
-
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
+    if droplet_id == None:
+        try:
+            return {
+                'status': 200,
+                'data': {'droplets': list(iter_droplets(auth_token))}
+            }
+        except client.APIError as e:
+            return {
+                'status': e.status,
+                'data': e.data
+            }
 
-    response = requests.get(url, headers=headers)
+    response = client.get(f"/droplets/{droplet_id}", auth_token)
 
     return {
         'status': response.status_code,
-        'data': response.json()
+        'data': response_data(response)
     }
 
-def delete_droplet(auth_token, droplet_id):
+
+def response_data(response):
     """
-    Delete a droplet with a given ID
+    Returns the JSON body of a response, or its text if an error page is not JSON
     """
 
-    url = "https://api.digitalocean.com/v2/droplets"
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
-
-    url = url + f"/{droplet_id}"
+def delete_droplet(auth_token, droplet_id):
+    """
+    Delete a droplet with a given ID
+    """
 
-    response = requests.delete(url, headers=headers)
+    response = client.delete(f"/droplets/{droplet_id}", auth_token)
 
     if response.status_code == 204:
         return {
@@ -148,82 +189,150 @@ def delete_droplet(auth_token, droplet_id):
         'data': response.json()
     }
 
-def update_droplet_image(auth_token, droplet_id, image):
+def start_droplet_action(auth_token, droplet_id, body, started, failed):
     """
-    Rebuild a droplet with the given image
+    Starts an action such as a resize on a droplet
+
+    Parameters:
+        body(dict): Body of the action, with its type
+        started(str): Message printed when the API accepts the action
+        failed(str): Message printed when the API rejects it
+
+    Returns:
+        future(Future): Resolves to the finished action, None if the action was rejected
     """
 
-    url = f"https://api.digitalocean.com/v2/droplets/{droplet_id}/actions"
+    response = client.post(f"/droplets/{droplet_id}/actions", auth_token, body=body)
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
+    json_data = response.json()
 
-    body = {
-        'type': 'rebuild',
-        'image': image
-    }
+    if response.status_code == 201 and json_data['action']['status'] != 'errored':
+        print(started)
+        return poller.watch(auth_token, json_data['action'])
 
-    response = requests.post(url, headers=headers, data=json.dumps(body))
+    print(failed)
 
-    json_data = response.json()
+def update_droplet_image(auth_token, droplet_id, image):
+    """
+    Rebuild a droplet with the given image
+    """
 
-    if json_data['action']['status'] != 'errored':
-        print('Updated Image Successfully')
-    else:
-        print('Update for Droplet Image Failed')
+    return start_droplet_action(auth_token, droplet_id, {'type': 'rebuild', 'image': image}, 'Started Droplet Image Update', 'Update for Droplet Image Failed')
 
 def update_droplet_ipv6(auth_token, droplet_id):
     """
     Enable ipv6 for a droplet if it is disabled
     """
 
-    url = f"https://api.digitalocean.com/v2/droplets/{droplet_id}/actions"
+    return start_droplet_action(auth_token, droplet_id, {'type': 'enable_ipv6'}, 'Started Enabling ipv6', "ipv6 couldn't be enabled")
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
+def update_droplet_size(auth_token, droplet_id, size):
+    """
+    Resize the droplet. The droplet has to be powered off
+    """
 
-    body = {
-        'type': 'enable_ipv6',
-    }
+    return start_droplet_action(auth_token, droplet_id, {'type': 'resize', 'size': size}, 'Started Droplet Resize', 'Update for Droplet Size Failed')
 
-    response = requests.post(url, headers=headers, data=json.dumps(body))
+def power_off_droplet(auth_token, droplet_id):
+    """
+    Power off a running droplet
+    """
 
-    json_data = response.json()
+    return start_droplet_action(auth_token, droplet_id, {'type': 'power_off'}, 'Started Powering off Droplet', "Droplet couldn't be powered off")
 
-    if json_data['action']['status'] != 'errored':
-        print('Enabled ipv6 successfully')
-    else:
-        print("ipv6 couldn't be enabled")
+def power_on_droplet(auth_token, droplet_id):
+    """
+    Power on a droplet that is off
+    """
 
-def update_droplet_size(auth_token, droplet_id, size):
+    return start_droplet_action(auth_token, droplet_id, {'type': 'power_on'}, 'Started Powering on Droplet', "Droplet couldn't be powered on")
+
+
+def validate_properties(properties):
     """
-    Resize the droplet
+    Checks that a droplet has all the required properties
+
+    Returns:
+        error(str): Description of the first problem found, None if the properties are valid
     """
 
-    url = f"https://api.digitalocean.com/v2/droplets/{droplet_id}/actions"
+    if properties.get('name', -1) == -1:
+        return 'Droplet name is required'
+    if properties.get('region', -1) == -1:
+        return 'Droplet region is required'
+    if properties.get('size', -1) == -1:
+        return 'Droplet size is required'
+    if properties.get('image', -1) == -1:
+        return 'Droplet image is required'
 
-    headers = {
-        "Authorization": "Bearer {}".format(auth_token),
-        "Content-Type": "application/json" 
-    }
+    return None
 
-    body = {
-        'type': 'resize',
-        'size': size
-    }
 
-    response = requests.post(url, headers=headers, data=json.dumps(body))
+def preflight_handler(properties, catalog):
+    """
+    Checks the region, size and image of a droplet against the catalog of the account
 
-    json_data = response.json()
+    Parameters:
+        properties(dict): Properties of the droplet
+        catalog(dict): Catalog returned by catalog.load
 
-    if json_data['action']['status'] != 'errored':
-        print('Updated Droplet Size Successfully')
-    else:
-        print('Update for Droplet Size Failed')
+    Returns:
+        error(str): Description of the first problem found, None if the droplet can be created
+    """
+
+    error = validate_properties(properties)
+    if error != None:
+        return error
+
+    region = properties['region']
+    size = properties['size']
+    image = str(properties['image'])
+
+    if region not in catalog['regions']:
+        return f"Unknown region {region}{suggest(region, catalog['regions'])}"
+    if not catalog['regions'][region]['available']:
+        return f'Region {region} does not accept new droplets'
+
+    if size not in catalog['sizes']:
+        return f"Unknown size {size}{suggest(size, catalog['sizes'])}"
+    if not catalog['sizes'][size]['available']:
+        return f'Size {size} is no longer available'
+    if size not in catalog['regions'][region]['sizes']:
+        return f'Size {size} is not available in {region}'
+
+    if image not in catalog['images']:
+        return f"Unknown image {image}{suggest(image, catalog['images'])}"
+
+    image_regions = catalog['images'][image]['regions']
+    if image_regions != [] and region not in image_regions:
+        return f"Image {image} is not available in {region}, only in {', '.join(image_regions)}"
+
+    return None
+
+
+def droplet_request_body(droplet_names, properties):
+    """
+    Builds the body of a request creating droplets with the given names, filling in the default of every optional property
+    """
+
+    params = {
+        "names": droplet_names,
+        "region": properties['region'],
+        "size": properties['size'],
+        "image": properties['image'],
+        "ssh_keys": properties.get('ssh_keys', []),
+        "backups": properties.get('backups', False),
+        "ipv6": properties.get('ipv6', False),
+        "user_data": properties.get('user_data', None),
+        "monitoring": properties.get('monitoring', False),
+        "volumes": properties.get('volumes', None),
+        "tags": properties.get('tags', [])
+    }
+
+    if properties.get('vpc_uuid', '') != '':
+        params['vpc_uuid'] = properties['vpc_uuid']
+
+    return params
 
 
 def create_handler(properties):
@@ -237,54 +346,66 @@ def create_handler(properties):
         state(dict): Details of the droplet to store in state if create is sucessful 
     """
 
+    return create_batch_handler([properties])[0]
+
+
+def create_batch_handler(properties_list, on_created=None):
+    """
+    Handler function for creating droplets whose properties only differ by name.
+    The droplets are created in batches of up to ten per request
+
+    Parameters:
+        properties_list(array): The properties of each droplet
+        on_created(function): Called with the position in properties_list and the state details of each
+                              droplet as soon as it has been accepted by the API
+
+    Returns:
+        states(array): Details of each droplet to store in state, in the same order as properties_list
+    """
+
     auth_token = os.environ['DO_PAO']
-    
-
-    droplet_name = properties.get('name', -1)
-    region = properties.get('region', -1)
-    size = properties.get('size', -1)
-    image = properties.get('image', -1)
-    ssh_keys = properties.get('ssh_keys', [])
-    backups = properties.get('backups', False)
-    ipv6 = properties.get('ipv6', False)
-    user_data = properties.get('user_data', None)
-    vpc_uuid = properties.get('vpc_uuid', '')
-    monitoring = properties.get('monitoring', False)
-    volumes = properties.get('volumes', None)
-    tags = properties.get('tags', [])
-
-    if droplet_name == -1:
-        print('Droplet name is required')
-        return
-    if region == -1:
-        print('Droplet region is required')
-        return
-    if size == -1:
-        print('Droplet size is required')
-        return
-    if image == -1:
-        print('Droplet image is required')
-        return
-
-    result = create_new_droplet(auth_token, droplet_name, region, size, image, ssh_keys, backups, ipv6, vpc_uuid, user_data, monitoring, volumes, tags)
-
-    if result['status'] == 'completed':
-        return {
-            'status': 'SUCCESS',
-            'data': result['data']
-        }
-    else:
-        return {
-            'status': 'FAILURE',
-            'error': result['data']
-        }
+
+    for properties in properties_list:
+        error = validate_properties(properties)
+        if error != None:
+            print(error)
+            return [None for p in properties_list]
+
+    droplet_names = [p['name'] for p in properties_list]
+
+    results = []
+    for start in range(0, len(droplet_names), MAX_BATCH_SIZE):
+        batch = droplet_names[start:start + MAX_BATCH_SIZE]
+        batch_created = None
+        if on_created != None:
+            batch_created = lambda index, data, start=start: on_created(start + index, data)
+        results.extend(create_new_droplets(auth_token, droplet_request_body(batch, properties_list[0]), on_created=batch_created))
+
+    handler_results = []
+    for result in results:
+        if result['status'] in ('completed', 'in-progress'):
+            handler_results.append({
+                'status': 'SUCCESS',
+                'data': result['data'],
+                'remote': result['remote']
+            })
+        else:
+            handler_results.append({
+                'status': 'FAILURE',
+                'error': result['data']
+            })
+
+    return handler_results
 
 def delete_handler(properties):
     """
     Handler Function to delete the droplet
 
     Parameters:
-        properties(dict): Properties of the DNS record
+        properties(dict): Properties of the droplet
+
+    Returns:
+        result(dict): SUCCESS if the droplet was deleted or no longer exists
     """
 
     auth_token = os.environ['DO_PAO']
@@ -293,50 +414,158 @@ def delete_handler(properties):
 
     result = delete_droplet(auth_token, droplet_id)
 
-    if result['status'] == 204:
-        print({
+    if result['status'] in (204, 404):
+        result = {
             'status': 'SUCCESS',
             'data': f'Droplet with the id {droplet_id} was deleted successfully'
-        })
+        }
     else:
-        print({
+        result = {
             'status': 'FAILURE',
             'error': result['data']
-        })
+        }
 
-def compare_droplets(properties, existing_droplet_ids):
+    print(result)
+    return result
+
+def compare_droplets(properties, existing_droplet_ids, inventory):
     """
     Checks whether a droplet already exists in the Digital Ocean System
     """
 
     auth_token = os.environ['DO_PAO']
 
-    existing_droplets = list_droplets(auth_token)
-
-    for droplet in existing_droplets['data']['droplets']:
-        if droplet['name'] == properties['name'] and droplet['id'] in existing_droplet_ids:
+    for droplet in inventory.get_droplets(properties['name']):
+        if droplet['id'] in existing_droplet_ids:
             if not update_droplet_properties(auth_token, droplet, properties):
                 return True
 
     return False
 
 
-def update_droplet_properties(auth_token, droplet, properties):
+def compare_handler(properties, existing_ids, inventory):
     """
-    Compares the properties of the droplet namely image, size and region
+    Compare hook of DO_DROPLET
     """
 
-    if droplet['region']['slug'] != properties['region']:
-        return True
+    return compare_droplets(properties, existing_ids, inventory)
+
+
+def state_id(data):
+    """
+    Returns the id of the droplet of a state entry
+    """
+
+    return data['id']
+
+
+def adopt_handler(properties, inventory):
+    """
+    Import hook of DO_DROPLET. Matches an existing droplet by name
+
+    Returns:
+        data(dict): Details of the droplet to store in state, None if there is no droplet with the name
+        error(str): Why the droplet cannot be adopted, None otherwise
+    """
+
+    existing = inventory.get_droplets(properties['name'])
+    if len(existing) > 1:
+        return None, f"{len(existing)} droplets are named {properties['name']}"
+    if existing == []:
+        return None, None
+
+    return droplet_state_data(existing[0]), None
+
+
+def plan_updates(droplet, properties):
+    """
+    Lists the actions that bring an existing droplet to its properties, in the order they have to run.
+    A resize only works on a droplet that is off, so a running droplet is powered off before and
+    powered on again after the other updates
+
+    Returns:
+        steps(array): Names of the actions, e.g. ['power_off', 'resize', 'power_on']
+    """
 
+    steps = []
+
+    resize = droplet['size']['slug'] != properties['size']
+    power_cycle = resize and droplet.get('status', 'active') == 'active'
+
+    if power_cycle:
+        steps.append('power_off')
+    if resize:
+        steps.append('resize')
     if droplet['image']['slug'] != properties['image']:
-        update_droplet_image(auth_token, droplet['id'], properties['image'])
+        steps.append('rebuild')
+    if droplet['networks']['v6'] == [] and properties.get('ipv6', False) == True:
+        steps.append('enable_ipv6')
+    if power_cycle:
+        steps.append('power_on')
+
+    return steps
 
-    if droplet['size']['slug'] != properties['size']:
-        update_droplet_size(auth_token, droplet['id'], properties['size'])
 
-    ipv6 = properties.get('ipv6', False)
-    if droplet['networks']['v6'] == [] and ipv6 == True:
-        update_droplet_ipv6(auth_token, droplet['id'])
+def is_powered_off(auth_token, droplet_id):
+    response = client.get(f"/droplets/{droplet_id}", auth_token)
+    return response.status_code == 200 and response.json()['droplet']['status'] == 'off'
+
+
+def apply_updates(auth_token, droplet, properties, steps):
+    """
+    Runs the steps of plan_updates one after the other, each one waiting for the previous action to
+    finish. Steps other than enabling ipv6 take the droplet down, so at most config['max_disrupted']
+    droplets run them at the same time. If a step fails, a droplet that was powered off is powered on again
 
-    return False
\ No newline at end of file
+    Raises:
+        UpdateError: If a step is rejected, fails or times out
+    """
+
+    disruptive = any(step != 'enable_ipv6' for step in steps)
+    powered_off = False
+
+    with (rollout.disruption_slot() if disruptive else contextlib.nullcontext()):
+        with tracing.span('update', 'phase', droplet=droplet['name'], steps=steps):
+            for step in steps:
+                if step == 'power_off':
+                    future = power_off_droplet(auth_token, droplet['id'])
+                if step == 'resize':
+                    future = update_droplet_size(auth_token, droplet['id'], properties['size'])
+                if step == 'rebuild':
+                    future = update_droplet_image(auth_token, droplet['id'], properties['image'])
+                if step == 'enable_ipv6':
+                    future = update_droplet_ipv6(auth_token, droplet['id'])
+                if step == 'power_on':
+                    # INFO A rebuild boots the droplet, in which case it is already on
+                    if not is_powered_off(auth_token, droplet['id']):
+                        continue
+                    future = power_on_droplet(auth_token, droplet['id'])
+
+                if future == None or poller.wait(future, f"{STEP_DESCRIPTIONS[step]} {droplet['name']}") == None:
+                    if powered_off and step != 'power_on':
+                        future = power_on_droplet(auth_token, droplet['id'])
+                        if future != None:
+                            poller.wait(future, f"{STEP_DESCRIPTIONS['power_on']} {droplet['name']}")
+                    raise UpdateError(f"{STEP_DESCRIPTIONS[step]} {droplet['name']} failed, the droplet was not updated further")
+
+                if step == 'power_off':
+                    powered_off = True
+
+
+def update_droplet_properties(auth_token, droplet, properties):
+    """
+    Compares the properties of the droplet namely image, size and region, and updates the droplet
+    in place if only its image, size or ipv6 differ
+
+    Returns:
+        replace(bool): True if the droplet is in another region and a new droplet has to be created
+    """
+
+    if droplet['region']['slug'] != properties['region']:
+        return True
+
+    steps = plan_updates(droplet, properties)
+    if steps != []:
+        apply_updates(auth_token, droplet, properties, steps)
+
+    return False
@@ -0,0 +1,217 @@
+import threading
+import time
+from apis import tracing
+
+# INFO Request priorities. When the remaining rate limit budget is low, lower priorities are held back first
+
+PRIORITY_MUTATE = 0
+PRIORITY_READ = 1
+PRIORITY_POLL = 2
+
+# INFO Share of the rate limit kept in reserve for higher priorities. When less than 20% is left, polls are held
+# back for up to reserve_wait seconds each, so they slow down instead of stopping until the limit resets
+
+RESERVE = {
+    PRIORITY_MUTATE: 0,
+    PRIORITY_READ: 0.1,
+    PRIORITY_POLL: 0.2
+}
+
+config = {
+    'requests_per_minute': 250,
+    'max_retries': 5,
+    'default_retry_after': 10,
+    'reserve_wait': 15
+}
+
+
+class Governor:
+    """
+    Token bucket shared by every request to the Digital Ocean API.
+
+    The bucket refills at the per-minute limit of the API. The ratelimit-remaining and ratelimit-reset
+    headers of each response are used to hold back low priority requests when the budget runs low,
+    and a 429 blocks every request until its Retry-After has passed. Requests waiting for a token
+    are served by priority, so a mutation is not starved by a queue of polls.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = config['requests_per_minute'] / 60
+        self.capacity = config['requests_per_minute']
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.blocked_until = 0
+        self.waiting = {priority: 0 for priority in RESERVE}
+
+    def reserve(self, priority, waited=0):
+        """
+        Takes a token for a request if one is available
+
+        Parameters:
+            priority(int): One of the PRIORITY_* values
+            waited(float): Seconds the request has already waited
+
+        Returns:
+            wait(float): 0 if the request can be sent, otherwise the number of seconds to wait before trying again
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            wall_now = time.time()
+
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+
+            if now < self.blocked_until:
+                return self.blocked_until - now
+
+            if self.reset_at != None and wall_now >= self.reset_at:
+                self.remaining = None
+                self.reset_at = None
+
+            # INFO The budget is only enforced until the reset time announced by the API
+            if self.limit != None and self.remaining != None and self.reset_at != None and waited < config['reserve_wait']:
+                if self.remaining <= self.limit * RESERVE[priority]:
+                    return min(max(self.reset_at - wall_now, 0.1), 1)
+
+            # INFO Waiting requests of a higher priority get the next tokens
+            ahead = sum(count for other, count in self.waiting.items() if other < priority)
+            if self.tokens < 1 + ahead:
+                return (1 + ahead - self.tokens) / self.rate
+
+            self.tokens -= 1
+            if self.remaining != None:
+                self.remaining -= 1
+
+            return 0
+
+    def set_waiting(self, priority, change):
+        with self.lock:
+            self.waiting[priority] += change
+
+    def acquire(self, priority):
+        """
+        Blocks until a request of the given priority can be sent
+        """
+
+        wait = self.reserve(priority)
+        if wait <= 0:
+            return
+
+        start = time.perf_counter()
+        self.set_waiting(priority, 1)
+        try:
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.reserve(priority, time.perf_counter() - start)
+        finally:
+            self.set_waiting(priority, -1)
+        tracing.record('rate limit wait', 'governor', start, time.perf_counter(), {'priority': priority})
+
+    async def acquire_async(self, priority):
+        """
+        Waits without blocking the event loop until a request of the given priority can be sent
+        """
+        import asyncio
+
+        wait = self.reserve(priority)
+        if wait <= 0:
+            return
+
+        start = time.perf_counter()
+        self.set_waiting(priority, 1)
+        try:
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.reserve(priority, time.perf_counter() - start)
+        finally:
+            self.set_waiting(priority, -1)
+        tracing.record('rate limit wait', 'governor', start, time.perf_counter(), {'priority': priority})
+
+    def update(self, status, headers):
+        """
+        Reads the rate limit headers of a response
+
+        Parameters:
+            status(int): Status code of the response
+            headers(dict): Case insensitive headers of the response
+
+        Returns:
+            retry(bool): True if the request was rate limited and should be sent again
+        """
+
+        with self.lock:
+            try:
+                if headers.get('ratelimit-limit') != None:
+                    self.limit = int(headers['ratelimit-limit'])
+                if headers.get('ratelimit-remaining') != None:
+                    self.remaining = int(headers['ratelimit-remaining'])
+                if headers.get('ratelimit-reset') != None:
+                    self.reset_at = int(headers['ratelimit-reset'])
+            except ValueError:
+                pass
+
+            if status != 429:
+                return False
+
+            retry_after = retry_after_seconds(headers.get('retry-after'))
+            if retry_after == None and self.reset_at != None:
+                retry_after = max(self.reset_at - time.time(), 1)
+            if retry_after == None:
+                retry_after = config['default_retry_after']
+
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            print(f'Rate limited by the Digital Ocean API, retrying in {int(retry_after)}secs')
+
+            return True
+
+
+def retry_after_seconds(value):
+    """
+    Parses a Retry-After header given either in seconds or as an HTTP date
+    """
+
+    if value == None:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+_governor = Governor()
+
+
+def configure(requests_per_minute=None, max_retries=None):
+    """
+    Changes the settings of the shared governor
+
+    Parameters:
+        requests_per_minute(int): Sustained request rate allowed by the API
+        max_retries(int): Number of times a rate limited request is sent again
+    """
+    global _governor
+
+    if requests_per_minute != None:
+        config['requests_per_minute'] = requests_per_minute
+    if max_retries != None:
+        config['max_retries'] = max_retries
+
+    _governor = Governor()
+
+
+def get_governor():
+    return _governor
@@ -0,0 +1,139 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from apis import client
+from apis import inventory
+from apis import registry
+from apis import scheduler
+from apis import state
+from apis import tracing
+from apis import validation
+
+# INFO Adopts resources that already exist in Digital Ocean into the state, so that they are managed by the spec
+# without being created again. Every droplet, domain and dns record of the account is listed page by page, once,
+# and each action is matched against the listing by the adopt_handler of its resource type: droplets by name,
+# domains by name and dns records by domain, type and name. Adopted entries have the data their create handler
+# would have returned and no fingerprint, so the next apply compares them against their properties and updates
+# whatever differs
+
+
+def fetch_zones(auth_token, remote_inventory, domain_names, parallelism):
+    """
+    Lists the records of every domain, `parallelism` domains at a time, into the inventory. Domains that
+    do not exist are skipped
+    """
+
+    dns = registry.get_provider('DO_DNS_RECORD')
+    existing = [domain_name for domain_name in domain_names if remote_inventory.get_domain(domain_name) != None]
+
+    def fetch(domain_name):
+        with tracing.span('load zone', 'phase', domain=domain_name):
+            return list(dns.iter_records(auth_token, domain_name))
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        for domain_name, records in zip(existing, executor.map(fetch, existing)):
+            remote_inventory.add_zone(domain_name, records)
+
+
+def import_resources(parsed_yaml_data, parallelism=1, targets=None):
+    """
+    Records the resources of the spec that already exist in Digital Ocean in the state, without
+    creating or changing anything. Actions already in state are left as they are
+
+    Parameters:
+        parsed_yaml_data(dict): Data parsed from YAML file
+        parallelism(int): Maximum number of domains whose records are listed at once
+        targets(array): Identifiers or glob patterns of the actions to import, None to import every action
+
+    Returns:
+        imported(array): Identifiers of the actions whose resources were adopted
+    """
+
+    client.get_read_cache().clear()
+
+    curr_state = state.State.load()
+
+    with tracing.span('validate', 'phase'):
+        errors = validation.validate(parsed_yaml_data, curr_state.remote_ids('DO_DOMAIN'))
+
+    if errors != []:
+        print('Error with YAML specification')
+        for error in errors:
+            print(error)
+        return []
+
+    candidates = parsed_yaml_data['actions']
+    if targets != None:
+        candidates = [action for action in candidates if scheduler.matches_target(action['identifier'], targets)]
+        if candidates == []:
+            print(f"No action matches {', '.join(targets)}")
+            return []
+
+    managed = set(action['identifier'] for action in candidates if any(entry.resource == action['resource'] for entry in curr_state.find(action['identifier'])))
+    candidates = [action for action in candidates if action['identifier'] not in managed]
+
+    auth_token = os.environ['DO_PAO']
+    remote_inventory = inventory.Inventory(auth_token)
+
+    try:
+        with tracing.span('load inventory', 'phase'):
+            # INFO Zones are listed in parallel by fetch_zones instead of one after the other by Inventory.load
+            remote_inventory.load([action for action in candidates if action['resource'] != 'DO_DNS_RECORD'])
+
+            zones = sorted(set(action['properties']['domain'] for action in candidates if action['resource'] == 'DO_DNS_RECORD'))
+            if zones != [] and not any(action['resource'] == 'DO_DOMAIN' for action in candidates):
+                for existing_domain in registry.get_provider('DO_DOMAIN').iter_domains(auth_token):
+                    remote_inventory.add_domain(existing_domain)
+
+            fetch_zones(auth_token, remote_inventory, zones, parallelism)
+    except client.APIError as e:
+        print(f'Could not list the existing resources: {e}')
+        return []
+
+    entries = []
+    missing = []
+    conflicts = []
+    claimed = {}
+
+    for action in candidates:
+        data, error = registry.adopt(action['resource'], action['properties'], remote_inventory)
+
+        if error != None:
+            conflicts.append(f"{action['identifier']}: {error}")
+            continue
+        if data == None:
+            missing.append(action['identifier'])
+            continue
+
+        key = (action['resource'], state.remote_id(action['resource'], data))
+
+        owner = curr_state.get(*key)
+        if owner != None:
+            conflicts.append(f"{action['identifier']}: already in state as {owner.identifier}")
+            continue
+        if key in claimed:
+            conflicts.append(f"{action['identifier']}: matches the same resource as {claimed[key]}")
+            continue
+
+        claimed[key] = action['identifier']
+        entries.append(state.StateEntry(action['identifier'], action['resource'], data, scheduler.get_depends_on(action)))
+
+    with tracing.span('state write', 'phase', entries=len(entries)):
+        with curr_state.transaction():
+            for entry in entries:
+                curr_state.add(entry)
+        curr_state.save()
+
+    for entry in entries:
+        print(f'Imported {entry.identifier} ({entry.resource} {entry.remote_id})')
+
+    if missing != []:
+        print(f"\nNot found in Digital Ocean, created by the next apply: {', '.join(missing)}")
+
+    if conflicts != []:
+        print('\nNot imported:')
+        for conflict in conflicts:
+            print(conflict)
+
+    print(f'\nImported {len(entries)} of {len(candidates) + len(managed)} actions, {len(managed)} already in state, {len(missing)} not found, {len(conflicts)} not imported')
+
+    return [entry.identifier for entry in entries]
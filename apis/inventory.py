@@ -0,0 +1,194 @@
+import threading
+from apis import client
+from apis import registry
+
+
+class Inventory:
+    """
+    Snapshot of the remote resources of the account, loaded once per run.
+
+    Droplets are indexed by id and name, domains by name and dns records by id and by
+    (domain, type, name). The records of a domain that does not exist yet when the
+    snapshot is loaded are fetched the first time they are needed, which is after
+    the domain has been created by its action.
+
+    Listings that are already loaded are not fetched again, so an inventory can be kept
+    between runs, e.g. in watch mode, with refresh() forgetting the listings that may
+    have changed.
+    """
+
+    def __init__(self, auth_token):
+        self.auth_token = auth_token
+        self.lock = threading.RLock()
+
+        self.droplets_by_id = {}
+        self.droplets_by_name = {}
+        self.domains = {}
+        self.records_by_id = {}
+        self.records_by_key = {}
+        self.loaded_zones = set()
+        self.loaded = set()
+        self.loading_zones = {}
+
+    def missing(self, actions):
+        """
+        Returns the listings needed to compare the given actions that are not loaded yet
+
+        Returns:
+            droplets(bool): True if the droplets have to be listed
+            domains(bool): True if the domains have to be listed
+            zones(set): Names of the domains whose records have to be listed, once the domains are loaded
+        """
+
+        resources = set(action.get('resource') for action in actions)
+        zones = set(action['properties'].get('domain') for action in actions if action.get('resource') == 'DO_DNS_RECORD')
+
+        droplets = 'DO_DROPLET' in resources and 'DO_DROPLET' not in self.loaded
+        domains = ('DO_DOMAIN' in resources or zones != set()) and 'DO_DOMAIN' not in self.loaded
+
+        return droplets, domains, zones - self.loaded_zones
+
+    def load(self, actions):
+        """
+        Loads the droplets, domains and dns records needed to compare the given actions
+
+        Parameters:
+            actions(array): Actions parsed from the yaml file
+        """
+
+        droplets, domains, zones = self.missing(actions)
+
+        if droplets:
+            for droplet in registry.get_provider('DO_DROPLET').iter_droplets(self.auth_token):
+                self.add_droplet(droplet)
+            self.loaded.add('DO_DROPLET')
+
+        if domains:
+            for existing_domain in registry.get_provider('DO_DOMAIN').iter_domains(self.auth_token):
+                self.add_domain(existing_domain)
+            self.loaded.add('DO_DOMAIN')
+
+        for zone in zones:
+            if zone in self.domains:
+                self.load_zone(zone)
+
+    def refresh(self, actions):
+        """
+        Forgets the listings the given actions are compared against, so that the next load fetches them again.
+        Droplets and domains are listed again as a whole, dns records only for the domains of the actions
+        """
+
+        resources = set(action.get('resource') for action in actions)
+        zones = set(action['properties'].get('domain') for action in actions if action.get('resource') == 'DO_DNS_RECORD')
+
+        with self.lock:
+            if 'DO_DROPLET' in resources:
+                self.loaded.discard('DO_DROPLET')
+                self.droplets_by_id = {}
+                self.droplets_by_name = {}
+
+            if 'DO_DOMAIN' in resources:
+                self.loaded.discard('DO_DOMAIN')
+                self.domains = {}
+
+            for zone in zones:
+                self.loaded_zones.discard(zone)
+                for key in [key for key in self.records_by_key if key[0] == zone]:
+                    for record in self.records_by_key.pop(key):
+                        self.records_by_id.pop(record['id'], None)
+
+    def load_zone(self, domain_name):
+        """
+        Fetches every record of a domain into the indexes. The records are fetched without holding the lock,
+        so zones load in parallel. A caller asking for a zone that another thread is loading waits for it
+        instead of sending the same requests, like ReadCache.claim
+        """
+
+        while True:
+            with self.lock:
+                if domain_name in self.loaded_zones:
+                    return
+
+                loading = self.loading_zones.get(domain_name)
+                if loading == None:
+                    loading = self.loading_zones[domain_name] = threading.Event()
+                    break
+
+            # INFO If the loading thread fails, the zone is claimed again by a waiting caller
+            loading.wait()
+
+        try:
+            records = []
+            try:
+                records = list(registry.get_provider('DO_DNS_RECORD').iter_records(self.auth_token, domain_name))
+            except client.APIError as e:
+                # INFO A domain that does not exist yet has no records
+                if e.status != 404:
+                    raise
+
+            self.add_zone(domain_name, records)
+        finally:
+            with self.lock:
+                self.loading_zones.pop(domain_name, None)
+            loading.set()
+
+    def add_zone(self, domain_name, records):
+        """
+        Adds every record of a domain fetched elsewhere, e.g. by the async engine
+        """
+
+        with self.lock:
+            self.loaded_zones.add(domain_name)
+            for record in records:
+                self.add_record(domain_name, record)
+
+    def add_droplet(self, droplet):
+        with self.lock:
+            self.droplets_by_id[droplet['id']] = droplet
+            self.droplets_by_name.setdefault(droplet['name'], []).append(droplet)
+
+    def add_domain(self, new_domain):
+        with self.lock:
+            self.domains[new_domain['name']] = new_domain
+
+    def add_record(self, domain_name, record):
+        with self.lock:
+            self.records_by_id[record['id']] = record
+            self.records_by_key.setdefault((domain_name, record['type'], record['name']), []).append(record)
+
+    def add(self, resource, data):
+        """
+        Adds a resource created during the run to the indexes
+
+        Parameters:
+            resource(str): Type of the resource
+            data(dict): Data returned by the create handler of the resource
+        """
+
+        if resource == 'DO_DROPLET':
+            self.add_droplet(data)
+
+        if resource == 'DO_DOMAIN':
+            self.add_domain(data['domain'])
+
+        if resource == 'DO_DNS_RECORD':
+            with self.lock:
+                if data['domain_name'] in self.loaded_zones:
+                    self.add_record(data['domain_name'], data['domain_record'])
+
+    def get_droplets(self, name):
+        return self.droplets_by_name.get(name, [])
+
+    def get_domain(self, domain_name):
+        return self.domains.get(domain_name)
+
+    def get_records(self, domain_name, record_type, record_name):
+        """
+        Returns the records of a domain with the given type and name, loading the domain's records if needed
+        """
+
+        if domain_name not in self.loaded_zones:
+            self.load_zone(domain_name)
+
+        with self.lock:
+            return self.records_by_key.get((domain_name, record_type, record_name), [])
@@ -0,0 +1,89 @@
+import json
+from apis import registry
+
+
+def droplet_batch_key(action, deps):
+    """
+    Returns a key that is equal for droplet actions which only differ by name and identifier
+    """
+
+    properties = dict(action['properties'])
+    properties.pop('name', None)
+
+    return json.dumps([properties, sorted(deps)], sort_keys=True, default=str)
+
+
+def zone_key(action, deps):
+    """
+    Returns a key that is equal for dns record actions of the same domain with the same dependencies
+    """
+
+    return json.dumps([action['properties'].get('domain'), sorted(deps)], default=str)
+
+
+def plan(actions, graph):
+    """
+    Groups the actions into tasks that are run by a single worker. DO_DROPLET actions that only
+    differ by name and have the same dependencies are grouped so that they can be created together
+    with one request to the droplets endpoint. DO_DNS_RECORD actions of the same domain with the
+    same dependencies are grouped so that the zone is reconciled as a whole. Every other action
+    is a task of its own.
+
+    Parameters:
+        actions(array): Actions parsed from the yaml file
+        graph(array): Dependency graph of the actions returned by scheduler.build_graph
+
+    Returns:
+        tasks(array): Each task is a list of actions
+        task_graph(array): task_graph[i] is the set of indices of the tasks task i depends on
+    """
+
+    tasks = []
+    task_of = {}
+    open_batches = {}
+    open_zones = {}
+
+    for index, action in enumerate(actions):
+        if action.get('resource') == 'DO_DROPLET':
+            key = droplet_batch_key(action, graph[index])
+            batch = open_batches.get(key)
+
+            if batch != None and len(tasks[batch]) < registry.get_provider('DO_DROPLET').MAX_BATCH_SIZE:
+                tasks[batch].append(index)
+                task_of[index] = batch
+                continue
+
+            open_batches[key] = len(tasks)
+
+        if action.get('resource') == 'DO_DNS_RECORD':
+            key = zone_key(action, graph[index])
+            zone = open_zones.get(key)
+
+            if zone != None:
+                tasks[zone].append(index)
+                task_of[index] = zone
+                continue
+
+            open_zones[key] = len(tasks)
+
+        task_of[index] = len(tasks)
+        tasks.append([index])
+
+    task_graph = []
+    for task, members in enumerate(tasks):
+        deps = set(task_of[dep] for index in members for dep in graph[index])
+        deps.discard(task)
+        task_graph.append(deps)
+
+    return [[actions[index] for index in members] for members in tasks], task_graph
+
+
+def task_name(task):
+    """
+    Returns the name of a task in traces, e.g. web-1 or web-1 and 9 more
+    """
+
+    if len(task) == 1:
+        return task[0]['identifier']
+
+    return f"{task[0]['identifier']} and {len(task) - 1} more"
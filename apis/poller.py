@@ -0,0 +1,224 @@
+import threading
+import time
+from concurrent.futures import Future
+from apis import client
+from apis import governor
+from apis import tracing
+
+# INFO Polling settings. Actions are polled quickly at first and then less often the longer they run
+
+config = {
+    'initial_interval': 1,
+    'max_interval': 15,
+    'backoff': 1.5,
+    'deadline': 600,
+    'bulk_threshold': 5
+}
+
+
+class PollTimeout(Exception):
+    """
+    Raised through the future of an action that did not finish before the deadline
+    """
+
+
+class PendingAction:
+    __slots__ = ('action_id', 'href', 'auth_token', 'future', 'interval', 'next_poll', 'deadline', 'polls', 'started', 'track')
+
+    def __init__(self, action_id, href, auth_token, deadline):
+        now = time.monotonic()
+        self.polls = 0
+        # INFO The poll span is drawn on the timeline of the thread that waits for the action
+        self.started = time.perf_counter()
+        self.track = tracing.current_track() if tracing.is_enabled() else None
+        self.action_id = action_id
+        self.href = href
+        self.auth_token = auth_token
+        self.future = Future()
+        self.interval = config['initial_interval']
+        self.next_poll = now + self.interval
+        self.deadline = now + deadline
+
+
+class Poller:
+    """
+    Tracks every pending Digital Ocean action of the run from a single background thread.
+    Each action is polled with its own exponential backoff, and when many actions are due
+    at once they are looked up together through the /actions listing.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def watch(self, auth_token, action, deadline=None):
+        """
+        Starts tracking an action returned by the API
+
+        Parameters:
+            auth_token(str): Personal Access Token
+            action(dict): Action object or action link with `id` and `href`
+            deadline(int): Seconds to wait before giving up, defaults to config['deadline']
+
+        Returns:
+            future(Future): Resolves to the finished action object. Raises PollTimeout on deadline
+        """
+
+        if deadline == None:
+            deadline = config['deadline']
+
+        href = action.get('href', f"/actions/{action['id']}")
+        pending = PendingAction(action['id'], href, auth_token, deadline)
+
+        with self.condition:
+            self.pending[pending.action_id] = pending
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+        return pending.future
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    return
+
+                now = time.monotonic()
+                next_poll = min(p.next_poll for p in self.pending.values())
+                if next_poll > now:
+                    self.condition.wait(next_poll - now)
+                    continue
+
+                due = [p for p in self.pending.values() if p.next_poll <= now]
+
+            self.poll(due)
+
+    def poll(self, due):
+        """
+        Looks up the status of every due action and resolves the ones that have finished
+        """
+
+        found = {}
+
+        if len(due) >= config['bulk_threshold']:
+            found = self.bulk_lookup(due[0].auth_token)
+
+        for pending in due:
+            action = found.get(pending.action_id)
+
+            if action == None:
+                try:
+                    response = client.get(pending.href, pending.auth_token, priority=governor.PRIORITY_POLL, cache=False)
+                    if response.status_code == 200:
+                        action = response.json()['action']
+                except Exception as e:
+                    print(e)
+
+            # INFO A malformed action fails its own future instead of stopping the thread that polls every other action
+            try:
+                self.update(pending, action)
+            except Exception as e:
+                self.finish(pending, 'error')
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+
+    def bulk_lookup(self, auth_token):
+        """
+        Fetches the most recent actions of the account in one request
+        """
+
+        try:
+            response = client.get('/actions', auth_token, params={'per_page': 200}, priority=governor.PRIORITY_POLL, cache=False)
+            if response.status_code == 200:
+                return {a['id']: a for a in response.json()['actions']}
+        except Exception as e:
+            print(e)
+
+        return {}
+
+    def update(self, pending, action):
+        now = time.monotonic()
+        pending.polls += 1
+
+        if action != None and action['status'] in ('completed', 'errored'):
+            client.invalidate_action(action)
+            self.finish(pending, action['status'])
+            pending.future.set_result(action)
+            return
+
+        if now >= pending.deadline:
+            self.finish(pending, 'timeout')
+            pending.future.set_exception(PollTimeout(f'Action {pending.action_id} did not finish before the deadline'))
+            return
+
+        pending.interval = min(pending.interval * config['backoff'], config['max_interval'])
+        pending.next_poll = min(now + pending.interval, pending.deadline)
+
+    def finish(self, pending, status):
+        with self.condition:
+            self.pending.pop(pending.action_id, None)
+
+        tracing.record('poll', 'poll', pending.started, time.perf_counter(), {
+            'action_id': pending.action_id,
+            'status': status,
+            'polls': pending.polls
+        }, track=pending.track)
+
+
+_poller = Poller()
+
+
+def configure(deadline=None, initial_interval=None, max_interval=None):
+    """
+    Changes the polling settings
+
+    Parameters:
+        deadline(int): Seconds to wait for an action before giving up
+        initial_interval(int): Seconds before the first poll of an action
+        max_interval(int): Longest wait between two polls of an action
+    """
+
+    if deadline != None:
+        config['deadline'] = deadline
+    if initial_interval != None:
+        config['initial_interval'] = initial_interval
+    if max_interval != None:
+        config['max_interval'] = max_interval
+
+
+def watch(auth_token, action, deadline=None):
+    """
+    Starts tracking an action on the shared poller. See Poller.watch
+    """
+
+    return _poller.watch(auth_token, action, deadline)
+
+
+def wait(future, description):
+    """
+    Blocks until a watched action finishes and reports the outcome
+
+    Parameters:
+        future(Future): Future returned by watch
+        description(str): Description of the action to print
+
+    Returns:
+        action(dict): The finished action, or None if it errored or timed out
+    """
+
+    try:
+        action = future.result()
+    except PollTimeout as e:
+        print(f'{description} timed out: {e}')
+        return None
+
+    if action['status'] == 'errored':
+        print(f'{description} failed')
+        return None
+
+    print(f'{description} completed')
+    return action
@@ -0,0 +1,200 @@
+import importlib
+import threading
+
+# INFO Module implementing each resource type. A provider module is only imported the first time its resource
+# type is used, so a run only pays for the providers its spec needs. A provider module defines
+#
+#   create_handler(properties)                               Creates the resource, returns a handler result
+#   compare_handler(properties, existing_ids, inventory)     True if the resource already exists in Digital Ocean
+#   delete_handler(data)                                     Deletes the resource of a state entry
+#   state_id(data)                                           Id in Digital Ocean of the resource of a state entry
+#
+# and optionally
+#
+#   refresh_handler(data)                                    Deletes a resource that is replaced, defaults to delete_handler
+#   validate_properties(properties)                          Description of the first invalid property, or None
+#   preflight_handler(properties, catalog)                   Same, against the region, size and image catalog
+#   adopt_handler(properties, inventory)                     (data, error) of an existing resource to import into state
+#   PROPERTIES                                               Names of every property the resource type accepts
+#
+# New resource types are added with register()
+
+PROVIDERS = {
+    'DO_DOMAIN': 'apis.domain',
+    'DO_DROPLET': 'apis.droplets',
+    'DO_DNS_RECORD': 'apis.dns'
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register(resource, module_name):
+    """
+    Registers the provider module of a resource type
+
+    Parameters:
+        resource(str): Resource type used in the yaml file, such as DO_DROPLET
+        module_name(str): Importable name of the provider module
+    """
+
+    with _lock:
+        PROVIDERS[resource] = module_name
+        _loaded.pop(resource, None)
+
+
+def is_registered(resource):
+    return resource in PROVIDERS
+
+
+def get_provider(resource):
+    """
+    Returns the provider module of a resource type, importing it on first use. None if the type is not registered
+    """
+
+    provider = _loaded.get(resource)
+    if provider != None:
+        return provider
+
+    module_name = PROVIDERS.get(resource)
+    if module_name == None:
+        return None
+
+    with _lock:
+        if resource not in _loaded:
+            _loaded[resource] = importlib.import_module(module_name)
+
+    return _loaded[resource]
+
+
+def unknown_resource(resource):
+    return {
+        'status': "FAILURE",
+        'error': f"No such resource: {resource}"
+    }
+
+
+def create(resource, properties):
+    """
+    Calls the create hook of a resource type
+    """
+
+    provider = get_provider(resource)
+    if provider == None:
+        return unknown_resource(resource)
+
+    return provider.create_handler(properties)
+
+
+def compare(resource, properties, existing_ids, inventory):
+    """
+    Calls the compare hook of a resource type
+
+    Returns:
+        exists(bool): True if the resource already exists and does not have to be created
+    """
+
+    provider = get_provider(resource)
+    if provider == None:
+        return False
+
+    return provider.compare_handler(properties, existing_ids, inventory)
+
+
+def delete(resource, data):
+    """
+    Calls the delete hook of a resource type with the data of its state entry
+    """
+
+    provider = get_provider(resource)
+    if provider == None:
+        return unknown_resource(resource)
+
+    return provider.delete_handler(data)
+
+
+def refresh(resource, data):
+    """
+    Calls the refresh hook of a resource type to delete a resource that has been replaced
+    """
+
+    provider = get_provider(resource)
+    if provider == None:
+        return unknown_resource(resource)
+
+    return getattr(provider, 'refresh_handler', provider.delete_handler)(data)
+
+
+def known_properties(resource):
+    """
+    Returns the names of the properties a resource type accepts, None if it does not declare them
+    """
+
+    provider = get_provider(resource)
+    if provider == None:
+        return None
+
+    return getattr(provider, 'PROPERTIES', None)
+
+
+def validate(resource, properties):
+    """
+    Calls the validation hook of a resource type
+
+    Returns:
+        error(str): Description of the first problem found, None if the properties are valid or the type has no hook
+    """
+
+    provider = get_provider(resource)
+    if provider == None or not hasattr(provider, 'validate_properties'):
+        return None
+
+    return provider.validate_properties(properties)
+
+
+def has_preflight(resource):
+    provider = get_provider(resource)
+    return provider != None and hasattr(provider, 'preflight_handler')
+
+
+def preflight(resource, properties, catalog):
+    """
+    Calls the preflight hook of a resource type
+
+    Returns:
+        error(str): Description of the problem found, None if the properties are valid or the type has no hook
+    """
+
+    provider = get_provider(resource)
+    if provider == None or not hasattr(provider, 'preflight_handler'):
+        return None
+
+    return provider.preflight_handler(properties, catalog)
+
+
+def adopt(resource, properties, inventory):
+    """
+    Calls the import hook of a resource type
+
+    Returns:
+        data(dict): Data of the matching resource to store in state, None if nothing matches
+        error(str): Why the resource cannot be adopted, None otherwise
+    """
+
+    provider = get_provider(resource)
+    if provider == None or not hasattr(provider, 'adopt_handler'):
+        return None, f'{resource} resources cannot be imported'
+
+    return provider.adopt_handler(properties, inventory)
+
+
+def state_id(resource, data):
+    """
+    Returns the id in Digital Ocean of the resource of a state entry, None for an unknown resource type
+    """
+
+    provider = get_provider(resource)
+    if provider == None:
+        return None
+
+    return provider.state_id(data)
@@ -0,0 +1,32 @@
+import threading
+
+# INFO Updates that take an existing droplet down, such as a power off for a resize, run on at most max_disrupted
+# droplets at once, so that a size change across a tier rolls through it instead of taking it all down
+
+config = {
+    'max_disrupted': 1
+}
+
+_slots = threading.BoundedSemaphore(config['max_disrupted'])
+
+
+def configure(max_disrupted=None):
+    """
+    Changes the settings of droplet updates
+
+    Parameters:
+        max_disrupted(int): Maximum number of droplets being powered off, resized or rebuilt at the same time
+    """
+    global _slots
+
+    if max_disrupted != None:
+        config['max_disrupted'] = max(1, max_disrupted)
+        _slots = threading.BoundedSemaphore(config['max_disrupted'])
+
+
+def disruption_slot():
+    """
+    Returns the semaphore held while a droplet is down. Use it as a context manager
+    """
+
+    return _slots
@@ -0,0 +1,253 @@
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def get_depends_on(action):
+    """
+    Returns the identifiers listed in the depends_on attribute of an action as a list
+    """
+
+    depends_on = action.get('depends_on', [])
+
+    if isinstance(depends_on, str):
+        return [depends_on]
+
+    return list(depends_on)
+
+
+def build_graph(actions):
+    """
+    Builds the dependency graph of the actions in the yaml file
+
+    An action depends on
+        1. Every action named in its depends_on attribute
+        2. The DO_DOMAIN action that creates the domain of a DO_DNS_RECORD
+
+    Parameters:
+        actions(array): Actions parsed from the yaml file
+
+    Returns:
+        graph(array): graph[i] is the set of indices action i depends on
+    """
+
+    by_identifier = {}
+    by_domain = {}
+
+    for index, action in enumerate(actions):
+        by_identifier.setdefault(action.get('identifier', ''), []).append(index)
+
+        if action.get('resource') == 'DO_DOMAIN':
+            by_domain.setdefault(action.get('properties', {}).get('name'), []).append(index)
+
+    graph = []
+
+    for index, action in enumerate(actions):
+        deps = set()
+
+        for identifier in get_depends_on(action):
+            if identifier not in by_identifier:
+                raise ValueError(f"{action.get('identifier', '')} depends on unknown identifier: {identifier}")
+            deps.update(by_identifier[identifier])
+
+        if action.get('resource') == 'DO_DNS_RECORD':
+            deps.update(by_domain.get(action.get('properties', {}).get('domain'), []))
+
+        deps.discard(index)
+        graph.append(deps)
+
+    check_cycles(graph, [a.get('identifier', '') for a in actions])
+
+    return graph
+
+
+def matches_target(identifier, targets):
+    """
+    Returns True if an identifier is one of the targets or matches one of them as a glob pattern, e.g. web-*
+    """
+
+    return any(identifier == target or fnmatch.fnmatchcase(identifier, target) for target in targets)
+
+
+def dependency_closure(graph, indices):
+    """
+    Returns the given nodes together with every node they depend on, directly or not
+
+    Parameters:
+        graph(array): graph[i] is the set of indices node i depends on
+        indices(iterable): Nodes to start from
+    """
+
+    closure = set(indices)
+    stack = list(closure)
+
+    while stack:
+        for dep in graph[stack.pop()]:
+            if dep not in closure:
+                closure.add(dep)
+                stack.append(dep)
+
+    return closure
+
+
+def plan_deletes(entries, targets=None):
+    """
+    Chooses the state entries to delete. With targets, only the matching entries are deleted, together with
+    the entries that depend on them and the records of the domains being deleted
+
+    Parameters:
+        entries(iterable): StateEntry objects of the state
+        targets(array): Identifiers or glob patterns, None to delete every entry
+
+    Returns:
+        entries(array): Entries to delete one by one
+        records_of_domain(dict): Records removed together with their domain instead of one by one, by domain name
+    """
+
+    entries = list(entries)
+
+    if targets == None:
+        chosen = entries
+    else:
+        selected = set(index for index, entry in enumerate(entries) if matches_target(entry.identifier, targets))
+
+        # INFO Dependents can depend on each other, so entries are added until nothing else depends on the selection
+        changed = True
+        while changed:
+            changed = False
+            identifiers = set(entries[index].identifier for index in selected)
+            domains = set(entries[index].remote_id for index in selected if entries[index].resource == 'DO_DOMAIN')
+
+            for index, entry in enumerate(entries):
+                if index in selected:
+                    continue
+                if not identifiers.isdisjoint(entry.depends_on) or (entry.resource == 'DO_DNS_RECORD' and entry.data['domain_name'] in domains):
+                    selected.add(index)
+                    changed = True
+
+        chosen = [entry for index, entry in enumerate(entries) if index in selected]
+
+    domains = set(entry.remote_id for entry in chosen if entry.resource == 'DO_DOMAIN')
+
+    # INFO Records of a domain that is being deleted are removed together with the domain
+    to_delete = []
+    records_of_domain = {}
+    for entry in chosen:
+        if entry.resource == 'DO_DNS_RECORD' and entry.data['domain_name'] in domains:
+            records_of_domain.setdefault(entry.data['domain_name'], []).append(entry)
+        else:
+            to_delete.append(entry)
+
+    return to_delete, records_of_domain
+
+
+def build_delete_graph(entries):
+    """
+    Builds the dependency graph for deleting state entries. An entry is deleted before
+    every entry it depended on when it was created, so the order of creation is reversed
+
+    Parameters:
+        entries(array): StateEntry objects to delete
+
+    Returns:
+        graph(array): graph[i] is the set of indices of the entries that must be deleted before entry i
+    """
+
+    by_identifier = {}
+    for index, entry in enumerate(entries):
+        by_identifier.setdefault(entry.identifier, []).append(index)
+
+    graph = [set() for entry in entries]
+
+    for index, entry in enumerate(entries):
+        for identifier in entry.depends_on:
+            for dep in by_identifier.get(identifier, []):
+                if dep != index:
+                    graph[dep].add(index)
+
+    check_cycles(graph, [entry.identifier for entry in entries])
+
+    return graph
+
+
+def check_cycles(graph, names):
+    """
+    Raises a ValueError naming the nodes involved if the graph contains a cycle
+    """
+
+    remaining = {i: set(deps) for i, deps in enumerate(graph)}
+
+    while remaining:
+        ready = [i for i, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError('Circular dependency between: ' + ', '.join(str(names[i]) for i in sorted(remaining)))
+
+        for index in ready:
+            del remaining[index]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run(nodes, graph, worker, parallelism=1):
+    """
+    Runs the worker on every node once all of its dependencies have finished successfully.
+    Nodes that are ready run concurrently on a pool of at most `parallelism` threads.
+    If the worker returns False or raises, every node depending on it is skipped.
+
+    Parameters:
+        nodes(array): Items passed to the worker
+        graph(array): graph[i] is the set of indices node i depends on
+        worker(function): Called with a node, returns True on success
+        parallelism(int): Maximum number of nodes running at once
+
+    Returns:
+        results(dict): Maps the index of each node to 'SUCCESS', 'FAILURE' or 'SKIPPED'
+    """
+
+    remaining = {i: set(deps) for i, deps in enumerate(graph)}
+    dependents = {i: set() for i in range(len(nodes))}
+    for i, deps in enumerate(graph):
+        for dep in deps:
+            dependents[dep].add(i)
+
+    results = {}
+    running = {}
+
+    def skip(index):
+        for child in dependents[index]:
+            if child not in results:
+                results[child] = 'SKIPPED'
+                remaining.pop(child, None)
+                skip(child)
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        while remaining or running:
+            ready = [i for i, deps in remaining.items() if not deps]
+
+            for index in ready:
+                del remaining[index]
+                running[executor.submit(worker, nodes[index])] = index
+
+            if not running:
+                raise ValueError('Circular dependency between actions: ' + ', '.join(str(i) for i in sorted(remaining)))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                index = running.pop(future)
+
+                try:
+                    succeeded = future.result() != False
+                except Exception as e:
+                    print(e)
+                    succeeded = False
+
+                if succeeded:
+                    results[index] = 'SUCCESS'
+                    for child in dependents[index]:
+                        if child in remaining:
+                            remaining[child].discard(index)
+                else:
+                    results[index] = 'FAILURE'
+                    skip(index)
+
+    return results
@@ -0,0 +1,190 @@
+import glob
+import hashlib
+import marshal
+import os
+import sys
+
+# INFO Parsed action lists are cached per file in cache_dir. An entry is used as is while the file's mtime and size
+# are unchanged, and after a touch as long as the content hash still matches. Only parsing is skipped: the actions
+# are validated on every run, since the result depends on the domains in state and on the registered providers.
+# The marshal format can change between Python versions, so CACHE_VERSION includes the running one and each
+# version keeps its own entries
+
+CACHE_VERSION = (2, sys.version_info[0], sys.version_info[1])
+
+config = {
+    'cache_dir': '.tellurian-cache',
+    'cache': True
+}
+
+
+class SpecError(Exception):
+    """
+    Raised when a yaml file cannot be read or does not contain a list of actions
+    """
+
+
+def configure(cache=None, cache_dir=None):
+    """
+    Changes the settings of the spec loader
+
+    Parameters:
+        cache(bool): False to always parse the yaml files
+        cache_dir(str): Directory of the cached action lists
+    """
+
+    if cache != None:
+        config['cache'] = cache
+    if cache_dir != None:
+        config['cache_dir'] = cache_dir
+
+
+def expand_paths(paths):
+    """
+    Expands directories and glob patterns into the list of yaml files they contain
+
+    Parameters:
+        paths(array): Files, directories or glob patterns given on the command line
+
+    Returns:
+        filenames(array): Yaml files in the order they were given. Files of a directory or pattern are sorted
+    """
+
+    filenames = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '*.yml')) + glob.glob(os.path.join(path, '*.yaml'))
+        elif glob.has_magic(path):
+            matches = glob.glob(path, recursive=True)
+        else:
+            matches = [path]
+
+        for filename in sorted(matches):
+            if filename not in filenames:
+                filenames.append(filename)
+
+    return filenames
+
+
+def parse(content, filename):
+    """
+    Parses the content of a yaml file
+
+    Returns:
+        actions(array): The actions of the file
+    """
+
+    # INFO yaml is only imported when a file is not in the cache. The libyaml loader is several times
+    # faster than the pure python one and is used when PyYAML was built with it
+    import yaml
+    Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    try:
+        parsed_data = yaml.load(content, Loader=Loader)
+    except yaml.YAMLError as e:
+        raise SpecError(f'{filename}: {e}')
+
+    if not isinstance(parsed_data, dict) or 'actions' not in parsed_data:
+        raise SpecError(f'{filename}: actions attribute is required')
+
+    if not isinstance(parsed_data['actions'], list):
+        raise SpecError(f'{filename}: actions attribute must be a list')
+
+    for action in parsed_data['actions']:
+        if not isinstance(action, dict):
+            raise SpecError(f'{filename}: every action must be a mapping')
+
+    return parsed_data['actions']
+
+
+def cache_path(filename):
+    key = hashlib.sha256(f'{os.path.abspath(filename)}:{CACHE_VERSION}'.encode()).hexdigest()
+    return os.path.join(config['cache_dir'], key + '.spec')
+
+
+def read_cache(filename):
+    try:
+        with open(cache_path(filename), 'rb') as f:
+            entry = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(entry, dict) or entry.get('version') != CACHE_VERSION:
+        return None
+
+    return entry
+
+
+def write_cache(filename, entry):
+    os.makedirs(config['cache_dir'], exist_ok=True)
+
+    path = cache_path(filename)
+    temp_file = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_file, 'wb') as f:
+            marshal.dump(entry, f)
+        os.replace(temp_file, path)
+    except (OSError, ValueError):
+        # INFO The cache is only an optimization, a spec that cannot be cached is parsed again next time
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def load_file(filename):
+    """
+    Returns the actions of a yaml file, from the cache if the file has not changed since it was last parsed
+    """
+
+    try:
+        stat = os.stat(filename)
+    except OSError as e:
+        raise SpecError(f'{filename}: {e.strerror}')
+
+    cached = read_cache(filename) if config['cache'] else None
+
+    if cached != None and cached['mtime'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+        return cached['actions']
+
+    with open(filename, 'rb') as f:
+        content = f.read()
+
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    if cached != None and cached['hash'] == content_hash:
+        actions = cached['actions']
+    else:
+        actions = parse(content, filename)
+
+    if config['cache']:
+        write_cache(filename, {
+            'version': CACHE_VERSION,
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': content_hash,
+            'actions': actions
+        })
+
+    return actions
+
+
+def load(paths):
+    """
+    Loads one or more yaml files, directories or glob patterns as a single spec
+
+    Parameters:
+        paths(array): Files, directories or glob patterns
+
+    Returns:
+        parsed_data(dict): {'actions': [...]} with the actions of every file in order
+    """
+
+    filenames = expand_paths(paths)
+    if filenames == []:
+        raise SpecError(f"No yaml files found in {', '.join(paths)}")
+
+    actions = []
+    for filename in filenames:
+        actions.extend(load_file(filename))
+
+    return {'actions': actions}
@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from apis import state
+
+# INFO Every resource type shares one table, so types added with registry.register need no schema change.
+# remote_id is declared without a type so droplet and record ids stay integers and domain names stay text,
+# the same as in the state file. seq keeps the order entries were first added in, and domain_name is only set for dns records
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    resource TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    remote_id NOT NULL,
+    data TEXT NOT NULL,
+    depends_on TEXT NOT NULL,
+    fingerprint TEXT,
+    verified_at REAL,
+    domain_name TEXT
+);
+CREATE INDEX IF NOT EXISTS resources_identifier ON resources (identifier);
+CREATE INDEX IF NOT EXISTS resources_resource ON resources (resource);
+CREATE INDEX IF NOT EXISTS resources_domain_name ON resources (domain_name);
+CREATE UNIQUE INDEX IF NOT EXISTS resources_remote_id ON resources (resource, remote_id);
+"""
+
+# INFO Tables of the databases written when each resource type had its own table. They are copied into
+# resources and dropped when such a database is opened
+
+LEGACY_TABLES = {
+    'DO_DROPLET': 'droplets',
+    'DO_DOMAIN': 'domains',
+    'DO_DNS_RECORD': 'dns_records'
+}
+
+COLUMNS = 'identifier, resource, data, depends_on, fingerprint, verified_at'
+
+
+class SQLiteBackend(state.StateBackend):
+    """
+    Keeps the state in a SQLite database. Nothing is loaded up front: every lookup is an indexed query,
+    so a run only reads and writes the entries of the resources it touches.
+    Each change is its own transaction unless it is made inside transaction()
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.RLock()
+        self.depth = 0
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens the state database, creating it if needed. A new database is filled from the
+        state file and journal of the file backend if they exist
+        """
+
+        migrate = not os.path.exists(path) and (os.path.exists(state.STATE_FILE) or os.path.exists(state.JOURNAL_FILE))
+
+        # INFO Autocommit mode, transactions are started explicitly
+        conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.executescript(SCHEMA)
+        migrate_tables(conn)
+
+        backend = cls(conn)
+
+        if migrate:
+            backend.migrate()
+
+        return backend
+
+    def migrate(self):
+        """
+        Copies the state file and journal into the database and renames the state file to tellurian.tlstate.migrated
+        """
+
+        entries = list(state.FileBackend.load())
+
+        with self.transaction():
+            for entry in entries:
+                self.put(entry)
+
+        if os.path.exists(state.STATE_FILE):
+            os.replace(state.STATE_FILE, state.STATE_FILE + '.migrated')
+        if os.path.exists(state.JOURNAL_FILE):
+            os.remove(state.JOURNAL_FILE)
+
+        print(f'Migrated {len(entries)} state entries from {state.STATE_FILE} to {state.STATE_DB}')
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def rows_to_entries(self, rows):
+        return [state.StateEntry(identifier, resource, json.loads(data), json.loads(depends_on), entry_fingerprint, verified_at) for identifier, resource, data, depends_on, entry_fingerprint, verified_at in rows]
+
+    def __iter__(self):
+        return iter(self.rows_to_entries(self.query(f'SELECT {COLUMNS} FROM resources ORDER BY seq')))
+
+    def __len__(self):
+        return self.query('SELECT COUNT(*) FROM resources')[0][0]
+
+    def find(self, identifier):
+        return self.rows_to_entries(self.query(f'SELECT {COLUMNS} FROM resources WHERE identifier = ? ORDER BY seq', (identifier,)))
+
+    def of_type(self, resource):
+        return self.rows_to_entries(self.query(f'SELECT {COLUMNS} FROM resources WHERE resource = ? ORDER BY seq', (resource,)))
+
+    def records_for_domain(self, domain_name):
+        return self.rows_to_entries(self.query(f'SELECT {COLUMNS} FROM resources WHERE domain_name = ? ORDER BY seq', (domain_name,)))
+
+    def get(self, resource, resource_id):
+        rows = self.query(f'SELECT {COLUMNS} FROM resources WHERE resource = ? AND remote_id = ?', (resource, resource_id))
+        if rows == []:
+            return None
+
+        return self.rows_to_entries(rows)[0]
+
+    def put(self, entry):
+        # INFO A later entry for the same remote resource replaces the earlier one in place, keeping its position
+        self.query('''INSERT INTO resources (resource, identifier, remote_id, data, depends_on, fingerprint, verified_at, domain_name) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (resource, remote_id) DO UPDATE SET identifier = excluded.identifier, data = excluded.data, depends_on = excluded.depends_on,
+            fingerprint = excluded.fingerprint, verified_at = excluded.verified_at, domain_name = excluded.domain_name''', (
+            entry.resource,
+            entry.identifier,
+            entry.remote_id,
+            json.dumps(entry.data),
+            json.dumps(entry.depends_on),
+            entry.fingerprint,
+            entry.verified_at,
+            state.record_domain(entry)
+        ))
+
+    def delete(self, entry):
+        self.query('DELETE FROM resources WHERE resource = ? AND remote_id = ?', (entry.resource, entry.remote_id))
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            if self.depth == 0:
+                self.conn.execute('BEGIN IMMEDIATE')
+            self.depth += 1
+
+            try:
+                yield
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+
+            self.depth -= 1
+            if self.depth == 0:
+                self.conn.execute('COMMIT')
+
+    def save(self):
+        # INFO Folds the write-ahead log back into the database file at the end of the run
+        self.query('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def migrate_tables(conn):
+    """
+    Moves the entries of the per resource type tables of older databases into the resources table, in the
+    order they were added, and drops the old tables
+    """
+
+    existing = set(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+
+    for resource, table in LEGACY_TABLES.items():
+        if table not in existing:
+            continue
+
+        # INFO Databases created before fingerprints were stored are missing their columns
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        fingerprint = 'fingerprint, verified_at' if 'fingerprint' in columns else 'NULL, NULL'
+        domain_name = "json_extract(data, '$.domain_name')" if resource == 'DO_DNS_RECORD' else 'NULL'
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'''INSERT OR IGNORE INTO resources (resource, identifier, remote_id, data, depends_on, fingerprint, verified_at, domain_name)
+                SELECT ?, identifier, remote_id, data, depends_on, {fingerprint}, {domain_name} FROM {table} ORDER BY seq''', (resource,))
+            conn.execute(f'DROP TABLE {table}')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
@@ -1,75 +1,557 @@
+import hashlib
 import json
-from apis import domain
-from apis import droplets
-from apis import dns
+import os
+import threading
+import time
+from contextlib import contextmanager
+from apis import registry
 
-def load_state():
+STATE_FILE = 'tellurian.tlstate'
+
+# INFO Every change to the state is appended to the journal as soon as it happens. The state file is a snapshot
+# that the journal is replayed on top of, and is rewritten once the journal has grown by COMPACT_EVERY records
+
+JOURNAL_FILE = 'tellurian.tlstate.journal'
+COMPACT_EVERY = 100
+
+# INFO State database used by the sqlite backend. See apis/sqlite_state.py
+
+STATE_DB = 'tellurian.tlstate.db'
+
+# INFO backend is 'file', 'sqlite' or None to use sqlite only when the state database already exists.
+# Actions whose properties match the fingerprint of their state entry are skipped without any API call
+# for trust_for seconds after the entry was last verified against Digital Ocean. 0 always verifies
+
+config = {
+    'backend': None,
+    'trust_for': 0
+}
+
+
+def remote_id(resource, data):
+    """
+    Returns the id of a resource in Digital Ocean from its state details. Domains are identified by their name
     """
-    Function to load the current state from the state file. Returns empty array if the current state is null
 
-    Parameters:
-        None
-    
-    Returns:
-        state(array): current state
+    return registry.state_id(resource, data)
+
+
+def record_domain(entry):
     """
-    try:
-        return json.load(open('tellurian.tlstate'))
-    except FileNotFoundError as e:
-        return []
-    except json.decoder.JSONDecodeError as e:
-        return []
+    Returns the domain name of a dns record entry, None for the entries of other resource types
+    """
+
+    if entry.resource != 'DO_DNS_RECORD':
+        return None
 
+    return entry.data['domain_name']
 
-def check_state(state, resource, properties):
+
+def fingerprint(properties):
+    """
+    Returns a hash of the properties of an action that does not depend on the order of their keys
     """
-    Checks the properties of the resource to be created with the already existing resources in state
 
-    Parameters:
-        state(dict): current state object
-        resource(str): Type of resource being created
-        properties(dict): Properties of the resource
+    canonical = json.dumps(properties, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class StateEntry:
+    """
+    A resource created by tellurian. Serialized as {identifier, resource, data[, depends_on, fingerprint, verified_at]}
+    in the state file. fingerprint is the hash of the properties the resource was last applied or verified with,
+    and verified_at the time in seconds since the epoch when that happened
     """
 
-    if resource == 'DO_DOMAIN':
-        if domain.compare_domains(properties):
-            return False
+    __slots__ = ('identifier', 'resource', 'data', 'depends_on', 'remote_id', 'fingerprint', 'verified_at')
 
-    if resource == 'DO_DROPLET':
-        existing_droplet_ids = [s['data']['id'] for s in state if s['resource'] == 'DO_DROPLET']
-        if droplets.compare_droplets(properties, existing_droplet_ids):
-            return False
+    def __init__(self, identifier, resource, data, depends_on=None, fingerprint=None, verified_at=None):
+        self.identifier = identifier
+        self.resource = resource
+        self.data = data
+        self.depends_on = depends_on or []
+        self.remote_id = remote_id(resource, data)
+        self.fingerprint = fingerprint
+        self.verified_at = verified_at
 
-    if resource == 'DO_DNS_RECORD':
-        existing_record_ids = [s['data']['domain_record']['id'] for s in state if s['resource'] == 'DO_DNS_RECORD']
-        if dns.compare_domains(properties, existing_record_ids):
-            return False
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(entry['identifier'], entry['resource'], entry['data'], entry.get('depends_on'), entry.get('fingerprint'), entry.get('verified_at'))
+
+    def to_dict(self):
+        entry = {
+            'identifier': self.identifier,
+            'resource': self.resource,
+            'data': self.data
+        }
+
+        if self.depends_on != []:
+            entry['depends_on'] = self.depends_on
+
+        if self.fingerprint != None:
+            entry['fingerprint'] = self.fingerprint
+            entry['verified_at'] = self.verified_at
+
+        return entry
 
-    return True
-            
-def refresh_state(state_data, curr_state):
+
+class StateBackend:
+    """
+    Interface of the storage behind State. A backend persists every put and delete by itself,
+    and changes made inside transaction() are persisted together
     """
-    Deletes the unnecessary resources if the resource in the current state has to be deleted and replaced
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def find(self, identifier):
+        """
+        Returns the entries created by the actions with the given identifier
+        """
+        raise NotImplementedError
+
+    def of_type(self, resource):
+        """
+        Returns the entries of a resource type
+        """
+        raise NotImplementedError
+
+    def records_for_domain(self, domain_name):
+        """
+        Returns the dns record entries of a domain
+        """
+        raise NotImplementedError
+
+    def get(self, resource, resource_id):
+        """
+        Returns the entry of a resource from its id in Digital Ocean, None if it is not in state
+        """
+        raise NotImplementedError
+
+    def put(self, entry):
+        """
+        Adds an entry, replacing the entry of the same remote resource if there is one
+        """
+        raise NotImplementedError
+
+    def delete(self, entry):
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def save(self):
+        """
+        Called once at the end of a run
+        """
+        pass
+
+
+class FileBackend(StateBackend):
+    """
+    Keeps the whole state in memory, indexed by identifier, resource type, remote id and the domain of dns records, and
+    persists it to the state file and its journal
+    """
+
+    def __init__(self, entries=()):
+        # INFO Dicts are used as ordered sets so that entries keep the order they were created in
+        self.entries = {}
+        self.by_identifier = {}
+        self.by_resource = {}
+        self.by_remote_id = {}
+        self.by_domain = {}
+
+        self.journal_lock = threading.Lock()
+        self.journal_records = 0
+        self.pending = None
+
+        for entry in entries:
+            self.index(entry)
+
+    @classmethod
+    def load(cls):
+        """
+        Loads the current state from the state file and replays the journal left by an earlier run on top of it.
+        The state is empty if the state file is missing or empty
+        """
+
+        try:
+            snapshot = json.load(open(STATE_FILE))
+        except FileNotFoundError as e:
+            snapshot = []
+        except json.decoder.JSONDecodeError as e:
+            snapshot = []
+
+        backend = cls(StateEntry.from_dict(entry) for entry in snapshot)
+
+        try:
+            with open(JOURNAL_FILE, 'rb+') as f:
+                end = 0
+                for line in f:
+                    # INFO A record cut short by a crash is the last line, it is missing its newline or is not valid JSON
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+
+                    end += len(line)
+                    backend.journal_records += 1
+
+                    entry = StateEntry.from_dict(record['entry'])
+                    if record['op'] == 'put':
+                        backend.index(entry)
+                    else:
+                        existing = backend.get(entry.resource, entry.remote_id)
+                        if existing != None:
+                            backend.unindex(existing)
+
+                # INFO The torn record is cut off, otherwise the next record would be appended to it and lost with it
+                f.seek(0, os.SEEK_END)
+                if f.tell() > end:
+                    f.truncate(end)
+                    f.flush()
+                    os.fsync(f.fileno())
+        except FileNotFoundError:
+            pass
+
+        return backend
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def index(self, entry):
+        existing = self.get(entry.resource, entry.remote_id)
+        if existing != None and existing is not entry:
+            self.unindex(existing)
+
+        self.entries[entry] = None
+        self.by_identifier.setdefault(entry.identifier, {})[entry] = None
+        self.by_resource.setdefault(entry.resource, {})[entry] = None
+        self.by_remote_id.setdefault(entry.resource, {})[entry.remote_id] = entry
+
+        domain_name = record_domain(entry)
+        if domain_name != None:
+            self.by_domain.setdefault(domain_name, {})[entry] = None
+
+    def unindex(self, entry):
+        del self.entries[entry]
+        del self.by_identifier[entry.identifier][entry]
+        del self.by_resource[entry.resource][entry]
+        if self.by_remote_id[entry.resource].get(entry.remote_id) is entry:
+            del self.by_remote_id[entry.resource][entry.remote_id]
+
+        domain_name = record_domain(entry)
+        if domain_name != None:
+            del self.by_domain[domain_name][entry]
+
+    def find(self, identifier):
+        return list(self.by_identifier.get(identifier, {}))
+
+    def of_type(self, resource):
+        return list(self.by_resource.get(resource, {}))
+
+    def records_for_domain(self, domain_name):
+        return list(self.by_domain.get(domain_name, {}))
+
+    def get(self, resource, resource_id):
+        return self.by_remote_id.get(resource, {}).get(resource_id)
+
+    def put(self, entry):
+        self.index(entry)
+        self.append_journal('put', entry)
+
+    def delete(self, entry):
+        self.unindex(entry)
+        self.append_journal('remove', entry)
+
+    @contextmanager
+    def transaction(self):
+        # INFO The records of a transaction are written to the journal with a single write
+        if self.pending != None:
+            yield
+            return
+
+        self.pending = []
+        try:
+            yield
+        finally:
+            records, self.pending = self.pending, None
+            self.write_journal(records)
+
+    def append_journal(self, op, entry):
+        """
+        Appends a change to the journal, or to the open transaction
+
+        Parameters:
+            op(str): 'put' when an entry is added, 'remove' when it is removed
+            entry(StateEntry): The state entry
+        """
+
+        record = json.dumps({'op': op, 'entry': entry.to_dict()}) + '\n'
+
+        if self.pending != None:
+            self.pending.append(record)
+        else:
+            self.write_journal([record])
+
+    def write_journal(self, records):
+        """
+        Writes records to the journal and waits for them to reach the disk. Compacts the journal when it has grown too long
+        """
+
+        if records == []:
+            return
+
+        with self.journal_lock:
+            with open(JOURNAL_FILE, 'a') as f:
+                f.write(''.join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_records += len(records)
+            compact = self.journal_records >= COMPACT_EVERY
+
+        if compact:
+            self.save()
+
+    def save(self):
+        """
+        Compacts the journal by writing the current state to the state file and clearing the journal.
+        The state file is replaced atomically, so a crash leaves either the old or the new snapshot
+        """
+
+        with self.journal_lock:
+            temp_file = STATE_FILE + '.tmp'
+            with open(temp_file, 'w') as f:
+                json.dump([entry.to_dict() for entry in self.entries], f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, STATE_FILE)
+
+            if os.path.exists(JOURNAL_FILE):
+                os.remove(JOURNAL_FILE)
+            self.journal_records = 0
+
+
+class RemoteIds:
+    """
+    Read only set of the ids in Digital Ocean of the resources of a type that are in state
+    """
+
+    def __init__(self, backend, resource):
+        self.backend = backend
+        self.resource = resource
+
+    def __contains__(self, resource_id):
+        return self.backend.get(self.resource, resource_id) != None
+
+
+def configure(backend=None, trust_for=None):
+    """
+    Changes the settings of the state
 
     Parameters:
-        state_data: Newly created resource's state details
-        curr_state: Current state object
+        backend(str): 'file' to keep the state in tellurian.tlstate, 'sqlite' to keep it in tellurian.tlstate.db
+        trust_for(float): Seconds during which a verified state entry is trusted without calling the API
     """
-    to_remove = None
-    for resource in curr_state:
-        if resource['identifier'] == state_data['identifier']:
-            to_remove = resource
 
-    if to_remove != None:
-        if to_remove['resource'] == 'DO_DROPLET':
-            droplets.delete_handler(to_remove['data'])
+    if backend != None:
+        config['backend'] = backend
+    if trust_for != None:
+        config['trust_for'] = trust_for
+
+
+def open_backend():
+    """
+    Opens the configured state backend
+    """
+
+    backend = config['backend']
+    if backend == None:
+        backend = 'sqlite' if os.path.exists(STATE_DB) else 'file'
+
+    if backend == 'sqlite':
+        from apis import sqlite_state
+        return sqlite_state.SQLiteBackend.open(STATE_DB)
+
+    return FileBackend.load()
+
+
+class State:
+    """
+    The resources created by tellurian. Lookups by identifier, resource type and remote id are served
+    by the backend's indexes, and every change is persisted by the backend as it happens.
+    Callers running actions in parallel are expected to serialize changes with their own lock.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @classmethod
+    def load(cls):
+        return cls(open_backend())
+
+    def __iter__(self):
+        return iter(self.backend)
+
+    def __len__(self):
+        return len(self.backend)
+
+    def find(self, identifier):
+        return self.backend.find(identifier)
+
+    def of_type(self, resource):
+        return self.backend.of_type(resource)
+
+    def records_for_domain(self, domain_name):
+        return self.backend.records_for_domain(domain_name)
+
+    def get(self, resource, resource_id):
+        return self.backend.get(resource, resource_id)
+
+    def remote_ids(self, resource):
+        return RemoteIds(self.backend, resource)
+
+    def add(self, entry):
+        self.backend.put(entry)
+
+    def remove(self, entry):
+        self.backend.delete(entry)
+
+    def transaction(self):
+        """
+        Changes made inside the returned context manager are persisted together
+        """
+
+        return self.backend.transaction()
+
+    def save(self):
+        self.backend.save()
+
+    def check(self, resource, properties, inventory):
+        """
+        Checks the properties of the resource to be created with the already existing resources in state
+
+        Parameters:
+            resource(str): Type of resource being created
+            properties(dict): Properties of the resource
+            inventory(Inventory): Snapshot of the remote resources loaded at the start of the run
+
+        Returns:
+            create(bool): True if the resource has to be created
+        """
+
+        return not registry.compare(resource, properties, self.remote_ids(resource), inventory)
+
+    def applied(self, action):
+        """
+        Returns True if the action was applied or verified with the same properties, whenever that was
+        """
+
+        action_fingerprint = fingerprint(action['properties'])
+
+        for entry in self.find(action['identifier']):
+            if entry.resource == action['resource'] and entry.fingerprint == action_fingerprint:
+                return True
+
+        return False
+
+    def unchanged(self, actions, graph):
+        """
+        Returns the identifiers of the actions applied with the same properties whose dependencies are all
+        unchanged too. An action depending on one that has to be applied is checked again, as it may be
+        affected, e.g. the records of a domain that is replaced
+
+        Parameters:
+            actions(array): Actions of the spec
+            graph(array): Dependency graph built by scheduler.build_graph
+        """
+
+        dependents = [[] for action in actions]
+        for index, deps in enumerate(graph):
+            for dep in deps:
+                dependents[dep].append(index)
+
+        changed = set(index for index, action in enumerate(actions) if not self.applied(action))
+
+        stack = list(changed)
+        while stack:
+            for child in dependents[stack.pop()]:
+                if child not in changed:
+                    changed.add(child)
+                    stack.append(child)
+
+        return set(action['identifier'] for index, action in enumerate(actions) if index not in changed)
+
+    def trusted(self, action):
+        """
+        Returns True if the action was applied or verified with the same properties less than
+        config['trust_for'] seconds ago, in which case it is skipped without calling the API
+        """
+
+        if config['trust_for'] <= 0:
+            return False
+
+        action_fingerprint = fingerprint(action['properties'])
+        now = time.time()
+
+        for entry in self.find(action['identifier']):
+            if entry.resource == action['resource'] and entry.fingerprint == action_fingerprint and entry.verified_at != None:
+                if now - entry.verified_at <= config['trust_for']:
+                    return True
+
+        return False
+
+    def verified(self, action):
+        """
+        Records that the resources of an action were found to match its properties
+        """
+
+        action_fingerprint = fingerprint(action['properties'])
+        now = time.time()
+
+        with self.transaction():
+            for entry in self.find(action['identifier']):
+                if entry.resource == action['resource']:
+                    entry.fingerprint = action_fingerprint
+                    entry.verified_at = now
+                    self.add(entry)
+
+    def replaced_by(self, new_entry):
+        """
+        Returns the entries whose resources are replaced by a newly created resource. An entry for the
+        same remote resource, such as a droplet recorded before it became active, is not replaced
+        """
+
+        return [entry for entry in self.find(new_entry.identifier) if entry.resource != new_entry.resource or entry.remote_id != new_entry.remote_id]
+
+    def swap(self, new_entry):
+        """
+        Records a newly created resource in place of the entries with the same identifier, in one transaction
+        """
+
+        with self.transaction():
+            for entry in self.find(new_entry.identifier):
+                self.remove(entry)
+            self.add(new_entry)
 
-        if to_remove['resource'] == 'DO_DOMAIN':
-            domain.delete_handler(to_remove['data'])
+    def replace(self, new_entry):
+        """
+        Deletes the resources replaced by a newly created resource and records it in their place
 
-        if to_remove['resource'] == 'DO_DNS_RECORD':
-            dns.delete_handler(to_remove['data'])
-        curr_state.remove(to_remove)
+        Parameters:
+            new_entry(StateEntry): Newly created resource's state details
+        """
 
+        for entry in self.replaced_by(new_entry):
+            registry.refresh(entry.resource, entry.data)
 
-    return curr_state
+        self.swap(new_entry)
@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# INFO Tracing is off unless enable() is called, in which case every span is kept in memory until write().
+# Spans use the Chrome trace event format and can be opened in chrome://tracing or https://ui.perfetto.dev
+
+_enabled = False
+_events = []
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+def enable():
+    global _enabled, _origin
+
+    with _lock:
+        _enabled = True
+        _origin = time.perf_counter()
+        _events.clear()
+
+
+def is_enabled():
+    return _enabled
+
+
+def endpoint(path):
+    """
+    Returns the route of a url with ids and names replaced, e.g. /domains/{name}/records/{id}
+    """
+
+    path = re.sub(r'^https?://[^/]+', '', path.split('?')[0])
+    path = re.sub(r'^/v2', '', path)
+    path = re.sub(r'/domains/[^/]+', '/domains/{name}', path)
+    return re.sub(r'/\d+', '/{id}', path)
+
+
+def current_track():
+    """
+    Returns the id of the timeline a span is drawn on. Coroutines of the async engine share a thread,
+    so each asyncio task gets a track of its own
+    """
+
+    asyncio = sys.modules.get('asyncio')
+    if asyncio != None:
+        try:
+            return id(asyncio.current_task())
+        except RuntimeError:
+            pass
+
+    return threading.get_ident()
+
+
+def record(name, category, start, end, args=None, track=None):
+    """
+    Records a span that has already finished
+
+    Parameters:
+        name(str): Name of the span
+        category(str): One of request, phase, action, poll or governor
+        start(float): time.perf_counter() when the span started
+        end(float): time.perf_counter() when the span ended
+        args(dict): Details shown with the span
+        track(int): Timeline of the span, defaults to the current thread or asyncio task
+    """
+
+    if not _enabled:
+        return
+
+    event = {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': round((start - _origin) * 1e6),
+        'dur': round((end - start) * 1e6),
+        'pid': os.getpid(),
+        'tid': track if track != None else current_track(),
+        'args': args or {}
+    }
+
+    with _lock:
+        _events.append(event)
+
+
+@contextmanager
+def span(name, category, **args):
+    """
+    Records the time spent inside the with block. The yielded dict can be used to add details to the span
+    """
+
+    if not _enabled:
+        yield args
+        return
+
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        record(name, category, start, time.perf_counter(), args)
+
+
+def summary(limit=10):
+    """
+    Summarizes the recorded spans
+
+    Returns:
+        lines(array): Slowest actions, time per phase and the slowest endpoints
+    """
+
+    with _lock:
+        events = list(_events)
+
+    lines = []
+
+    actions = sorted((e for e in events if e['cat'] == 'action'), key=lambda e: -e['dur'])
+    lines.append('Slowest actions')
+    for event in actions[:limit]:
+        lines.append(f"  {event['dur'] / 1e6:8.2f}s  {event['name']}")
+
+    phases = {}
+    for event in events:
+        if event['cat'] in ('phase', 'poll', 'governor'):
+            total = phases.setdefault(event['name'], [0, 0])
+            total[0] += 1
+            total[1] += event['dur']
+
+    lines.append('Time per phase (summed over parallel actions)')
+    for name, (count, total) in sorted(phases.items(), key=lambda item: -item[1][1]):
+        lines.append(f'  {total / 1e6:8.2f}s  {name} x{count}')
+
+    endpoints = {}
+    for event in events:
+        if event['cat'] == 'request':
+            durations = endpoints.setdefault(event['name'], {'durations': [], 'bytes': 0, 'statuses': {}})
+            durations['durations'].append(event['dur'])
+            durations['bytes'] += event['args'].get('bytes_sent', 0) + event['args'].get('bytes_received', 0)
+            status = event['args'].get('status')
+            durations['statuses'][status] = durations['statuses'].get(status, 0) + 1
+
+    lines.append('Slowest endpoints')
+    for name, stats in sorted(endpoints.items(), key=lambda item: -sum(item[1]['durations']))[:limit]:
+        durations = sorted(stats['durations'])
+        median = durations[len(durations) // 2]
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(stats['statuses'].items(), key=str))
+        lines.append(f"  {sum(durations) / 1e6:8.2f}s  {name} x{len(durations)}, median {median / 1e3:.0f}ms, max {durations[-1] / 1e3:.0f}ms, {stats['bytes'] / 1024:.0f}KiB ({statuses})")
+
+    return lines
+
+
+def write(filename):
+    """
+    Writes the recorded spans to a Chrome trace file
+    """
+
+    with _lock:
+        events = list(_events)
+
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
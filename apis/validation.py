@@ -0,0 +1,139 @@
+from apis import registry
+from apis import scheduler
+from apis.catalog import suggest
+
+# INFO The whole spec is checked before the first request, so that a mistake in the last action cannot leave
+# the earlier ones half built. Every problem of every action is reported at once
+
+ACTION_ATTRIBUTES = ('resource', 'identifier', 'properties', 'depends_on')
+
+
+def action_label(index, action):
+    """
+    Returns the identifier of an action for error messages, or its position if it has none
+    """
+
+    if isinstance(action, dict) and isinstance(action.get('identifier'), str) and action['identifier'] != '':
+        return action['identifier']
+
+    return f'Action {index + 1}'
+
+
+def check_action(index, action):
+    """
+    Checks the attributes and properties of a single action
+
+    Returns:
+        errors(array): Description of each problem found
+    """
+
+    label = action_label(index, action)
+
+    if not isinstance(action, dict):
+        return [f'{label}: must be a mapping with resource, identifier and properties']
+
+    errors = []
+
+    for attribute in action:
+        if attribute not in ACTION_ATTRIBUTES:
+            errors.append(f'{label}: unknown attribute {attribute}{suggest(attribute, ACTION_ATTRIBUTES)}')
+
+    if not isinstance(action.get('identifier'), str) or action['identifier'] == '':
+        errors.append(f'{label}: identifier attribute is required')
+
+    depends_on = action.get('depends_on', [])
+    if isinstance(depends_on, str):
+        depends_on = [depends_on]
+    if not isinstance(depends_on, list) or not all(isinstance(identifier, str) for identifier in depends_on):
+        errors.append(f'{label}: depends_on must be an identifier or a list of identifiers')
+
+    resource = action.get('resource')
+    if resource == None:
+        errors.append(f'{label}: resource attribute is required')
+        return errors
+
+    if not registry.is_registered(resource):
+        errors.append(f'{label}: unknown resource type {resource}{suggest(resource, registry.PROVIDERS)}')
+        return errors
+
+    properties = action.get('properties')
+    if not isinstance(properties, dict) or properties == {}:
+        errors.append(f'{label}: properties attribute is required')
+        return errors
+
+    known_properties = registry.known_properties(resource)
+    if known_properties != None:
+        for name in properties:
+            if name not in known_properties:
+                errors.append(f'{label}: unknown property {name} of {resource}{suggest(name, known_properties)}')
+
+    error = registry.validate(resource, properties)
+    if error != None:
+        errors.append(f'{label}: {error}')
+
+    return errors
+
+
+def validate(parsed_yaml_data, known_domains=()):
+    """
+    Checks a spec before any request is sent
+
+        1. Every action has a registered resource type, an identifier and valid properties
+        2. No two actions share an identifier
+        3. depends_on only names identifiers of the spec, without cycles
+        4. Every DO_DNS_RECORD belongs to a domain created by the spec or already in the state
+
+    Parameters:
+        parsed_yaml_data(dict): Data parsed from the yaml files
+        known_domains(container): Names of the domains in the state
+
+    Returns:
+        errors(array): Description of each problem found, empty if the spec can be applied
+    """
+
+    actions = parsed_yaml_data.get('actions') if isinstance(parsed_yaml_data, dict) else None
+    if not isinstance(actions, list):
+        return ['actions attribute is required']
+
+    errors = []
+    well_formed = []
+    for index, action in enumerate(actions):
+        action_errors = check_action(index, action)
+        errors.extend(action_errors)
+        if action_errors == []:
+            well_formed.append(action)
+
+    identifiers = {}
+    for action in actions:
+        if isinstance(action, dict) and isinstance(action.get('identifier'), str):
+            identifiers[action['identifier']] = identifiers.get(action['identifier'], 0) + 1
+
+    for identifier, count in identifiers.items():
+        if identifier != '' and count > 1:
+            errors.append(f'{identifier}: identifier is used by {count} actions')
+
+    declared_domains = set()
+    for action in actions:
+        if isinstance(action, dict) and action.get('resource') == 'DO_DOMAIN' and isinstance(action.get('properties'), dict):
+            declared_domains.add(action['properties'].get('name'))
+
+    for action in well_formed:
+        for identifier in scheduler.get_depends_on(action):
+            if identifier not in identifiers:
+                errors.append(f"{action['identifier']}: depends on unknown identifier {identifier}")
+
+        if action['resource'] == 'DO_DNS_RECORD':
+            domain_name = action['properties']['domain']
+            if domain_name not in declared_domains and domain_name not in known_domains:
+                errors.append(f"{action['identifier']}: domain {domain_name} is not created by a DO_DOMAIN action or in the state")
+
+    # INFO Cycles can only be looked for once every action and dependency is known
+    if errors != []:
+        return errors
+
+    try:
+        scheduler.build_graph(actions)
+    except ValueError as e:
+        errors.append(str(e))
+
+    return errors
@@ -0,0 +1,103 @@
+import os
+import time
+from apis import actions
+from apis import inventory
+from apis import spec
+from apis import state
+
+# INFO Settings of --watch. The spec files are checked every interval seconds and applied incrementally when they
+# change. Every resync seconds every action is compared against Digital Ocean again, to detect and repair drift.
+# The state and the inventory are kept between applies and loaded again at each resync
+
+config = {
+    'interval': 2,
+    'resync': 5 * 60
+}
+
+
+def configure(interval=None, resync=None):
+    """
+    Changes the settings of watch mode
+
+    Parameters:
+        interval(float): Seconds between two checks of the spec files
+        resync(float): Seconds between two applies that compare every action against Digital Ocean
+    """
+
+    if interval != None:
+        config['interval'] = interval
+    if resync != None:
+        config['resync'] = resync
+
+
+def spec_signature(paths):
+    """
+    Returns the name, modification time and size of every spec file. Directories and glob
+    patterns are expanded again, so that added and removed files are noticed too
+    """
+
+    signature = []
+
+    for filename in spec.expand_paths(paths):
+        try:
+            stat = os.stat(filename)
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((filename, None, None))
+
+    return tuple(signature)
+
+
+def watch(paths, parallelism=1, engine='sync', targets=None):
+    """
+    Applies the spec, then keeps the process running and applies it again whenever a spec file changes.
+    Applies triggered by a change only send requests for the actions that changed and the actions that
+    depend on them, and only list the droplets, domains and zones those actions are compared against.
+    The first apply and one every config['resync'] seconds compare every action against a fresh listing
+
+    Parameters:
+        paths(array): Files, directories or glob patterns of the spec
+        parallelism(int): Maximum number of actions running at once
+        engine(str): 'sync' or 'async'
+        targets(array): Identifiers or glob patterns of the actions to apply, None for every action
+    """
+
+    signature = None
+    last_resync = None
+    curr_state = None
+    remote_inventory = None
+
+    print(f"Watching {', '.join(paths)}, press Ctrl+C to stop")
+
+    try:
+        while True:
+            now = time.monotonic()
+            current = spec_signature(paths)
+            resync = last_resync == None or now - last_resync >= config['resync']
+
+            if current != signature or resync:
+                signature = current
+
+                print(f"\n{time.strftime('%Y-%m-%d %H:%M:%S')} {'Comparing every action' if resync else 'Spec changed, applying changed actions'}")
+
+                try:
+                    if resync:
+                        curr_state = state.State.load()
+                        remote_inventory = inventory.Inventory(os.environ['DO_PAO'])
+
+                    parsed_data = spec.load(paths)
+                    actions.create_resources(parsed_data, parallelism=parallelism, engine=engine, incremental=not resync, targets=targets,
+                                             curr_state=curr_state, remote_inventory=remote_inventory)
+                except spec.SpecError as e:
+                    print('Errors Detected in Yaml File.')
+                    print(e)
+                except Exception as e:
+                    # INFO A failed apply, e.g. while the API is unreachable, is retried on the next change or resync
+                    print(f'Apply failed: {e}')
+
+                if resync:
+                    last_resync = now
+
+            time.sleep(config['interval'])
+    except KeyboardInterrupt:
+        print('\nStopped watching')
@@ -1,28 +1,17 @@
-import requests
 import os
 import sys
-import yaml
 import argparse
 from apis import actions
-
-def parse_yaml_file(filename):
-   """
-   Takes a yaml file and parses its contents
-
-   Parameters:
-      filename(str): Name of the yaml file
-
-   Returns:
-      parsed_data(dict): Parsed Dictionary from the yaml file
-   """
-
-   with open(filename) as stream:
-      try:
-         parsed_data = yaml.safe_load(stream)
-      except yaml.YAMLError as e:
-         print(e)
-
-   return parsed_data
+from apis import catalog
+from apis import client
+from apis import poller
+from apis import rollout
+from apis import governor
+from apis import importer
+from apis import state
+from apis import spec
+from apis import tracing
+from apis import watch
 
 def get_personal_access_token():
    """
@@ -42,6 +31,26 @@ def get_personal_access_token():
       print("Please set the environment variable DO_PAO")
       sys.exit(1)
 
+def parse_duration(value):
+   """
+   Parses a duration such as 90, 90s, 15m, 12h or 7d
+
+   Parameters:
+      value(str): Duration given on the command line
+
+   Returns:
+      seconds(float): Duration in seconds
+   """
+
+   units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+   try:
+      if value[-1:] in units:
+         return float(value[:-1]) * units[value[-1]]
+      return float(value)
+   except ValueError:
+      raise argparse.ArgumentTypeError(f"invalid duration: {value}")
+
 # INFO Get an input file from the user to parse
 
 def main():
@@ -49,27 +58,103 @@ def main():
 
    parser.add_argument("-d","--delete",action="store_true", help="delete the resources based on the current state file")
 
-   parser.add_argument("-f","--file",type=str, help="Specify a path to the yaml file to read as input")
+   parser.add_argument("--import",dest="import_resources",action="store_true", help="Record the droplets, domains and dns records of the spec that already exist in Digital Ocean in the state file, matched by name, without creating or changing anything")
+
+   parser.add_argument("-f","--file",action="append", help="Specify a path to the yaml file to read as input. Can be given more than once, and accepts directories and glob patterns which are loaded as one spec")
+
+   parser.add_argument("--no-spec-cache",action="store_true", help="Always parse the yaml files instead of using the cached actions in .tellurian-cache")
+
+   parser.add_argument("-p","--parallelism",type=int, default=1, help="Maximum number of independent actions to run at the same time")
+
+   parser.add_argument("--engine",choices=["sync","async"], default="sync", help="Run actions on a thread pool (sync) or on an asyncio event loop (async, requires aiohttp)")
+
+   parser.add_argument("--poll-deadline",type=int, default=600, help="Seconds to wait for a Digital Ocean action such as a droplet create to finish")
+
+   parser.add_argument("--pool-size",type=int, default=20, help="Maximum number of keep-alive connections to the Digital Ocean API")
+
+   parser.add_argument("--requests-per-minute",type=int, default=250, help="Sustained rate of requests sent to the Digital Ocean API")
+
+   parser.add_argument("--timeout",type=int, default=30, help="Timeout in seconds for each Digital Ocean API request")
+
+   parser.add_argument("--trust-state-for",type=parse_duration, default=0, help="Skip actions without calling the API when their properties are unchanged since they were last applied or verified less than this long ago, e.g. 30m or 12h")
+
+   parser.add_argument("--state-backend",choices=["file","sqlite"], help="Keep the state in tellurian.tlstate (file) or in the tellurian.tlstate.db SQLite database (sqlite). An existing tellurian.tlstate is migrated the first time sqlite is used. Defaults to sqlite if the database exists")
+
+   parser.add_argument("--max-disrupted",type=int, default=1, help="Maximum number of existing droplets powered off, resized or rebuilt at the same time when their size or image changes")
+
+   parser.add_argument("--catalog-ttl",type=parse_duration, default=24 * 60 * 60, help="How long the region, size and image catalog used to check droplets before the run is kept in .tellurian-cache, e.g. 6h. Defaults to 1d")
+
+   parser.add_argument("--refresh-catalog",action="store_true", help="Fetch the region, size and image catalog again even if it has not expired")
+
+   parser.add_argument("--no-read-cache",action="store_true", help="Send every GET to the Digital Ocean API instead of sharing identical reads within the run")
+
+   parser.add_argument("--target",action="append", metavar="IDENTIFIER", help="Only apply or delete the action or state entry with this identifier, together with what it depends on (apply) or what depends on it (delete). Can be given more than once and accepts glob patterns such as 'web-*'")
+
+   parser.add_argument("--watch",action="store_true", help="Keep running and apply the spec again whenever a yaml file changes, only sending requests for the actions that changed")
+
+   parser.add_argument("--watch-interval",type=parse_duration, default=2, help="How often the yaml files are checked for changes in watch mode. Defaults to 2s")
+
+   parser.add_argument("--resync-every",type=parse_duration, default=5 * 60, help="How often watch mode compares every action against Digital Ocean to detect drift, e.g. 15m. Defaults to 5m")
+
+   parser.add_argument("--profile",metavar="FILE", help="Trace every API request and every phase of each action, write the trace to FILE (open it in chrome://tracing or ui.perfetto.dev) and print the slowest actions and endpoints")
 
    args = parser.parse_args()
 
    DO_PAO = get_personal_access_token()
 
+   client.configure(pool_size=max(args.pool_size, args.parallelism), timeout=args.timeout, read_cache=not args.no_read_cache)
+   poller.configure(deadline=args.poll_deadline)
+   governor.configure(requests_per_minute=args.requests_per_minute)
+   state.configure(backend=args.state_backend, trust_for=args.trust_state_for)
+
+   spec.configure(cache=not args.no_spec_cache)
+   catalog.configure(ttl=args.catalog_ttl, refresh=args.refresh_catalog)
+   rollout.configure(max_disrupted=args.max_disrupted)
+   watch.configure(interval=args.watch_interval, resync=args.resync_every)
+
+   if args.watch and args.delete:
+      parser.error("--watch cannot be used with --delete")
+
+   if args.import_resources and (args.delete or args.watch):
+      parser.error("--import cannot be used with --delete or --watch")
+
    if args.file:
-      parse_file = args.file
+      parse_files = args.file
    else:
-      parse_file = "tellurian.yml"
+      parse_files = ["tellurian.yml"]
+
+   if args.profile:
+      tracing.enable()
+
+   try:
+      run(args, parse_files)
+   finally:
+      if args.profile:
+         tracing.write(args.profile)
+         print(f'\nProfile written to {args.profile}')
+         print('\n'.join(tracing.summary()))
 
+
+def run(args, parse_files):
    if args.delete:
-      actions.delete_resources()
+      actions.delete_resources(parallelism=args.parallelism, engine=args.engine, targets=args.target)
+   elif args.watch:
+      watch.watch(parse_files, parallelism=args.parallelism, engine=args.engine, targets=args.target)
    else:
       try:
-         print(f'Reading {parse_file}')
-         parsed_data = parse_yaml_file(parse_file)
-         print(f'{parse_file} read successfully')
-         actions.create_resources(parsed_data)
-      except yaml.YAMLError as e:
+         print(f'Reading {", ".join(parse_files)}')
+         with tracing.span('load spec', 'phase', files=parse_files):
+            parsed_data = spec.load(parse_files)
+         print(f'{", ".join(parse_files)} read successfully')
+      except spec.SpecError as e:
          print('Errors Detected in Yaml File.')
+         print(e)
+         sys.exit(1)
+
+      if args.import_resources:
+         importer.import_resources(parsed_data, parallelism=args.parallelism, targets=args.target)
+      else:
+         actions.create_resources(parsed_data, parallelism=args.parallelism, engine=args.engine, targets=args.target)
 
 
 
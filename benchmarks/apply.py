@@ -0,0 +1,193 @@
+"""
+Benchmarks create_resources and delete_resources against the local API simulator on synthetic specs.
+
+Usage:
+    python benchmarks/apply.py [--sizes 10 100 1000] [--engines sync async] [--parallelism 16]
+                               [--latency 0.02] [--action-duration 1] [--throttle-rate 0] [--error-rate 0] [--json FILE]
+
+Each size and engine runs in a fresh interpreter against its own simulator process, in a temporary directory
+so that the state files start empty. Three phases are measured: the first apply, a second apply of the same
+spec where every action is already up to date, and the delete. For each phase the wall time, the number of
+requests the simulator served (including 429s and injected errors) and the peak RSS of the run are reported.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATOR = os.path.join(ROOT, 'benchmarks', 'simulator.py')
+
+
+def synthetic_spec(size):
+    """
+    Builds a spec of `size` actions: one domain for every 50 actions, then 40% droplets with the
+    same size, image and region, and the rest A records spread over the domains
+
+    Returns:
+        parsed_data(dict): {'actions': [...]}
+    """
+
+    domain_count = max(1, size // 50)
+    droplet_count = (size - domain_count) * 2 // 5
+    record_count = size - domain_count - droplet_count
+
+    actions = []
+    for index in range(domain_count):
+        actions.append({
+            'resource': 'DO_DOMAIN',
+            'identifier': f'domain-{index}',
+            'properties': {'name': f'bench-{index}.example.com'}
+        })
+
+    for index in range(droplet_count):
+        actions.append({
+            'resource': 'DO_DROPLET',
+            'identifier': f'web-{index}',
+            'properties': {'name': f'web-{index}', 'region': 'nyc3', 'size': 's-1vcpu-1gb', 'image': 'ubuntu-22-04-x64'}
+        })
+
+    for index in range(record_count):
+        actions.append({
+            'resource': 'DO_DNS_RECORD',
+            'identifier': f'record-{index}',
+            'properties': {'domain': f'bench-{index % domain_count}.example.com', 'type': 'A', 'name': f'host-{index}', 'data': f'10.1.{index // 256 % 256}.{index % 256}'}
+        })
+
+    return {'actions': actions}
+
+
+def simulator_stats(base_url):
+    with urllib.request.urlopen(base_url.replace('/v2', '/__stats')) as response:
+        stats = json.load(response)
+
+    return sum(stats['requests'].values()), stats['throttled'], stats['errors']
+
+
+def peak_rss_mb():
+    # INFO ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_case(args):
+    """
+    Runs the phases of one size and engine inside this interpreter and prints the results as JSON
+    """
+
+    sys.path.insert(0, ROOT)
+    from apis import actions
+    from apis import client
+    from apis import governor
+
+    simulator = subprocess.Popen([
+        sys.executable, SIMULATOR, '--port', '0',
+        '--latency', str(args.latency),
+        '--action-duration', str(args.action_duration),
+        '--requests-per-minute', str(args.requests_per_minute),
+        '--throttle-rate', str(args.throttle_rate),
+        '--error-rate', str(args.error_rate)
+    ], stdout=subprocess.PIPE, text=True)
+
+    try:
+        base_url = simulator.stdout.readline().split()[-1]
+
+        os.environ['DO_PAO'] = 'benchmark'
+        client.configure(base_url=base_url, pool_size=max(20, args.parallelism))
+        governor.configure(requests_per_minute=args.requests_per_minute)
+
+        spec = synthetic_spec(args.case)
+        phases = [
+            ('apply', lambda: actions.create_resources(spec, parallelism=args.parallelism, engine=args.engine)),
+            ('no-op apply', lambda: actions.create_resources(spec, parallelism=args.parallelism, engine=args.engine)),
+            ('delete', lambda: actions.delete_resources(parallelism=args.parallelism, engine=args.engine))
+        ]
+
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+
+            for phase, run in phases:
+                requests_before, throttled_before, errors_before = simulator_stats(base_url)
+
+                start = time.perf_counter()
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    run()
+                elapsed = time.perf_counter() - start
+
+                requests_after, throttled_after, errors_after = simulator_stats(base_url)
+
+                results.append({
+                    'actions': args.case,
+                    'engine': args.engine,
+                    'phase': phase,
+                    'seconds': round(elapsed, 3),
+                    'requests': requests_after - requests_before,
+                    'throttled': throttled_after - throttled_before,
+                    'errors': errors_after - errors_before,
+                    'peak_rss_mb': round(peak_rss_mb(), 1)
+                })
+
+            os.chdir(ROOT)
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='Number of actions of each synthetic spec')
+    parser.add_argument('--engines', nargs='+', choices=['sync', 'async'], default=['sync'])
+    parser.add_argument('--parallelism', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added by the simulator to every response')
+    parser.add_argument('--action-duration', type=float, default=1.0, help='Seconds before a simulated action completes')
+    parser.add_argument('--requests-per-minute', type=int, default=100000, help='Rate limit of the simulator and of the client')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with a 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--case', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--engine', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case != None:
+        return run_case(args)
+
+    options = [
+        '--parallelism', str(args.parallelism),
+        '--latency', str(args.latency),
+        '--action-duration', str(args.action_duration),
+        '--requests-per-minute', str(args.requests_per_minute),
+        '--throttle-rate', str(args.throttle_rate),
+        '--error-rate', str(args.error_rate)
+    ]
+
+    print(f"{'actions':>8} {'engine':>7} {'phase':>12} {'seconds':>9} {'requests':>9} {'429s':>6} {'errors':>7} {'peak MB':>8}")
+
+    results = []
+    for engine in args.engines:
+        for size in args.sizes:
+            output = subprocess.run([sys.executable, __file__, '--case', str(size), '--engine', engine] + options, capture_output=True, text=True)
+            if output.returncode != 0:
+                print(output.stderr)
+                sys.exit(1)
+
+            for result in json.loads(output.stdout.splitlines()[-1]):
+                results.append(result)
+                print(f"{result['actions']:>8} {result['engine']:>7} {result['phase']:>12} {result['seconds']:>9.2f} {result['requests']:>9} {result['throttled']:>6} {result['errors']:>7} {result['peak_rss_mb']:>8.1f}")
+
+    if args.json != None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
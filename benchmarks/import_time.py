@@ -0,0 +1,106 @@
+"""
+Measures how long the CLI takes to start, and checks that slow modules are not imported before they are needed.
+
+Usage:
+    python benchmarks/import_time.py [--runs 20] [--max-ms 60]
+
+Exits with 1 if the median import time of app.py is above --max-ms or if a module of LAZY_MODULES is imported
+by app.py itself. Each run is a fresh interpreter, so the numbers include reading the .pyc files but not
+the interpreter's own startup.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# INFO Modules that must only be imported once a run needs them
+
+LAZY_MODULES = [
+    'requests',
+    'yaml',
+    'asyncio',
+    'aiohttp',
+    'sqlite3',
+    'apis.domain',
+    'apis.droplets',
+    'apis.dns',
+    'apis.async_engine',
+    'apis.sqlite_state'
+]
+
+
+def import_profile():
+    """
+    Imports app.py in a new interpreter with -X importtime
+
+    Returns:
+        total(float): Cumulative import time of app.py in milliseconds
+        modules(set): Names of the modules imported by app.py
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    total = None
+    modules = set()
+    importing_app = False
+
+    # INFO Lines are "import time: self | cumulative | name", children are printed before their parent
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+
+        if name == 'site':
+            importing_app = True
+            continue
+
+        if importing_app:
+            modules.add(name)
+
+        if name == 'app':
+            total = int(cumulative_us) / 1000
+
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20, help='Number of interpreters to start')
+    parser.add_argument('--max-ms', type=float, default=60, help='Highest acceptable median import time of app.py')
+    args = parser.parse_args()
+
+    # INFO The first run compiles the .pyc files and is not counted
+    import_profile()
+
+    times = []
+    modules = set()
+    for run in range(args.runs):
+        total, imported = import_profile()
+        times.append(total)
+        modules |= imported
+
+    median = statistics.median(times)
+    print(f'import app: median {median:.1f}ms, min {min(times):.1f}ms, max {max(times):.1f}ms over {args.runs} runs')
+
+    failed = False
+
+    eager = [module for module in LAZY_MODULES if module in modules]
+    if eager != []:
+        print(f"Imported at startup: {', '.join(eager)}")
+        failed = True
+
+    if median > args.max_ms:
+        print(f'Median import time is above {args.max_ms}ms')
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,463 @@
+"""
+Local stand-in for the parts of the Digital Ocean API used by tellurian: /v2/droplets, /v2/droplets/{id}/actions,
+/v2/domains, /v2/domains/{name}/records, /v2/actions and the /v2/regions, /v2/sizes and /v2/images catalog.
+Nothing is persisted and any token is accepted.
+
+Usage:
+    python benchmarks/simulator.py [--port 8765] [--latency 0.02] [--action-duration 1] [--max-per-page 200]
+                                   [--requests-per-minute 5000] [--throttle-rate 0] [--error-rate 0] [--seed 1]
+
+Point the client at it with client.configure(base_url='http://127.0.0.1:8765/v2'). GET /__stats returns the
+number of requests served by method and endpoint, and the number of 429 and 500 responses.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# INFO Catalog of the simulated account. Droplets can only be created with these slugs
+
+REGIONS = ['nyc1', 'nyc3', 'sfo3', 'ams3', 'fra1']
+SIZES = ['s-1vcpu-1gb', 's-1vcpu-2gb', 's-2vcpu-2gb', 's-2vcpu-4gb', 's-4vcpu-8gb']
+IMAGES = ['ubuntu-22-04-x64', 'ubuntu-24-04-x64', 'debian-12-x64', 'fedora-39-x64']
+
+
+class Simulator:
+    """
+    In-memory account served over HTTP
+
+    Parameters:
+        latency(float): Seconds added to every response
+        action_duration(float): Seconds an action stays in-progress before it completes
+        max_per_page(int): Largest page size served, smaller per_page values are honoured
+        requests_per_minute(int): Rate limit of the account. Requests above it get a 429 until the window resets
+        throttle_rate(float): Share of requests answered with a 429 regardless of the rate limit
+        error_rate(float): Share of requests answered with a 500
+        seed(int): Seed of the random choices of throttle_rate and error_rate
+    """
+
+    def __init__(self, latency=0.0, action_duration=1.0, max_per_page=200, requests_per_minute=5000, throttle_rate=0.0, error_rate=0.0, seed=1):
+        self.latency = latency
+        self.action_duration = action_duration
+        self.max_per_page = max_per_page
+        self.requests_per_minute = requests_per_minute
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.next_id = 1000
+        self.droplets = {}
+        self.domains = {}
+        self.records = {}
+        self.actions = {}
+
+        self.window_start = time.time()
+        self.window_count = 0
+        self.stats = {'requests': {}, 'throttled': 0, 'errors': 0}
+
+        self.server = None
+        self.base_url = None
+
+    def start(self, port=0):
+        """
+        Serves the API on a background thread
+
+        Returns:
+            base_url(str): Root url of the simulated API
+        """
+
+        handler = type('Handler', (RequestHandler,), {'simulator': self})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/v2'
+
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def new_action(self, action_type, resource_id, on_complete=None):
+        action = {
+            'id': self.new_id(),
+            'type': action_type,
+            'resource_id': resource_id,
+            'resource_type': 'droplet',
+            'started_at': time.time(),
+            'on_complete': on_complete
+        }
+        self.actions[action['id']] = action
+        return action
+
+    def action_json(self, action):
+        status = 'in-progress'
+        if time.time() - action['started_at'] >= self.action_duration:
+            status = 'completed'
+            if action['on_complete'] != None:
+                action['on_complete']()
+                action['on_complete'] = None
+
+        return {
+            'id': action['id'],
+            'status': status,
+            'type': action['type'],
+            'resource_id': action['resource_id'],
+            'resource_type': action['resource_type']
+        }
+
+    def admit(self):
+        """
+        Applies the rate limit and the injected failures to a request
+
+        Returns:
+            status(int): 429 or 500 if the request is rejected, otherwise None
+            headers(dict): Rate limit headers of the response
+        """
+
+        now = time.time()
+        if now - self.window_start >= 60:
+            self.window_start = now
+            self.window_count = 0
+
+        self.window_count += 1
+        reset = int(self.window_start + 60)
+        headers = {
+            'ratelimit-limit': str(self.requests_per_minute),
+            'ratelimit-remaining': str(max(self.requests_per_minute - self.window_count, 0)),
+            'ratelimit-reset': str(reset)
+        }
+
+        if self.window_count > self.requests_per_minute:
+            headers['retry-after'] = str(max(reset - int(now), 1))
+            return 429, headers
+
+        if self.throttle_rate > 0 and self.random.random() < self.throttle_rate:
+            headers['retry-after'] = '1'
+            return 429, headers
+
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            return 500, headers
+
+        return None, headers
+
+    def page(self, path, query, key, items):
+        """
+        Returns one page of a listing with a links.pages.next url when there are more items
+        """
+
+        per_page = min(int(query.get('per_page', ['20'])[0]), self.max_per_page)
+        page = int(query.get('page', ['1'])[0])
+
+        body = {
+            key: items[(page - 1) * per_page:page * per_page],
+            'links': {},
+            'meta': {'total': len(items)}
+        }
+
+        if page * per_page < len(items):
+            next_query = {name: values[0] for name, values in query.items()}
+            next_query['page'] = page + 1
+            next_query['per_page'] = per_page
+            body['links']['pages'] = {'next': f"{self.base_url}{path}?" + '&'.join(f'{name}={value}' for name, value in next_query.items())}
+
+        return body
+
+    def droplet_json(self, droplet_id, name, body):
+        return {
+            'id': droplet_id,
+            'name': name,
+            'status': 'new',
+            'image': {'slug': body.get('image')},
+            'size': {'slug': body.get('size')},
+            'region': {'slug': body.get('region')},
+            'tags': body.get('tags') or [],
+            'networks': {
+                'v4': [{'type': 'public', 'ip_address': f'10.{droplet_id // 65536 % 256}.{droplet_id // 256 % 256}.{droplet_id % 256}'}],
+                'v6': []
+            }
+        }
+
+    def record_json(self, domain_name, record_type, name, data):
+        record = {
+            'id': self.new_id(),
+            'type': record_type,
+            'name': name,
+            'data': data,
+            'ttl': 1800
+        }
+        self.records[record['id']] = (domain_name, record)
+        return record
+
+    def handle(self, method, path, query, body):
+        """
+        Routes a request
+
+        Returns:
+            status(int): Status code of the response
+            body(dict): JSON body of the response, None for an empty body
+        """
+
+        if method == 'GET' and path == '/v2/regions':
+            items = [{'slug': slug, 'name': slug, 'available': True, 'sizes': SIZES, 'features': []} for slug in REGIONS]
+            return 200, self.page('/regions', query, 'regions', items)
+
+        if method == 'GET' and path == '/v2/sizes':
+            items = [{'slug': slug, 'available': True, 'regions': REGIONS} for slug in SIZES]
+            return 200, self.page('/sizes', query, 'sizes', items)
+
+        if method == 'GET' and path == '/v2/images':
+            items = [{'id': index + 1, 'slug': slug, 'type': 'base', 'distribution': slug.split('-')[0], 'regions': REGIONS} for index, slug in enumerate(IMAGES)]
+            return 200, self.page('/images', query, 'images', items)
+
+        if method == 'GET' and path == '/v2/actions':
+            items = [self.action_json(action) for action in sorted(self.actions.values(), key=lambda a: -a['id'])]
+            return 200, self.page('/actions', query, 'actions', items)
+
+        match = re.fullmatch(r'/v2/actions/(\d+)', path)
+        if method == 'GET' and match:
+            action = self.actions.get(int(match.group(1)))
+            if action == None:
+                return not_found()
+            return 200, {'action': self.action_json(action)}
+
+        if path == '/v2/droplets':
+            if method == 'GET':
+                return 200, self.page('/droplets', query, 'droplets', list(self.droplets.values()))
+
+            if method == 'POST':
+                if body.get('region') not in REGIONS or body.get('size') not in SIZES or body.get('image') not in IMAGES:
+                    return 422, {'id': 'unprocessable_entity', 'message': 'You specified an invalid region, size or image for Droplet creation.'}
+
+                names = body.get('names', [body.get('name')])
+                created = []
+                links = []
+                for name in names:
+                    droplet = self.droplet_json(self.new_id(), name, body)
+                    self.droplets[droplet['id']] = droplet
+                    action = self.new_action('create', droplet['id'], on_complete=lambda droplet=droplet: droplet.update(status='active'))
+                    created.append(droplet)
+                    links.append({'id': action['id'], 'rel': 'create', 'href': f"{self.base_url}/actions/{action['id']}"})
+
+                if 'names' in body:
+                    return 202, {'droplets': created, 'links': {'actions': links}}
+                return 202, {'droplet': created[0], 'links': {'actions': links}}
+
+        match = re.fullmatch(r'/v2/droplets/(\d+)', path)
+        if match:
+            droplet_id = int(match.group(1))
+            if droplet_id not in self.droplets:
+                return not_found()
+            if method == 'GET':
+                return 200, {'droplet': self.droplets[droplet_id]}
+            if method == 'DELETE':
+                del self.droplets[droplet_id]
+                return 204, None
+
+        match = re.fullmatch(r'/v2/droplets/(\d+)/actions', path)
+        if match and method == 'POST':
+            droplet = self.droplets.get(int(match.group(1)))
+            if droplet == None:
+                return not_found()
+
+            # INFO Like the real API, a droplet has to be off to be resized and a rebuild boots it
+            if body['type'] == 'resize' and droplet['status'] != 'off':
+                return 422, {'id': 'unprocessable_entity', 'message': 'Droplet must be powered off to resize.'}
+            if body['type'] == 'power_on' and droplet['status'] == 'active':
+                return 422, {'id': 'unprocessable_entity', 'message': 'Droplet is already powered on.'}
+
+            def complete():
+                if body['type'] == 'rebuild':
+                    droplet['image'] = {'slug': body.get('image')}
+                    droplet['status'] = 'active'
+                if body['type'] == 'resize':
+                    droplet['size'] = {'slug': body.get('size')}
+                if body['type'] == 'enable_ipv6':
+                    droplet['networks']['v6'] = [{'type': 'public', 'ip_address': f"2001:db8::{droplet['id']:x}"}]
+                if body['type'] == 'power_off':
+                    droplet['status'] = 'off'
+                if body['type'] == 'power_on':
+                    droplet['status'] = 'active'
+
+            action = self.new_action(body['type'], droplet['id'], on_complete=complete)
+            return 201, {'action': self.action_json(action)}
+
+        if path == '/v2/domains':
+            if method == 'GET':
+                return 200, self.page('/domains', query, 'domains', list(self.domains.values()))
+
+            if method == 'POST':
+                if body['name'] in self.domains:
+                    return 422, {'id': 'unprocessable_entity', 'message': 'Name already exists'}
+
+                self.domains[body['name']] = {'name': body['name'], 'ttl': 1800, 'zone_file': ''}
+                for ns in ('ns1', 'ns2', 'ns3'):
+                    self.record_json(body['name'], 'NS', '@', f'{ns}.digitalocean.com')
+                if body.get('ip_address') != None:
+                    self.record_json(body['name'], 'A', '@', body['ip_address'])
+
+                return 201, {'domain': self.domains[body['name']]}
+
+        match = re.fullmatch(r'/v2/domains/([^/]+)', path)
+        if match:
+            domain_name = match.group(1)
+            if domain_name not in self.domains:
+                return not_found()
+            if method == 'GET':
+                return 200, {'domain': self.domains[domain_name]}
+            if method == 'DELETE':
+                del self.domains[domain_name]
+                for record_id in [record_id for record_id, (owner, record) in self.records.items() if owner == domain_name]:
+                    del self.records[record_id]
+                return 204, None
+
+        match = re.fullmatch(r'/v2/domains/([^/]+)/records', path)
+        if match:
+            domain_name = match.group(1)
+            if domain_name not in self.domains:
+                return not_found()
+
+            if method == 'GET':
+                record_type = query.get('type', [None])[0]
+                record_name = query.get('name', [None])[0]
+                items = []
+                for owner, record in self.records.values():
+                    if owner != domain_name or (record_type != None and record['type'] != record_type):
+                        continue
+                    # INFO The name filter takes the full name of the record, as in the real API
+                    full_name = domain_name if record['name'] == '@' else f"{record['name']}.{domain_name}"
+                    if record_name != None and full_name != record_name:
+                        continue
+                    items.append(record)
+                return 200, self.page(f'/domains/{domain_name}/records', query, 'domain_records', items)
+
+            if method == 'POST':
+                return 201, {'domain_record': self.record_json(domain_name, body['type'], body['name'], body['data'])}
+
+        match = re.fullmatch(r'/v2/domains/([^/]+)/records/(\d+)', path)
+        if match:
+            entry = self.records.get(int(match.group(2)))
+            if entry == None or entry[0] != match.group(1):
+                return not_found()
+            if method == 'GET':
+                return 200, {'domain_record': entry[1]}
+            if method == 'PUT':
+                entry[1].update({key: value for key, value in body.items() if key in ('type', 'name', 'data', 'ttl')})
+                return 200, {'domain_record': entry[1]}
+            if method == 'DELETE':
+                del self.records[int(match.group(2))]
+                return 204, None
+
+        return not_found()
+
+
+def not_found():
+    return 404, {'id': 'not_found', 'message': 'The resource you were accessing could not be found.'}
+
+
+def endpoint(path):
+    """
+    Returns the route of a path with ids and names replaced, e.g. /v2/domains/{name}/records/{id}
+    """
+
+    path = re.sub(r'/v2/domains/[^/]+', '/v2/domains/{name}', path)
+    return re.sub(r'/\d+', '/{id}', path)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    simulator = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body, headers=None):
+        payload = b'' if body == None else json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def dispatch(self, method):
+        simulator = self.simulator
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length > 0 else {}
+
+        if url.path == '/__stats':
+            with simulator.lock:
+                return self.respond(200, simulator.stats)
+
+        if simulator.latency > 0:
+            time.sleep(simulator.latency)
+
+        with simulator.lock:
+            key = f'{method} {endpoint(url.path)}'
+            simulator.stats['requests'][key] = simulator.stats['requests'].get(key, 0) + 1
+
+            rejected, headers = simulator.admit()
+            if rejected == 429:
+                simulator.stats['throttled'] += 1
+                return self.respond(429, {'id': 'too_many_requests', 'message': 'API Rate limit exceeded.'}, headers)
+            if rejected == 500:
+                simulator.stats['errors'] += 1
+                return self.respond(500, {'id': 'server_error', 'message': 'Unexpected server-side error'}, headers)
+
+            status, response = simulator.handle(method, url.path, query, body)
+
+        self.respond(status, response, headers)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--action-duration', type=float, default=1.0, help='Seconds before an action completes')
+    parser.add_argument('--max-per-page', type=int, default=200, help='Largest page size served')
+    parser.add_argument('--requests-per-minute', type=int, default=5000, help='Rate limit of the simulated account')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with a 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    simulator = Simulator(args.latency, args.action_duration, args.max_per_page, args.requests_per_minute, args.throttle_rate, args.error_rate, args.seed)
+    print(f'Listening on {simulator.start(args.port)}', flush=True)
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
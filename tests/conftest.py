@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# INFO The apis package is imported from the repository root, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs a test in an empty directory, where the state files are written
+    """
+
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,102 @@
+import pytest
+
+from apis import actions
+from apis import async_client
+from apis import client
+from apis import governor
+from apis import poller
+from apis import state
+from benchmarks.simulator import Simulator
+
+ENGINES = ['sync', pytest.param('async', marks=pytest.mark.skipif(not async_client.is_available(), reason='aiohttp is not installed'))]
+
+
+def spec(record_data='10.0.0.1'):
+    return {'actions': [
+        {'resource': 'DO_DOMAIN', 'identifier': 'dom', 'properties': {'name': 'ex.com'}},
+        {'resource': 'DO_DNS_RECORD', 'identifier': 'www', 'properties': {'domain': 'ex.com', 'type': 'A', 'name': 'www', 'data': record_data}},
+        {'resource': 'DO_DNS_RECORD', 'identifier': 'api', 'properties': {'domain': 'ex.com', 'type': 'A', 'name': 'api', 'data': '10.0.0.2'}},
+        {'resource': 'DO_DROPLET', 'identifier': 'web-1', 'properties': {'name': 'web-1', 'region': 'nyc3', 'size': 's-1vcpu-1gb', 'image': 'ubuntu-22-04-x64'}},
+        {'resource': 'DO_DROPLET', 'identifier': 'web-2', 'depends_on': 'dom', 'properties': {'name': 'web-2', 'region': 'nyc3', 'size': 's-1vcpu-1gb', 'image': 'ubuntu-22-04-x64'}}
+    ]}
+
+
+@pytest.fixture
+def simulator(workdir, monkeypatch):
+    """
+    Points the client at a simulated account served from this process, with actions completing quickly
+    """
+
+    simulator = Simulator(action_duration=0.05)
+    base_url = simulator.start()
+
+    original_base_url = client.config['base_url']
+    original_requests_per_minute = governor.config['requests_per_minute']
+
+    monkeypatch.setenv('DO_PAO', 'test')
+    monkeypatch.setitem(poller.config, 'initial_interval', 0.05)
+    monkeypatch.setitem(poller.config, 'max_interval', 0.1)
+    client.configure(base_url=base_url)
+    governor.configure(requests_per_minute=5000)
+
+    yield simulator
+
+    client.configure(base_url=original_base_url)
+    governor.configure(requests_per_minute=original_requests_per_minute)
+    simulator.stop()
+
+
+def requests_of(simulator, method):
+    return sum(count for key, count in simulator.stats['requests'].items() if key.startswith(method + ' '))
+
+
+@pytest.mark.parametrize('backend', ['file', 'sqlite'])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_apply_reapply_and_delete(simulator, monkeypatch, engine, backend):
+    monkeypatch.setitem(state.config, 'backend', backend)
+
+    actions.create_resources(spec(), parallelism=4, engine=engine)
+
+    assert sorted(droplet['name'] for droplet in simulator.droplets.values()) == ['web-1', 'web-2']
+    assert sorted(record['name'] for domain_name, record in simulator.records.values() if record['type'] == 'A') == ['api', 'www']
+
+    curr_state = state.State.load()
+    assert sorted(entry.identifier for entry in curr_state) == ['api', 'dom', 'web-1', 'web-2', 'www']
+    assert sorted(entry.identifier for entry in curr_state.records_for_domain('ex.com')) == ['api', 'www']
+
+    # INFO Nothing changed, so nothing is created again
+    posts = requests_of(simulator, 'POST')
+    actions.create_resources(spec(), parallelism=4, engine=engine)
+    assert requests_of(simulator, 'POST') == posts
+    assert len(simulator.droplets) == 2
+
+    # INFO A changed record is updated in place
+    actions.create_resources(spec(record_data='10.0.0.9'), parallelism=4, engine=engine)
+    assert requests_of(simulator, 'POST') == posts
+    assert [record['data'] for domain_name, record in simulator.records.values() if record['name'] == 'www'] == ['10.0.0.9']
+
+    actions.delete_resources(parallelism=4, engine=engine)
+
+    assert simulator.droplets == {}
+    assert simulator.domains == {}
+    assert len(state.State.load()) == 0
+
+
+def test_failed_droplet_read_is_reported_without_stopping_the_run(simulator, monkeypatch):
+    monkeypatch.setitem(state.config, 'backend', 'file')
+
+    handle = simulator.handle
+
+    def failing_read(method, path, query, body):
+        if method == 'GET' and path.startswith('/v2/droplets/'):
+            return 500, {'id': 'server_error', 'message': 'Unexpected server-side error'}
+        return handle(method, path, query, body)
+
+    monkeypatch.setattr(simulator, 'handle', failing_read)
+
+    actions.create_resources(spec(), parallelism=4)
+
+    # INFO The droplets stay in state with the details recorded when the API accepted them
+    curr_state = state.State.load()
+    assert sorted(entry.identifier for entry in curr_state.of_type('DO_DROPLET')) == ['web-1', 'web-2']
+    assert sorted(entry.identifier for entry in curr_state.records_for_domain('ex.com')) == ['api', 'www']
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from apis import governor
+
+
+@pytest.fixture
+def gov(monkeypatch):
+    """
+    Governor refilling 10 tokens a second, with an empty bucket
+    """
+
+    monkeypatch.setitem(governor.config, 'requests_per_minute', 600)
+    gov = governor.Governor()
+    gov.tokens = 0
+    gov.last_refill = time.monotonic()
+    return gov
+
+
+def test_waiting_mutation_gets_the_next_token(gov):
+    gov.tokens = 1
+    gov.set_waiting(governor.PRIORITY_MUTATE, 1)
+
+    assert gov.reserve(governor.PRIORITY_POLL) > 0
+    assert gov.reserve(governor.PRIORITY_READ) > 0
+    assert gov.reserve(governor.PRIORITY_MUTATE) == 0
+
+
+def test_low_budget_holds_back_polls_before_reads(gov):
+    gov.tokens = 10
+    gov.update(200, {'ratelimit-limit': '100', 'ratelimit-remaining': '15', 'ratelimit-reset': str(int(time.time()) + 30)})
+
+    assert gov.reserve(governor.PRIORITY_POLL) > 0
+    assert gov.reserve(governor.PRIORITY_READ) == 0
+    assert gov.reserve(governor.PRIORITY_MUTATE) == 0
+
+    # INFO Held back polls are let through once they have waited reserve_wait seconds
+    assert gov.reserve(governor.PRIORITY_POLL, waited=governor.config['reserve_wait']) == 0
+
+
+def test_requests_are_served_by_priority(gov):
+    order = []
+    order_lock = threading.Lock()
+
+    def request(priority):
+        gov.acquire(priority)
+        with order_lock:
+            order.append(priority)
+
+    # INFO Polls queue up first, the mutation arriving later is still served before them
+    threads = [threading.Thread(target=request, args=(governor.PRIORITY_POLL,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+
+    mutation = threading.Thread(target=request, args=(governor.PRIORITY_MUTATE,))
+    mutation.start()
+    threads.append(mutation)
+
+    for thread in threads:
+        thread.join(5)
+
+    assert order[0] == governor.PRIORITY_MUTATE
+    assert order[1:] == [governor.PRIORITY_POLL] * 3
+
+
+def test_429_blocks_every_request_until_retry_after(gov, capsys):
+    gov.tokens = 10
+
+    assert gov.update(429, {'retry-after': '2'})
+    assert gov.reserve(governor.PRIORITY_MUTATE) > 1
+    assert not gov.update(200, {})
+
+
+def test_retry_after_accepts_seconds_and_dates():
+    assert governor.retry_after_seconds('3') == 3
+    assert governor.retry_after_seconds('Thu, 01 Jan 1970 00:00:00 GMT') == 0
+    assert governor.retry_after_seconds('soon') == None
+    assert governor.retry_after_seconds(None) == None
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from apis import scheduler
+
+
+def action(identifier, resource='DO_DROPLET', depends_on=None, **properties):
+    action = {'resource': resource, 'identifier': identifier, 'properties': properties}
+    if depends_on != None:
+        action['depends_on'] = depends_on
+    return action
+
+
+def test_records_depend_on_their_domain():
+    actions = [
+        action('www', 'DO_DNS_RECORD', domain='ex.com'),
+        action('dom', 'DO_DOMAIN', name='ex.com'),
+        action('web', depends_on='www')
+    ]
+
+    assert scheduler.build_graph(actions) == [{1}, set(), {0}]
+
+
+def test_cycle_is_reported_with_its_actions():
+    actions = [
+        action('a', depends_on=['c']),
+        action('b', depends_on=['a']),
+        action('c', depends_on=['b']),
+        action('d')
+    ]
+
+    with pytest.raises(ValueError, match='Circular dependency between: a, b, c'):
+        scheduler.build_graph(actions)
+
+
+def test_cycle_through_a_domain_is_detected():
+    actions = [
+        action('dom', 'DO_DOMAIN', depends_on='www', name='ex.com'),
+        action('www', 'DO_DNS_RECORD', domain='ex.com')
+    ]
+
+    with pytest.raises(ValueError, match='dom, www'):
+        scheduler.build_graph(actions)
+
+
+def test_self_dependency_is_not_a_cycle():
+    assert scheduler.build_graph([action('a', depends_on='a')]) == [set()]
+
+
+def test_unknown_dependency_is_reported():
+    with pytest.raises(ValueError, match='unknown identifier: b'):
+        scheduler.build_graph([action('a', depends_on='b')])
+
+
+def test_delete_graph_reverses_dependencies():
+    from apis import state
+
+    entries = [
+        state.StateEntry('dom', 'DO_DOMAIN', {'domain': {'name': 'ex.com'}}),
+        state.StateEntry('web', 'DO_DROPLET', {'id': 1}, ['dom'])
+    ]
+
+    assert scheduler.build_delete_graph(entries) == [{1}, set()]
+
+
+def test_run_follows_dependencies_and_skips_dependents_of_failures():
+    order = []
+    lock = threading.Lock()
+
+    def worker(name):
+        with lock:
+            order.append(name)
+        return name != 'b'
+
+    nodes = ['a', 'b', 'c', 'd']
+    graph = [set(), {0}, {1}, {0}]
+
+    results = scheduler.run(nodes, graph, worker, parallelism=4)
+
+    assert results == {0: 'SUCCESS', 1: 'FAILURE', 2: 'SKIPPED', 3: 'SUCCESS'}
+    assert order[0] == 'a'
+    assert 'c' not in order
+
+
+def test_run_treats_an_exception_as_a_failure(capsys):
+    def worker(name):
+        if name == 'a':
+            raise RuntimeError('boom')
+        return True
+
+    assert scheduler.run(['a', 'b'], [set(), {0}], worker) == {0: 'FAILURE', 1: 'SKIPPED'}
+    assert 'boom' in capsys.readouterr().out
+
+
+def test_run_refuses_a_cyclic_graph():
+    with pytest.raises(ValueError, match='Circular dependency'):
+        scheduler.run(['a', 'b'], [{1}, {0}], lambda node: True)
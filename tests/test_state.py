@@ -0,0 +1,218 @@
+import json
+import os
+
+import pytest
+
+from apis import state
+
+
+def droplet(identifier, droplet_id, depends_on=None):
+    return state.StateEntry(identifier, 'DO_DROPLET', {'id': droplet_id, 'name': identifier}, depends_on)
+
+
+def domain(identifier, name):
+    return state.StateEntry(identifier, 'DO_DOMAIN', {'domain': {'name': name}})
+
+
+def record(identifier, record_id, domain_name):
+    return state.StateEntry(identifier, 'DO_DNS_RECORD', {'domain_record': {'id': record_id, 'type': 'A', 'name': identifier, 'data': '10.0.0.1'}, 'domain_name': domain_name})
+
+
+def identifiers(entries):
+    return [entry.identifier for entry in entries]
+
+
+def test_journal_is_replayed_on_top_of_the_snapshot(workdir):
+    backend = state.FileBackend.load()
+    backend.put(droplet('d1', 1))
+    backend.put(droplet('d2', 2))
+    backend.save()
+
+    backend.delete(backend.get('DO_DROPLET', 1))
+    backend.put(droplet('d3', 3))
+
+    assert os.path.exists(state.JOURNAL_FILE)
+
+    backend = state.FileBackend.load()
+    assert identifiers(backend) == ['d2', 'd3']
+    assert backend.get('DO_DROPLET', 1) == None
+    assert identifiers(backend.find('d3')) == ['d3']
+
+
+def test_transaction_is_written_as_one_journal_write(workdir):
+    backend = state.FileBackend.load()
+
+    with backend.transaction():
+        backend.put(droplet('d1', 1))
+        backend.put(droplet('d2', 2))
+        assert not os.path.exists(state.JOURNAL_FILE)
+
+    with open(state.JOURNAL_FILE) as f:
+        assert [json.loads(line)['op'] for line in f] == ['put', 'put']
+
+
+def test_journal_is_compacted(workdir, monkeypatch):
+    monkeypatch.setattr(state, 'COMPACT_EVERY', 3)
+
+    backend = state.FileBackend.load()
+    for droplet_id in range(1, 4):
+        backend.put(droplet(f'd{droplet_id}', droplet_id))
+
+    assert not os.path.exists(state.JOURNAL_FILE)
+    with open(state.STATE_FILE) as f:
+        assert [entry['identifier'] for entry in json.load(f)] == ['d1', 'd2', 'd3']
+
+    backend.put(droplet('d4', 4))
+    assert identifiers(state.FileBackend.load()) == ['d1', 'd2', 'd3', 'd4']
+
+
+def test_replayed_records_count_towards_compaction(workdir, monkeypatch):
+    monkeypatch.setattr(state, 'COMPACT_EVERY', 3)
+
+    backend = state.FileBackend.load()
+    backend.put(droplet('d1', 1))
+    backend.put(droplet('d2', 2))
+
+    backend = state.FileBackend.load()
+    backend.put(droplet('d3', 3))
+
+    assert not os.path.exists(state.JOURNAL_FILE)
+    assert identifiers(state.FileBackend.load()) == ['d1', 'd2', 'd3']
+
+
+def test_journal_torn_tail_is_cut_before_new_records(workdir):
+    backend = state.FileBackend.load()
+    backend.put(droplet('d1', 1))
+
+    # INFO A crash in the middle of a write leaves half a record without its newline
+    with open(state.JOURNAL_FILE, 'a') as f:
+        f.write('{"op": "put", "entry": {"identifier": "d')
+
+    backend = state.FileBackend.load()
+    assert [entry.identifier for entry in backend] == ['d1']
+
+    backend.put(droplet('d2', 2))
+    backend.put(droplet('d3', 3))
+
+    backend = state.FileBackend.load()
+    assert [entry.identifier for entry in backend] == ['d1', 'd2', 'd3']
+
+
+def test_corrupt_snapshot_loads_as_empty_state(workdir):
+    with open(state.STATE_FILE, 'w') as f:
+        f.write('[{"identifier": ')
+
+    assert len(state.FileBackend.load()) == 0
+
+
+@pytest.fixture(params=['file', 'sqlite'])
+def open_state(request, workdir, monkeypatch):
+    """
+    Returns a function loading the state with each backend
+    """
+
+    monkeypatch.setitem(state.config, 'backend', request.param)
+    opened = []
+
+    def load():
+        curr_state = state.State.load()
+        opened.append(curr_state)
+        return curr_state
+
+    yield load
+
+    for curr_state in opened:
+        if request.param == 'sqlite':
+            curr_state.backend.conn.close()
+
+
+def test_backends_answer_lookups_alike(open_state):
+    curr_state = open_state()
+
+    with curr_state.transaction():
+        curr_state.add(domain('dom', 'ex.com'))
+        curr_state.add(domain('other', 'other.com'))
+        curr_state.add(droplet('web', 1, ['dom']))
+        curr_state.add(record('www', 7, 'ex.com'))
+        curr_state.add(record('api', 8, 'ex.com'))
+        curr_state.add(record('mail', 9, 'other.com'))
+    curr_state.save()
+
+    curr_state = open_state()
+
+    assert len(curr_state) == 6
+    assert identifiers(curr_state) == ['dom', 'other', 'web', 'www', 'api', 'mail']
+    assert identifiers(curr_state.of_type('DO_DNS_RECORD')) == ['www', 'api', 'mail']
+    assert identifiers(curr_state.records_for_domain('ex.com')) == ['www', 'api']
+    assert curr_state.records_for_domain('missing.com') == []
+    assert curr_state.get('DO_DOMAIN', 'other.com').identifier == 'other'
+    assert curr_state.get('DO_DROPLET', 2) == None
+    assert curr_state.find('web')[0].depends_on == ['dom']
+    assert 'ex.com' in curr_state.remote_ids('DO_DOMAIN')
+
+
+def test_backends_keep_the_order_of_verified_entries(open_state, monkeypatch):
+    monkeypatch.setitem(state.config, 'trust_for', 60)
+
+    curr_state = open_state()
+    curr_state.add(droplet('a', 1))
+    curr_state.add(droplet('b', 2))
+    curr_state.add(droplet('c', 3))
+
+    action = {'resource': 'DO_DROPLET', 'identifier': 'a', 'properties': {'name': 'a'}}
+    curr_state.verified(action)
+    curr_state.save()
+
+    curr_state = open_state()
+    assert identifiers(curr_state) == ['a', 'b', 'c']
+    assert curr_state.applied(action)
+    assert curr_state.trusted(action)
+
+
+def test_backends_swap_and_remove_alike(open_state):
+    curr_state = open_state()
+    curr_state.add(droplet('a', 1))
+    curr_state.add(droplet('b', 2))
+    curr_state.add(record('www', 7, 'ex.com'))
+
+    curr_state.swap(droplet('a', 3))
+    curr_state.remove(curr_state.get('DO_DNS_RECORD', 7))
+    curr_state.save()
+
+    curr_state = open_state()
+    assert identifiers(curr_state) == ['b', 'a']
+    assert curr_state.get('DO_DROPLET', 1) == None
+    assert curr_state.get('DO_DROPLET', 3).identifier == 'a'
+    assert curr_state.records_for_domain('ex.com') == []
+
+
+def test_sqlite_backend_stores_registered_resource_types(workdir, monkeypatch):
+    from apis import registry
+    from apis import sqlite_state
+
+    monkeypatch.setattr(registry, 'PROVIDERS', dict(registry.PROVIDERS, DO_VOLUME='apis.droplets'))
+    monkeypatch.setattr(registry, '_loaded', {})
+    backend = sqlite_state.SQLiteBackend.open(state.STATE_DB)
+
+    backend.put(state.StateEntry('volume', 'DO_VOLUME', {'id': 'vol-1'}))
+
+    assert identifiers(backend.of_type('DO_VOLUME')) == ['volume']
+    assert len(backend) == 1
+    backend.conn.close()
+
+
+def test_sqlite_backend_migrates_the_state_file(workdir, monkeypatch):
+    from apis import sqlite_state
+
+    backend = state.FileBackend.load()
+    backend.put(droplet('d1', 1))
+    backend.save()
+    backend.put(record('www', 7, 'ex.com'))
+
+    migrated = sqlite_state.SQLiteBackend.open(state.STATE_DB)
+
+    assert identifiers(migrated) == ['d1', 'www']
+    assert identifiers(migrated.records_for_domain('ex.com')) == ['www']
+    assert not os.path.exists(state.STATE_FILE)
+    assert not os.path.exists(state.JOURNAL_FILE)
+    migrated.conn.close()